@@ -1,19 +1,20 @@
 import ast
-import copy
-import re
-from collections import Counter
 from collections import defaultdict
+from itertools import chain
+from multiprocessing import Pool, get_start_method
 
-import codegen as cg
 import numpy as np
 import scipy.sparse as sp
 from sklearn.base import BaseEstimator
 from sklearn.feature_extraction.text import TfidfTransformer
 from sklearn.preprocessing import normalize
 
-from ast_tree.traverse import bfs, children
-from ast_tree.tree_nodes import AstNodes, PythonKeywords
+from ast_tree.traverse import bfs, children, TreeWalk
+from ast_tree.tree_nodes import AstNodes, PythonKeywords, Node
+from ast_tree.flat_tree import FlatTree, node_type_name
 from utils.dataset_utils import ast_parse_file
+from utils.job_utils import n_processes
+from utils.tree_dataset import TreeDataset
 
 
 def ast_name(node):
@@ -30,6 +31,85 @@ def ast_paths(here, path_to_here=()):
     if len(list(children(here))) == 0:
         yield path_to_here
 
+# keywords written in the source of every node of a type, by upper case type name: the vocabularies
+# fold ExceptHandler/excepthandler, BoolOp/boolop ... into one name, see node_type_name
+TYPE_KEYWORDS = {"FUNCTIONDEF": ("def",), "ASYNCFUNCTIONDEF": ("def",), "CLASSDEF": ("class",),
+                 "RETURN": ("return",), "DELETE": ("del",), "GLOBAL": ("global",), "PASS": ("pass",),
+                 "BREAK": ("break",), "CONTINUE": ("continue",), "FOR": ("for", "in"),
+                 "ASYNCFOR": ("for", "in"), "WHILE": ("while",), "WITH": ("with",), "ASYNCWITH": ("with",),
+                 "RAISE": ("raise",), "TRY": ("try",),
+                 "EXCEPTHANDLER": ("except",), "ASSERT": ("assert",), "IMPORT": ("import",),
+                 "IMPORTFROM": ("from", "import"), "LAMBDA": ("lambda",), "YIELD": ("yield",),
+                 "YIELDFROM": ("yield", "from"), "IFEXP": ("if", "else"), "COMPREHENSION": ("for", "in"),
+                 "AND": ("and",), "OR": ("or",), "NOT": ("not",), "IN": ("in",), "NOTIN": ("not", "in"),
+                 "IS": ("is",), "ISNOT": ("is", "not"), "PRINT": ("print",), "EXEC": ("exec",)}
+
+# fields holding identifiers, which count when they are names such as print, exec or None
+IDENTIFIER_FIELDS = ("id", "attr", "name", "arg", "asname", "module")
+
+# rows kept by ASTVectorizer.count, when more would be kept all are dropped and counting starts over
+COUNT_CACHE_SIZE = 100000
+# trees of a TreeDataset loaded at a time by ASTVectorizer.count
+COUNT_BATCH_SIZE = 1024
+
+
+def node_keywords(node, name, elif_nodes):
+    '''keywords written for one node; If nodes written as elif (the only statement of an else branch,
+    at the column of their if, or anywhere in trees without positions) are added to elif_nodes'''
+    keywords = list(TYPE_KEYWORDS.get(name, ()))
+    if name == "IF":
+        keywords.append("elif" if id(node) in elif_nodes else "if")
+        orelse = getattr(node, "orelse", None)
+        if orelse:
+            if len(orelse) == 1 and node_type_name(orelse[0]) == "IF":
+                # an elif starts at the column of its if, "else: if" is indented further
+                if getattr(orelse[0], "col_offset", None) == getattr(node, "col_offset", None):
+                    elif_nodes.add(id(orelse[0]))
+                else:
+                    keywords.append("else")
+            else:
+                keywords.append("else")
+    elif name in ("FOR", "ASYNCFOR", "WHILE", "TRY"):
+        if getattr(node, "orelse", None):
+            keywords.append("else")
+        if getattr(node, "finalbody", None):
+            keywords.append("finally")
+    elif name == "WITHITEM":
+        if getattr(node, "optional_vars", None) is not None:
+            keywords.append("as")
+    elif name == "EXCEPTHANDLER":
+        if getattr(node, "name", None):
+            keywords.append("as")
+    elif name == "ALIAS":
+        if getattr(node, "asname", None):
+            keywords.append("as")
+    elif name == "RAISE":
+        if getattr(node, "cause", None) is not None:
+            keywords.append("from")
+    elif name == "COMPREHENSION":
+        keywords.extend(["if"] * len(getattr(node, "ifs", ())))
+    elif name == "MATCH_CASE":
+        if getattr(node, "guard", None) is not None:
+            keywords.append("if")
+    elif name == "BOOLOP":
+        # the And/Or node counts once, a BoolOp of n values is written with n-1 operators; its
+        # children are the operator and the values in every kind of tree
+        kids = children(node)
+        if len(kids) > 2:
+            keywords.extend([node_type_name(kids[0]).lower()] * (len(kids) - 3))
+    elif name in ("CONSTANT", "NAMECONSTANT", "MATCHSINGLETON"):
+        if getattr(node, "value", 0) is None:
+            keywords.append("None")
+    if isinstance(node, ast.AST):
+        for field in IDENTIFIER_FIELDS:
+            value = getattr(node, field, None)
+            if isinstance(value, str):
+                keywords.extend(value.split("."))
+        if name == "GLOBAL":
+            keywords.extend(getattr(node, "names", ()))
+    return keywords
+
+
 class TreeFeatures:
     def __init__(self,nodes):
         self.astnodes = nodes
@@ -105,23 +185,141 @@ class TreeFeatures:
         return out[0]
 
     def tf_keywords(self, ast_tree):
-        def nuke_all_strings(mod):
-            if isinstance(mod, ast.Str):
-                mod.s = ''
-            for child in children(mod):
-                nuke_all_strings(child)
-
-        ast_tree1 = copy.deepcopy(ast_tree)
-        nuke_all_strings(ast_tree1)
-        codestr = cg.to_source(ast_tree1)
-        ws = re.compile(("\_*[a-zA-Z]+[a-zA-Z0-9\_]*"))
+        """Counts of the python keywords the source of the tree is written with (the keywords of
+        PythonKeywords: statements, operators, None, print/exec names), derived from the node types
+        and their fields in one walk. String contents and comments are not counted. Trees without
+        python nodes (C++) have no keywords."""
         out = defaultdict(int)
-        for x in ws.findall(codestr):
-            idx = self.keywords.try_index(x)
-            if idx != -1:
-                out[idx] += 1
+        if isinstance(ast_tree, Node) or (isinstance(ast_tree, FlatTree) and not isinstance(ast_tree.nodes, AstNodes)):
+            return out
+        elif_nodes = set()
+        for node in TreeWalk(ast_tree).nodes:
+            name = node_type_name(node)
+            for keyword in node_keywords(node, name, elif_nodes):
+                idx = self.keywords.try_index(keyword)
+                if idx != -1:
+                    out[idx] += 1
         return out
 
+    def features(self, ast_tree, ngram=2, v_skip=0):
+        """All the per tree features used by ASTVectorizer in one pass over the tree: skip-gram counts
+        summed over the skips 0..v_skip, node type and leaf counts, their average depths and the max
+        depth. Every dict is equal to the one of the matching tf_*/avg_* method. FlatTrees are counted
+        with numpy straight from their type and parent arrays."""
+        if isinstance(ast_tree, FlatTree):
+            return self._flat_features(ast_tree, ngram, v_skip)
+        walk = TreeWalk(ast_tree)
+        index = self.astnodes.index
+        size = self.astnodes.size()
+        ngrams = defaultdict(int)
+        node_types = defaultdict(int)
+        node_leaves = defaultdict(int)
+        types_depth = defaultdict(int)
+        leaves_depth = defaultdict(int)
+        max_depth = 0
+        # type ids of the nodes from the root down to the current one
+        path = []
+        grams = self._gram_shapes(ngram, v_skip)
+        for node, depth, node_kids in zip(walk.nodes, walk.depths, walk.kids):
+            t = index(node)
+            del path[depth:]
+            path.append(t)
+            n_kids = len(node_kids)
+            if n_kids > 0:
+                node_types[t] += 1
+                types_depth[t] += depth
+            else:
+                node_leaves[t] += 1
+                leaves_depth[t] += depth
+            if depth > max_depth:
+                max_depth = depth
+            for m, step, last in grams:
+                if m > depth + 1:
+                    break
+                weight = (1 if m > 1 else 0) + (n_kids if last else 0)
+                if weight == 0:
+                    continue
+                key = 0
+                for g in path[depth - m + 1::step]:
+                    key = key * size + g
+                ngrams[key] += weight
+        return {"ngrams": ngrams,
+                "node_types": node_types,
+                "node_leaves": node_leaves,
+                "avg_node_types": {k: types_depth[k] / v for k, v in node_types.items()},
+                "avg_node_leaves": {k: leaves_depth[k] / v for k, v in node_leaves.items()},
+                "max_depth": max_depth}
+
+    def _gram_shapes(self, ngram, v_skip):
+        '''(path length, step, is longest path) of every counted skip-gram shape, sorted by length.
+
+        tf_skip_grams_node_fast counts every downward path of m nodes, 1 < m <= ngram+skip, whose
+        every (skip+1)-th node gives ngram nodes, and counts the paths of ngram+skip nodes once more
+        for every child of their last node.'''
+        shapes = []
+        for skip in range(v_skip + 1):
+            longest = ngram + skip
+            for m in range(1, longest + 1):
+                if (m + skip) // (skip + 1) == ngram:
+                    shapes.append((m, skip + 1, m == longest))
+        return sorted(shapes)
+
+    def _flat_features(self, tree, ngram, v_skip):
+        types, parents, depths = tree.arrays()
+        types = types.astype(np.int64)
+        parents = parents.astype(np.int64)
+        size = tree.nodes.size()
+        n = len(types)
+        n_kids = np.bincount(parents[1:], minlength=n)
+        inner = n_kids > 0
+
+        def counts(mask):
+            c = np.bincount(types[mask])
+            nz = np.nonzero(c)[0]
+            return dict(zip(nz.tolist(), c[nz].tolist()))
+
+        def avgs(mask):
+            c = np.bincount(types[mask])
+            d = np.bincount(types[mask], weights=depths[mask])
+            nz = np.nonzero(c)[0]
+            return dict(zip(nz.tolist(), (d[nz] / c[nz]).tolist()))
+
+        # ancestors[k][v] is the k-th ancestor of v, -1 above the root
+        grams = self._gram_shapes(ngram, v_skip)
+        max_len = max([m for m, _, _ in grams] + [1])
+        ancestors = [np.arange(n)]
+        for k in range(1, max_len):
+            prev = ancestors[-1]
+            anc = np.full(n, -1, dtype=np.int64)
+            ok = prev >= 0
+            anc[ok] = parents[prev[ok]]
+            ancestors.append(anc)
+        key_dtype = np.int64 if size ** ngram < 2 ** 63 else object
+        keys = []
+        weights = []
+        for m, step, last in grams:
+            weight = (1 if m > 1 else 0) + (n_kids if last else 0)
+            weight = np.broadcast_to(weight, (n,))
+            valid = (ancestors[m - 1] >= 0) & (weight > 0)
+            key = np.zeros(int(valid.sum()), dtype=key_dtype)
+            for j in range(0, m, step):
+                key = key * size + types[ancestors[m - 1 - j][valid]].astype(key_dtype)
+            keys.append(key)
+            weights.append(weight[valid])
+        ngrams = {}
+        if len(keys) > 0:
+            keys = np.concatenate(keys)
+            weights = np.concatenate(weights)
+            unique, inverse = np.unique(keys, return_inverse=True)
+            totals = np.bincount(inverse, weights=weights).astype(np.int64)
+            ngrams = dict(zip(unique.tolist(), totals.tolist()))
+        return {"ngrams": ngrams,
+                "node_types": counts(inner),
+                "node_leaves": counts(~inner),
+                "avg_node_types": avgs(inner),
+                "avg_node_leaves": avgs(~inner),
+                "max_depth": int(depths.max())}
+
     def tf_node_types(self, ast_tree):
         out = defaultdict(int)
 
@@ -169,8 +367,73 @@ class TreeFeatures:
         return out_avg
 
 
+# trees counted by ASTVectorizer._count_parallel, forked workers read their shards from here so the
+# trees are not pickled (deep trees can't be)
+_shard_trees = None
+
+
+def _count_shard(args):
+    vectorizer, shard = args
+    if isinstance(shard, slice):
+        shard = _shard_trees[shard]
+    return vectorizer._count(shard)
+
+
+def index_dtype(size):
+    return np.int32 if size < 2 ** 31 else np.int64
+
+
+def hstack_csr(blocks, dtype):
+    '''column concatenation of csr blocks with the same rows, written straight into the arrays of a
+    single csr matrix of the given dtype'''
+    n_rows = blocks[0].shape[0]
+    width = sum(block.shape[1] for block in blocks)
+    lengths = [np.diff(block.indptr) for block in blocks]
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.sum(lengths, axis=0) if len(blocks) > 0 else 0, out=indptr[1:])
+    nnz = int(indptr[-1])
+    indices = np.empty(nnz, dtype=index_dtype(max(width, nnz)))
+    data = np.empty(nnz, dtype=dtype)
+    # start of the next free slot of every row
+    starts = indptr[:-1].copy()
+    column = 0
+    for block, block_lengths in zip(blocks, lengths):
+        rows = np.repeat(np.arange(n_rows), block_lengths)
+        dest = starts[rows] + (np.arange(block.nnz) - block.indptr[rows])
+        indices[dest] = block.indices + column
+        data[dest] = block.data
+        starts += block_lengths
+        column += block.shape[1]
+    return sp.csr_matrix((data, indices, indptr.astype(indices.dtype)), shape=(n_rows, width), copy=False)
+
+
+def hash_grams(keys, n_features):
+    '''columns of n-gram keys (ints of any size) in a hashed space of n_features columns'''
+    # hash() of an int is deterministic (its value mod 2**61-1), the splitmix64 finalizer spreads
+    # the bits of the base size encoding over the whole word
+    z = np.fromiter((hash(key) for key in keys), dtype=np.int64, count=len(keys)).view(np.uint64)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    z = z ^ (z >> np.uint64(31))
+    return (z % np.uint64(n_features)).astype(np.int64)
+
+
 class ASTVectorizer(BaseEstimator):
-    def __init__(self,node_types, ngram=2,v_skip=0, normalize=True, idf=False, norm="l2", binary=False, dtype=np.float32):
+    """Vectorizes trees into per tree feature blocks.
+
+    The raw blocks of a tree (see count) only depend on the tree, so they are counted once and kept
+    by the vectorizer: fitting and transforming the folds of one corpus again only slices rows out
+    of the counted matrices and fits the TF-IDF weights on them. With n_jobs > 1 (or -1 for all
+    cores) the trees are counted by a process pool in contiguous shards whose blocks are stacked in
+    order, which gives the same matrices as counting them in one process.
+
+    ngram_space sets the columns of the n-gram block: "full" has one column per possible n-gram
+    (size ** ngram columns), "vocabulary" learns the n-grams in fit and keeps those found in
+    min_df..max_df trees (ints are tree counts, floats fractions of the trees), at most the
+    max_features most frequent ones, and "hashing" hashes the n-grams into n_features columns
+    without fitting anything."""
+    def __init__(self,node_types, ngram=2,v_skip=0, normalize=True, idf=False, norm="l2", binary=False, dtype=np.float32, n_jobs=1,
+                 ngram_space="full", min_df=1, max_df=1.0, max_features=None, n_features=2 ** 20):
         self.ngram = ngram
         self.v_skip = v_skip
         self.idf = idf
@@ -179,10 +442,89 @@ class ASTVectorizer(BaseEstimator):
         self.tree_features = TreeFeatures(node_types)
         self.dtype = dtype
         self.binary = binary
+        self.n_jobs = n_jobs
+        self.ngram_space = ngram_space
+        self.min_df = min_df
+        self.max_df = max_df
+        self.max_features = max_features
+        self.n_features = n_features
+
+    def __getstate__(self):
+        # the counted rows are a cache of the corpus, they are neither saved with the model nor
+        # sent to the worker processes; copied as the parent's state may be __dict__ itself
+        state = dict(super(ASTVectorizer, self).__getstate__())
+        for name in ("_count_key", "_count_rows", "_counts", "_gram_ids", "_gram_keys"):
+            state.pop(name, None)
+        return state
 
     def fit(self, X, y=None, verbose=False):
-        self.features_categories = []
+        self._fit_blocks(self._fit(X, y))
+        return self  # sp.hstack(X_list, dtype=self.dtype)
+
+    def fit_transform(self, X, y=None):
         X_list = self._fit(X, y)
+        self._fit_blocks(X_list)
+        return self._stack(X_list)
+
+    def transform(self, X, copy=True):
+        return self._stack(self._blocks(self.count(X)))
+
+    def _fit(self, X, y):
+        counts = self.count(X)
+        if self.ngram_space == "vocabulary":
+            self._fit_vocabulary(counts[0])
+        return self._blocks(counts)
+
+    def _fit_vocabulary(self, ngrams):
+        '''vocabulary_ maps the kept n-gram keys to their columns, in increasing key order'''
+        n_trees = ngrams.shape[0]
+        min_df = self.min_df if isinstance(self.min_df, (int, np.integer)) else self.min_df * n_trees
+        max_df = self.max_df if isinstance(self.max_df, (int, np.integer)) else self.max_df * n_trees
+        df = np.bincount(ngrams.indices, minlength=ngrams.shape[1])
+        columns = np.nonzero((df >= min_df) & (df <= max_df))[0]
+        keys = [self._gram_keys[column] for column in columns]
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        columns = columns[order]
+        if self.max_features is not None and len(columns) > self.max_features:
+            frequency = np.asarray(ngrams.sum(axis=0)).ravel()[columns]
+            keep = np.sort(np.argsort(-frequency, kind="mergesort")[:self.max_features])
+            columns = columns[keep]
+        if len(columns) == 0:
+            raise ValueError("empty n-gram vocabulary, no n-gram is found in min_df..max_df trees")
+        self.vocabulary_ = {self._gram_keys[column]: idx for idx, column in enumerate(columns)}
+
+    def _ngram_columns(self, ngrams):
+        '''n-gram block of the learned vocabulary, from the counted columns'''
+        lookup = np.full(ngrams.shape[1], -1, dtype=np.int64)
+        gram_ids = self._gram_ids
+        for key, column in self.vocabulary_.items():
+            gram_id = gram_ids.get(key)
+            if gram_id is not None:
+                lookup[gram_id] = column
+        columns = lookup[ngrams.indices]
+        keep = columns >= 0
+        rows = np.repeat(np.arange(ngrams.shape[0]), np.diff(ngrams.indptr))
+        indptr = np.zeros(ngrams.shape[0] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows[keep], minlength=ngrams.shape[0]), out=indptr[1:])
+        width = len(self.vocabulary_)
+        indices = columns[keep].astype(index_dtype(max(width, len(columns))))
+        return sp.csr_matrix((ngrams.data[keep], indices, indptr.astype(indices.dtype)),
+                             shape=(ngrams.shape[0], width), copy=False)
+
+    def _blocks(self, counts):
+        X_list = []
+        for idx, block in enumerate(counts):
+            if idx == 0 and self.ngram_space == "vocabulary":
+                block = self._ngram_columns(block)
+            elif self.binary:
+                block = block.copy()
+            if self.binary:
+                block.data[:] = 1
+            X_list.append(self._normalize(block))
+        return X_list
+
+    def _fit_blocks(self, X_list):
+        self.features_categories = []
         # Extract TFIDF
         if self.idf:
             smooth_idf = True
@@ -209,21 +551,113 @@ class ASTVectorizer(BaseEstimator):
         self.features_categories.extend(["idf_node_leaves" for s in range(X_list[2].shape[1])])
         # self.features_categories.extend(["idf_ngrams_node2" for s in range(X_list[5].shape[1])])
 
-        return self  # sp.hstack(X_list, dtype=self.dtype)
-
-    def transform(self, X, copy=True):
-        X_list = self._fit(X, None)
+    def _stack(self, X_list):
         # Extract TFIDF
         if self.idf:
-            X_list.extend([self.idf_ngrams_node.transform(X_list[0]),
-                           self.idf_node_types.transform(X_list[1]),
-                           self.idf_node_leaves.transform(X_list[2])])
-                           # self.idf_ngrams_node2.transform(X_list[5])])
-
-        return sp.csr_matrix(sp.hstack(X_list, dtype=self.dtype))
-
-    def _fit(self, X, y):
-        max_node_depth = []
+            X_list = X_list + [self.idf_ngrams_node.transform(X_list[0]),
+                               self.idf_node_types.transform(X_list[1]),
+                               self.idf_node_leaves.transform(X_list[2])]
+                               # self.idf_ngrams_node2.transform(X_list[5])])
+
+        return hstack_csr(X_list, self.dtype)
+
+    def count(self, X):
+        """Raw blocks of the trees X as csr matrices: n-gram, node type, leaf and keyword counts and
+        the average depths of the node types and leaves. Trees counted before by this vectorizer are
+        not walked again, their rows are taken from the kept matrices. The trees of a TreeDataset are
+        known by their loader and index in the dataset (a reloaded tree is a new object) and are
+        loaded and counted COUNT_BATCH_SIZE at a time, other trees are known by identity and are kept
+        alive with their rows. At most COUNT_CACHE_SIZE rows are kept."""
+        key = (self.ngram, self.v_skip, self.dtype, self.ngram_space,
+               self.n_features if self.ngram_space == "hashing" else None)
+        if getattr(self, "_count_key", None) != key:
+            self._reset_counts(key)
+        rows = self._count_rows
+        if isinstance(X, TreeDataset):
+            row_keys = [(X.loader, int(index)) for index in X.indices]
+        else:
+            row_keys = list(X)
+        # position in X of the first occurrence of every tree without a row
+        missing = {}
+        for pos, row_key in enumerate(row_keys):
+            if row_key not in rows and row_key not in missing:
+                missing[row_key] = pos
+        if len(rows) > 0 and len(rows) + len(missing) > COUNT_CACHE_SIZE:
+            self._reset_counts(key)
+            return self.count(X)
+        if len(missing) > 0:
+            for row_key in missing:
+                rows[row_key] = len(rows)
+            batches = [] if self._counts is None else [self._counts]
+            if isinstance(X, TreeDataset):
+                positions = list(missing.values())
+                for start in range(0, len(positions), COUNT_BATCH_SIZE):
+                    batches.append(self._count_parallel([X[pos] for pos in positions[start:start + COUNT_BATCH_SIZE]]))
+            else:
+                batches.append(self._count_parallel(list(missing)))
+            # the vocabulary mode n-gram block gets wider as new n-grams are counted
+            self._counts = [sp.vstack([self._widen(block, blocks[-1].shape[1]) for block in blocks], format="csr")
+                            for blocks in zip(*batches)]
+        indices = np.array([rows[row_key] for row_key in row_keys], dtype=np.int64)
+        return [block[indices] for block in self._counts]
+
+    def _reset_counts(self, key):
+        self._count_key = key
+        self._count_rows = {}
+        self._counts = None
+        # columns of the counted n-gram block in vocabulary mode, in order of first appearance
+        self._gram_ids = {}
+        self._gram_keys = []
+
+    def _count_parallel(self, X, shards_per_job=4):
+        n_jobs = n_processes(self.n_jobs)
+        if n_jobs == 1 or len(X) < 2:
+            return self._register_grams(*self._count(X))
+        # a few shards per process so one slow shard does not keep the others waiting
+        n_shards = min(n_jobs * shards_per_job, len(X))
+        bounds = np.linspace(0, len(X), n_shards + 1).astype(int)
+        global _shard_trees
+        fork = get_start_method() == "fork"
+        shards = [(self, slice(bounds[i], bounds[i + 1]) if fork else X[bounds[i]:bounds[i + 1]])
+                  for i in range(n_shards)]
+        _shard_trees = X if fork else None
+        try:
+            with Pool(min(n_jobs, n_shards)) as pool:
+                results = pool.map(_count_shard, shards)
+        except RecursionError:
+            # without fork the shards are pickled, which fails for deep trees
+            return self._register_grams(*self._count(X))
+        finally:
+            _shard_trees = None
+        blocks = [self._register_grams(shard_blocks, gram_keys) for shard_blocks, gram_keys in results]
+        width = blocks[-1][0].shape[1]
+        return [sp.vstack([self._widen(block, width) if idx == 0 else block for block in shard_blocks], format="csr")
+                for idx, shard_blocks in enumerate(zip(*blocks))]
+
+    def _register_grams(self, blocks, gram_keys):
+        '''moves the n-gram block of a shard counted in vocabulary mode from its own columns (gram_keys)
+        to the columns of this vectorizer'''
+        if gram_keys is None:
+            return blocks
+        gram_ids = self._gram_ids
+        lookup = np.empty(len(gram_keys), dtype=np.int64)
+        for idx, key in enumerate(gram_keys):
+            gram_id = gram_ids.get(key)
+            if gram_id is None:
+                gram_id = gram_ids[key] = len(self._gram_keys)
+                self._gram_keys.append(key)
+            lookup[idx] = gram_id
+        ngrams = blocks[0]
+        ngrams = sp.csr_matrix((ngrams.data, lookup[ngrams.indices], ngrams.indptr),
+                               shape=(ngrams.shape[0], len(self._gram_keys)))
+        return [ngrams] + blocks[1:]
+
+    def _widen(self, block, width):
+        if block.shape[1] == width:
+            return block
+        return sp.csr_matrix((block.data, block.indices, block.indptr), shape=(block.shape[0], width))
+
+    def _count(self, X):
         tf_ngrams_node = []
         tf_node_types = []
         tf_node_leaves = []
@@ -234,67 +668,78 @@ class ASTVectorizer(BaseEstimator):
         for ast_tree in X:
             try:
                 # ast_tree = ast_parse_file(x)
+                features = self.tree_features.features(ast_tree, ngram=self.ngram, v_skip=self.v_skip)
                 # Extract N-grams
-                tf_ngrams_node_local = Counter(defaultdict(int))
-                for i in range(self.v_skip+1):
-                    tf_ngrams_node_local += Counter(self.tree_features.tf_skip_grams_node_fast(ast_tree, ngram=self.ngram,v_skip=i))
-                tf_ngrams_node.append(tf_ngrams_node_local)
+                tf_ngrams_node.append(features["ngrams"])
 
                 # Extract TF
-                tf_node_types.append(self.tree_features.tf_node_types(ast_tree))
-                tf_node_leaves.append(self.tree_features.tf_node_leaves(ast_tree))
+                tf_node_types.append(features["node_types"])
+                tf_node_leaves.append(features["node_leaves"])
                 tf_node_keywords.append(self.tree_features.tf_keywords(ast_tree))
 
                 # Extract AVG Depth
-                avg_node_types_depth.append(self.tree_features.avg_node_types(ast_tree))
-                avg_node_leaves_depth.append(self.tree_features.avg_node_leaves(ast_tree))
-
-                # Extract Max depth
-                max_node_depth.append([self.tree_features.max_depth(ast_tree)])
+                avg_node_types_depth.append(features["avg_node_types"])
+                avg_node_leaves_depth.append(features["avg_node_leaves"])
             except Exception as e:
                 print("ERROR: ERROR", e)
-                print("ERROR: filename", x)
+                print("ERROR: tree", ast_tree)
                 raise
 
         # transform features into sparse representation
-        tf_ngrams_node_sp = self._normalize(
-            self._to_sparse(tf_ngrams_node, self.tree_features.astnodes.size() ** self.ngram))
-        tf_node_types_sp = self._normalize(self._to_sparse(tf_node_types, self.tree_features.astnodes.size()))
-        tf_node_leaves_sp = self._normalize(self._to_sparse(tf_node_leaves, self.tree_features.astnodes.size()))
-        tf_node_keywords_sp = self._normalize(self._to_sparse(tf_node_keywords, self.tree_features.keywords.size()))
-        avg_node_types_depth_sp = self._normalize(
-            self._to_sparse(avg_node_types_depth, self.tree_features.astnodes.size()))
-        avg_node_leaves_depth_sp = self._normalize(
-            self._to_sparse(avg_node_leaves_depth, self.tree_features.astnodes.size()))
-        max_node_depth_sp = self._normalize(sp.csr_matrix(max_node_depth, dtype=self.dtype))
+        tf_ngrams_node_sp, gram_keys = self._ngrams_sparse(tf_ngrams_node)
+        tf_node_types_sp = self._to_sparse(tf_node_types, self.tree_features.astnodes.size())
+        tf_node_leaves_sp = self._to_sparse(tf_node_leaves, self.tree_features.astnodes.size())
+        tf_node_keywords_sp = self._to_sparse(tf_node_keywords, self.tree_features.keywords.size())
+        avg_node_types_depth_sp = self._to_sparse(avg_node_types_depth, self.tree_features.astnodes.size())
+        avg_node_leaves_depth_sp = self._to_sparse(avg_node_leaves_depth, self.tree_features.astnodes.size())
 
         X_list = [tf_ngrams_node_sp,
                   tf_node_types_sp,
                   tf_node_leaves_sp,
-                  # max_node_depth_sp,
                   tf_node_keywords_sp,
                   avg_node_types_depth_sp,
                   avg_node_leaves_depth_sp]
                   # tf_ngrams_node2_sp]
 
-        return X_list
+        return X_list, gram_keys
+
+    def _ngrams_sparse(self, X):
+        '''n-gram block of the counted trees and, in vocabulary mode, the n-gram keys of its columns'''
+        if self.ngram_space == "full":
+            width = self.tree_features.astnodes.size() ** self.ngram
+            if width >= 2 ** 63:
+                raise ValueError("%s ** %s n-gram columns do not fit in int64 indices, use the vocabulary or hashing"
+                                 " ngram_space" % (self.tree_features.astnodes.size(), self.ngram))
+            return self._to_sparse(X, width), None
+        if self.ngram_space == "hashing":
+            keys = [key for x in X for key in x.keys()]
+            columns = hash_grams(keys, self.n_features)
+            rows = np.repeat(np.arange(len(X)), [len(x) for x in X])
+            data = np.fromiter((value for x in X for value in x.values()), dtype=self.dtype, count=len(keys))
+            # colliding n-grams of a tree are summed
+            return sp.csr_matrix((data, (rows, columns)), shape=(len(X), self.n_features), dtype=self.dtype), None
+        if self.ngram_space == "vocabulary":
+            gram_ids = {}
+            local = []
+            for x in X:
+                local.append({gram_ids.setdefault(key, len(gram_ids)): value for key, value in x.items()})
+            return self._to_sparse(local, len(gram_ids)), list(gram_ids)
+        raise ValueError("unknown ngram_space " + str(self.ngram_space))
 
     def _to_sparse(self, X, features_size):
-        indice_c = []
-        indice_r = []
-        data = []
-        for idx, x in enumerate(X):
-            indice_c.extend(list(x.keys()))
-            indice_r.extend(idx * np.ones(len(x)))
-            if self.binary:
-                data.extend(np.ones(len(x)))
-            else:
-                data.extend(list(x.values()))
-        return sp.csr_matrix((data, (indice_r, indice_c)), shape=(len(X), features_size), dtype=self.dtype)
+        '''csr matrix of one {column: value} dict per row, filled in place in row order'''
+        indptr = np.zeros(len(X) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter((len(x) for x in X), dtype=np.int64, count=len(X)), out=indptr[1:])
+        nnz = int(indptr[-1])
+        dtype = index_dtype(max(features_size, nnz))
+        indices = np.fromiter(chain.from_iterable(x.keys() for x in X), dtype=dtype, count=nnz)
+        data = np.fromiter(chain.from_iterable(x.values() for x in X), dtype=self.dtype, count=nnz)
+        return sp.csr_matrix((data, indices, indptr.astype(dtype)), shape=(len(X), features_size), copy=False)
 
     def _normalize(self, X):
         if self.normalize:
-            X_out = normalize(X.astype(np.float64), norm=self.norm)
+            # the blocks are fresh matrices, normalized in place in their own dtype
+            X_out = normalize(X, norm=self.norm, copy=False)
             # np.log(X_out.data,X_out.data)
             return X_out
         else:
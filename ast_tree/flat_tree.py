@@ -0,0 +1,129 @@
+from array import array
+
+import numpy as np
+
+from ast_tree.traverse import children
+from ast_tree.tree_nodes import Node
+
+
+def flatten_tree(tree):
+    '''pre-order flattening of a tree into (nodes, parents) lists, the root has parent -1'''
+    nodes = []
+    parents = []
+    stack = [(tree, -1)]
+    while stack:
+        node, parent = stack.pop()
+        idx = len(nodes)
+        nodes.append(node)
+        parents.append(parent)
+        stack.extend((child, idx) for child in reversed(list(children(node))))
+    return nodes, parents
+
+
+def node_type_name(node):
+    '''type name of an ast node, a Node or a FlatNode, always upper case as the keys of the vocabularies
+    (so ExceptHandler and the lower case excepthandler of parse_ast_tree share one name)'''
+    if isinstance(node, (Node, FlatNode)):
+        return node.type.upper()
+    return type(node).__name__.upper()
+
+
+class FlatNode:
+    '''light weight handle on node index of a FlatTree, created on demand'''
+    __slots__ = ("tree", "index")
+    _fields = ('children',)
+
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
+
+    @property
+    def children(self):
+        tree = self.tree
+        next_sibling = tree.next_sibling
+        out = []
+        child = tree.first_child[self.index]
+        while child != -1:
+            out.append(FlatNode(tree, child))
+            child = next_sibling[child]
+        return out
+
+    @property
+    def type_id(self):
+        return self.tree.types[self.index]
+
+    @property
+    def type(self):
+        return self.tree.nodes.get(self.tree.types[self.index])
+
+    @property
+    def depth(self):
+        return self.tree.depths[self.index]
+
+    @property
+    def parent(self):
+        parent = self.tree.parents[self.index]
+        return FlatNode(self.tree, parent) if parent != -1 else None
+
+
+class FlatTree(FlatNode):
+    '''Array backed tree in pre-order.
+
+    Every node is a position in the type-id, parent, first-child, next-sibling and depth arrays; type
+    ids are indices of the nodes dictionary (AstNodes or DotNodes) the tree was built with. The tree
+    object itself is the root node, children() yields FlatNode handles so bfs/dfs, TreeFeatures and
+    the recursive models work on it as on any other tree.'''
+    __slots__ = ("types", "parents", "first_child", "next_sibling", "depths", "nodes")
+
+    def __init__(self, types, parents, nodes):
+        super(FlatTree, self).__init__(self, 0)
+        self.nodes = nodes
+        self.types = array('h', np.asarray(types, dtype=np.int16).tobytes())
+        self.parents = array('i', np.asarray(parents, dtype=np.int32).tobytes())
+        size = len(self.types)
+        first_child = array('i', [-1]) * size
+        next_sibling = array('i', [-1]) * size
+        depths = array('i', [0]) * size
+        parents = self.parents
+        for idx in range(size - 1, 0, -1):
+            parent = parents[idx]
+            next_sibling[idx] = first_child[parent]
+            first_child[parent] = idx
+        for idx in range(1, size):
+            depths[idx] = depths[parents[idx]] + 1
+        self.first_child = first_child
+        self.next_sibling = next_sibling
+        self.depths = depths
+
+    @classmethod
+    def from_tree(cls, tree, nodes):
+        tree_nodes, parents = flatten_tree(tree)
+        return cls([nodes.index(node) for node in tree_nodes], parents, nodes)
+
+    def size(self):
+        return len(self.types)
+
+    def node(self, index):
+        return FlatNode(self, index)
+
+    def arrays(self):
+        '''zero-copy numpy views of the types, parents and depths arrays'''
+        return (np.frombuffer(self.types, dtype=np.int16),
+                np.frombuffer(self.parents, dtype=np.int32),
+                np.frombuffer(self.depths, dtype=np.int32))
+
+    def subtree_end(self, index):
+        '''end (exclusive) of the pre-order range of the subtree rooted at index'''
+        end = index + 1
+        depth = self.depths[index]
+        while end < len(self.types) and self.depths[end] > depth:
+            end += 1
+        return end
+
+    def subtree(self, index):
+        '''copy of the subtree rooted at index, which in pre-order is a contiguous range'''
+        end = self.subtree_end(index)
+        types, parents, _ = self.arrays()
+        parents = parents[index:end] - index
+        parents[0] = -1
+        return FlatTree(types[index:end], parents, self.nodes)
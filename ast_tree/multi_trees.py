@@ -1,7 +1,136 @@
-from ast_tree.traverse import children
-from copy import deepcopy
+import copy
+
 import numpy as np
 
+from ast_tree.flat_tree import FlatTree, node_type_name
+from ast_tree.traverse import TreeWalk, children
+from ast_tree.tree_nodes import Node, DotNodes
+
+UNIT_KINDS = ("function", "class", "import", "global")
+
+# program index, unit kind and [start, end) pre-order node range of the unit in its program
+PROVENANCE_DTYPE = np.dtype([("program", np.int64), ("kind", "U8"), ("start", np.int64), ("end", np.int64)])
+
+
+def subtree_ends(walk):
+    '''end (exclusive) pre-order index of the subtree of every node of a TreeWalk'''
+    ends = list(range(1, len(walk.nodes) + 1))
+    kids = walk.kids
+    for idx in range(len(ends) - 1, -1, -1):
+        if kids[idx]:
+            ends[idx] = ends[kids[idx][-1]]
+    return ends
+
+
+def is_cpp(tree):
+    return isinstance(tree, Node) or (isinstance(tree, FlatTree) and isinstance(tree.nodes, DotNodes))
+
+
+def unit_tree(tree, node):
+    '''the unit rooted at node, nodes of a FlatTree are handles on the whole tree so their subtree is
+    copied into a FlatTree of its own'''
+    return tree.subtree(node.index) if isinstance(tree, FlatTree) else node
+
+
+def module_view(tree, body):
+    '''shallow copy of a module root whose children are the given statements, the statements and the
+    root's other attributes are shared with tree, which is not modified. For a FlatTree (body being
+    FlatNodes of it) the view is a new FlatTree of the root and the subtrees of the statements.'''
+    if isinstance(tree, FlatTree):
+        types, parents, _ = tree.arrays()
+        view_types = [types[:1]]
+        view_parents = [np.array([-1], dtype=np.int32)]
+        offset = 1
+        for node in body:
+            start, end = node.index, tree.subtree_end(node.index)
+            view_types.append(types[start:end])
+            statement_parents = parents[start:end] - start + offset
+            statement_parents[0] = 0
+            view_parents.append(statement_parents)
+            offset += end - start
+        return FlatTree(np.concatenate(view_types), np.concatenate(view_parents), tree.nodes)
+    view = copy.copy(tree)
+    if hasattr(tree, "children"):
+        view.children = list(body)
+    else:
+        view.body = list(body)
+    return view
+
+
+def cpp_units(tree, walk=None):
+    '''(node, start, end) of the outermost FunctionDef nodes of a C++ tree in pre-order'''
+    walk = walk if walk is not None else TreeWalk(tree)
+    ends = subtree_ends(walk)
+    units = []
+    idx = 0
+    while idx < len(walk.nodes):
+        if node_type_name(walk.nodes[idx]) == "FUNCTIONDEF":
+            units.append((unit_tree(tree, walk.nodes[idx]), idx, ends[idx]))
+            idx = ends[idx]
+        else:
+            idx += 1
+    return units
+
+
+def program_units(tree, program=0, kinds=UNIT_KINDS):
+    '''Split one program into (unit tree, kind, program, start, end) views.
+
+    Python programs give one unit per top-level function and class definition, in that order, then a
+    module of the imports and a module of the rest of the top-level code (both always present, as
+    the original split did). C++ programs give their outermost FunctionDef subtrees. Function and
+    class units are the original nodes, the import and global modules are shallow views sharing
+    their statements, so no node is copied and the program is left as it is (a FlatTree program
+    gives FlatTree units, copies of its arrays, see unit_tree and module_view). start and end are the
+    pre-order node range of the unit in the program (for the modules, the range spanning their
+    statements).'''
+    walk = TreeWalk(tree)
+    if is_cpp(tree):
+        if "function" not in kinds:
+            return []
+        return [(node, "function", program, start, end) for node, start, end in cpp_units(tree, walk)]
+    ends = subtree_ends(walk)
+    groups = {kind: [] for kind in UNIT_KINDS}
+    for idx in walk.kids[0]:
+        child_name = node_type_name(walk.nodes[idx])
+        if child_name == "FUNCTIONDEF":
+            kind = "function"
+        elif child_name == "CLASSDEF":
+            kind = "class"
+        elif child_name == "IMPORTFROM" or child_name == "IMPORT":
+            kind = "import"
+        else:
+            kind = "global"
+        groups[kind].append(idx)
+    units = []
+    for kind in ("function", "class"):
+        if kind in kinds:
+            units.extend((unit_tree(tree, walk.nodes[idx]), kind, program, idx, ends[idx]) for idx in groups[kind])
+    for kind in ("import", "global"):
+        if kind in kinds:
+            indices = groups[kind]
+            start, end = (indices[0], ends[indices[-1]]) if indices else (0, 0)
+            units.append((module_view(tree, [walk.nodes[idx] for idx in indices]), kind, program, start, end))
+    return units
+
+
+def split_units(X, y, problems, kinds=UNIT_KINDS, original=False):
+    '''program_units of every tree as (trees, labels, problems, provenance) arrays, every unit keeps
+    the label and problem of its program. original=True keeps the whole programs first (with
+    kind "program" and their full range).'''
+    units = []
+    if original:
+        units.extend((tree, "program", i, 0, len(TreeWalk(tree))) for i, tree in enumerate(X))
+    for i, tree in enumerate(X):
+        units.extend(program_units(tree, i, kinds))
+    subX = np.empty(len(units), dtype=object)
+    provenance = np.zeros(len(units), dtype=PROVENANCE_DTYPE)
+    for idx, (unit, kind, program, start, end) in enumerate(units):
+        subX[idx] = unit
+        provenance[idx] = (program, kind, start, end)
+    programs = provenance["program"]
+    return subX, np.asarray(y)[programs], np.asarray(problems)[programs], provenance
+
+
 def split_trees(X, y, problems):
     subX = []
     subY = []
@@ -16,45 +145,5 @@ def split_trees(X, y, problems):
 
 
 def split_trees2(X, y, problems,original=False):
-
-    subX = list(X) if original else []
-    subY = list(y) if original else []
-    subProblem = list(problems) if original else []
-
-    for i, tree in enumerate(X):
-        functions = []
-        classes = []
-        imports = []
-        global_code = []
-        ast_children = children(tree)
-        for child in ast_children:
-            child_name = type(child).__name__
-            if child_name == "FunctionDef":
-                functions.append(child)
-            elif child_name == "ClassDef":
-                classes.append(child)
-            elif child_name == "ImportFrom" or child_name == "Import":
-                imports.append(child)
-            else:
-                global_code.append(child)
-        # add functions
-        subX.extend(functions)
-        subY.extend([y[i]] * len(functions))
-        # add classes
-        subX.extend(classes)
-        subY.extend([y[i]] *len(classes))
-        # add imports
-        tree.body = []
-        import_module = copy.deepcopy(tree)
-        import_module.body = imports
-        subX.append(import_module)
-        subY.append(y[i])
-        # add the rest of the code ( global instructions)
-        tree.body = []
-        global_module = copy.deepcopy(tree)
-        global_module.body = global_code
-        subX.append(global_module)
-        subY.append(y[i])
-
-        subProblem.append(problems[i])
-    return np.array(subX), np.array(subY), np.array(subProblem)
\ No newline at end of file
+    subX, subY, subProblem, _ = split_units(X, y, problems, original=original)
+    return subX, subY, subProblem
@@ -1,55 +1,242 @@
 import ast
+from array import array
+from collections import OrderedDict, deque
 
 
-def set_condition(mode):
-    if mode == "parents":
-        return lambda node: True if len(list(children(node))) > 0 else False
-    elif mode == "leaves":
-        return lambda node: True if len(list(children(node))) == 0 else False
-    elif mode == "all":
-        return lambda node: True
+class TreeWalk:
+    '''Pre-order listing of a tree built with an explicit stack: nodes, their depths and the positions
+    of their children. children() is called once per node, so a TreeWalk can be traversed any number
+    of times, in any order, without listing children again.'''
+    __slots__ = ("nodes", "depths", "kids")
 
+    def __init__(self, tree):
+        nodes = []
+        depths = []
+        kids = []
+        stack = [(tree, 0, -1)]
+        while stack:
+            node, depth, parent = stack.pop()
+            idx = len(nodes)
+            nodes.append(node)
+            depths.append(depth)
+            kids.append([])
+            if parent >= 0:
+                kids[parent].append(idx)
+            node_children = children(node)
+            for i in range(len(node_children) - 1, -1, -1):
+                stack.append((node_children[i], depth + 1, idx))
+        self.nodes = nodes
+        self.depths = depths
+        self.kids = kids
 
-def bfs(node, callback, mode="all", out=None):
-    condition = set_condition(mode)
-    depth = 0
+    def __len__(self):
+        return len(self.nodes)
+
+    def preorder(self):
+        return range(len(self.nodes))
+
+    def postorder(self):
+        kids = self.kids
+        order = []
+        stack = [0]
+        while stack:
+            idx = stack.pop()
+            order.append(idx)
+            stack.extend(kids[idx])
+        # parent, last child subtree, ..., first child subtree reversed gives the post-order
+        order.reverse()
+        return order
+
+    def levelorder(self):
+        kids = self.kids
+        order = []
+        queue = deque([0])
+        while queue:
+            idx = queue.popleft()
+            order.append(idx)
+            queue.extend(kids[idx])
+        return order
 
-    def bfs_rec(node, depth, out):
-        if condition(node):
-            callback(node, depth, out)
-        for child in children(node):
-            bfs_rec(child, depth + 1, out)
+    def select(self, mode="all", order="pre"):
+        if order == "pre":
+            indices = self.preorder()
+        elif order == "post":
+            indices = self.postorder()
+        elif order == "level":
+            indices = self.levelorder()
+        else:
+            raise ValueError("unknown traversal order " + str(order))
+        if mode == "all":
+            return indices
+        kids = self.kids
+        if mode == "leaves":
+            return [idx for idx in indices if len(kids[idx]) == 0]
+        elif mode == "parents":
+            return [idx for idx in indices if len(kids[idx]) > 0]
+        raise ValueError("unknown traversal mode " + str(mode))
 
-    bfs_rec(node, depth, out)
+
+def traverse(node, callback, mode="all", out=None, order="pre"):
+    '''Call callback(node, depth, out) on the nodes selected by mode ("all", "leaves" or "parents") in
+    pre-order, post-order or level (breadth first) order. node is a tree or a TreeWalk of one.'''
+    walk = node if isinstance(node, TreeWalk) else TreeWalk(node)
+    nodes = walk.nodes
+    depths = walk.depths
+    for idx in walk.select(mode, order):
+        callback(nodes[idx], depths[idx], out)
     return out
 
 
+def bfs(node, callback, mode="all", out=None):
+    '''pre-order walk, kept under its old name for the existing callers, see traverse(order="level")
+    for a breadth first one'''
+    return traverse(node, callback, mode, out, order="pre")
+
+
 def dfs(node, callback, mode="all", out=None):
-    condition = set_condition(mode)
-    depth = 0
+    '''post-order walk'''
+    return traverse(node, callback, mode, out, order="post")
 
-    def dfs_rec(node, depth, out):
-        for child in children(node):
-            dfs_rec(child, depth + 1, out)
-        if condition(node):
-            callback(node, depth, out)
 
-    dfs_rec(node, depth, out)
-    return out
+class PostOrderSchedule:
+    '''Bottom-up evaluation order of a tree: nodes in post-order and, for every node, the positions
+    of its children in that order (always smaller than its own position).'''
+    __slots__ = ("nodes", "kids")
+
+    def __init__(self, tree):
+        walk = tree if isinstance(tree, TreeWalk) else TreeWalk(tree)
+        order = walk.postorder()
+        position = [0] * len(order)
+        for pos, idx in enumerate(order):
+            position[idx] = pos
+        self.nodes = [walk.nodes[idx] for idx in order]
+        self.kids = [[position[kid] for kid in walk.kids[idx]] for idx in order]
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def evaluate(self, leaf, merge):
+        '''leaf(node) for the leaves and merge(node, children values) for the other nodes, called in
+        the same order as the recursive evaluation (all children before their parent, left to
+        right), returns the value of the root'''
+        values = [None] * len(self.nodes)
+        for pos, node in enumerate(self.nodes):
+            kids = self.kids[pos]
+            if len(kids) == 0:
+                values[pos] = leaf(node)
+            else:
+                values[pos] = merge(node, [values[kid] for kid in kids])
+                for kid in kids:
+                    values[kid] = None
+        return values[-1]
+
+
+class FlatPostOrder:
+    '''PostOrderSchedule of a FlatTree, or of the subtree under one of its FlatNode handles, kept as
+    an array of pre-order indices; handles are only created for the nodes as they are evaluated'''
+    __slots__ = ("root", "order")
+
+    def __init__(self, root):
+        tree = root.tree
+        first_child = tree.first_child
+        next_sibling = tree.next_sibling
+        order = array('i')
+        stack = [root.index]
+        while stack:
+            idx = stack.pop()
+            order.append(idx)
+            child = first_child[idx]
+            while child != -1:
+                stack.append(child)
+                child = next_sibling[child]
+        # parent, last child subtree, ..., first child subtree reversed gives the post-order
+        order.reverse()
+        self.root = root
+        self.order = order
+
+    def __len__(self):
+        return len(self.order)
+
+    def evaluate(self, leaf, merge):
+        '''same as PostOrderSchedule.evaluate'''
+        root = self.root
+        tree = root.tree
+        first_child = tree.first_child
+        next_sibling = tree.next_sibling
+        values = {}
+        for idx in self.order:
+            node = root if idx == root.index else tree.node(idx)
+            child = first_child[idx]
+            if child == -1:
+                values[idx] = leaf(node)
+            else:
+                kids = []
+                while child != -1:
+                    kids.append(values.pop(child))
+                    child = next_sibling[child]
+                values[idx] = merge(node, kids)
+        return values[root.index]
+
+
+class ScheduleCache:
+    '''PostOrderSchedules of the last maxsize trees a model evaluated, so a tree evaluated again soon
+    (an epoch over a corpus smaller than maxsize) is not scheduled again. Schedules are keyed by
+    id(tree) and hold their tree, so an id is not reused while its schedule is cached; the least
+    recently used tree is dropped with its schedule. The trees must not be changed after their first
+    evaluation.'''
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.schedules = OrderedDict()
+
+    def __len__(self):
+        return len(self.schedules)
+
+    def get(self, tree):
+        try:
+            schedule = self.schedules.pop(id(tree))
+        except KeyError:
+            schedule = PostOrderSchedule(tree)
+        if self.maxsize > 0:
+            self.schedules[id(tree)] = schedule
+            if len(self.schedules) > self.maxsize:
+                self.schedules.popitem(last=False)
+        return schedule
+
+    def clear(self):
+        self.schedules.clear()
+
+
+def post_order(tree, cache=None):
+    '''evaluation schedule of a tree: a FlatPostOrder of a FlatTree or FlatNode, otherwise a
+    PostOrderSchedule, taken from cache (a ScheduleCache) when one is given'''
+    from ast_tree.flat_tree import FlatNode
+    if isinstance(tree, FlatNode):
+        return FlatPostOrder(tree)
+    if cache is None:
+        return PostOrderSchedule(tree)
+    return cache.get(tree)
+
+
+def evaluate_tree(tree, leaf, merge, cache=None):
+    '''non-recursive bottom-up evaluation of a tree, see PostOrderSchedule.evaluate'''
+    return post_order(tree, cache).evaluate(leaf, merge)
 
 
 def children(node):
-    if hasattr(node,"children"):
-        for child in node.children:
-            yield child
-    else:
-        for field, value in ast.iter_fields(node):
-            if isinstance(value, ast.AST):
-                yield value
-            elif isinstance(value, list):
-                for item in value:
-                    if isinstance(item, ast.AST):
-                        yield item
+    try:
+        return node.children
+    except AttributeError:
+        pass
+    out = []
+    for field, value in ast.iter_fields(node):
+        if isinstance(value, ast.AST):
+            out.append(value)
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, ast.AST):
+                    out.append(item)
+    return out
 
 def tree_print(tree,callback):
     bfs(tree, callback=callback, mode="all")
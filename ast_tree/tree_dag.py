@@ -0,0 +1,105 @@
+import ast
+import hashlib
+
+from ast_tree.traverse import children
+from ast_tree.tree_nodes import Node
+
+
+def node_label(node):
+    '''(type name, scalar content) of a node, everything but its children'''
+    if isinstance(node, Node):
+        return node.type, node.code
+    if hasattr(node, "children"):
+        return type(node).__name__, ()
+    scalars = []
+    for field, value in ast.iter_fields(node):
+        if isinstance(value, ast.AST):
+            continue
+        if isinstance(value, list):
+            # the number of ast items per list keeps Call(args=[a]) apart from Call(keywords=[a])
+            scalars.append((field, sum(isinstance(item, ast.AST) for item in value),
+                            tuple(repr(item) for item in value if not isinstance(item, ast.AST))))
+        else:
+            scalars.append((field, repr(value)))
+    return type(node).__name__, tuple(scalars)
+
+
+def set_children(node, kids):
+    if isinstance(node, Node) or hasattr(node, "children"):
+        node.children = kids
+        return
+    kids = iter(kids)
+    for field, value in ast.iter_fields(node):
+        if isinstance(value, ast.AST):
+            setattr(node, field, next(kids))
+        elif isinstance(value, list):
+            setattr(node, field, [next(kids) if isinstance(item, ast.AST) else item for item in value])
+
+
+class InternTable:
+    '''Hash-consing table of the subtrees of a corpus.
+
+    intern(tree) replaces every subtree by the first structurally identical one (same type, same
+    scalar content such as Node.code or ast field values, same children) seen by this table, so the
+    trees become a DAG sharing their common subtrees. children() still returns the same types and
+    order for every node. Shared nodes keep the position attributes (lineno ...) of their first
+    occurrence and must not be mutated afterwards. Every interned node has a structural hash, a
+    stable 64 bit blake2b digest of its label and its children's hashes.'''
+
+    def __init__(self):
+        self.table = {}
+        self.hashes = {}
+        self.seen = 0
+
+    def __len__(self):
+        return len(self.table)
+
+    def hash(self, node):
+        return self.hashes[id(node)]
+
+    def _digest(self, label, kids):
+        digest = hashlib.blake2b(repr(label).encode("utf-8"), digest_size=8)
+        for kid in kids:
+            digest.update(self.hashes[id(kid)].to_bytes(8, "little"))
+        return int.from_bytes(digest.digest(), "little")
+
+    def _intern_node(self, node, kids):
+        label = node_label(node)
+        key = (label, tuple(id(kid) for kid in kids))
+        self.seen += 1
+        canonical = self.table.get(key)
+        if canonical is None:
+            set_children(node, kids)
+            self.table[key] = node
+            self.hashes[id(node)] = self._digest(label, kids)
+            canonical = node
+        return canonical
+
+    def intern(self, tree):
+        if tree is None:
+            return None
+        interned = {}
+        # keeps replaced nodes alive while their ids are used as keys
+        visited = []
+        stack = [(tree, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if expanded:
+                if id(node) in interned:
+                    continue
+                kids = [interned[id(child)] for child in children(node)]
+                interned[id(node)] = self._intern_node(node, kids)
+            elif id(node) not in interned:
+                visited.append(node)
+                stack.append((node, True))
+                stack.extend((child, False) for child in children(node))
+        return interned[id(tree)]
+
+
+def intern_trees(trees, table=None):
+    '''hash-cons a list of trees with one shared table, returns the trees and the table'''
+    table = table if table is not None else InternTable()
+    X = list(trees)
+    for idx, tree in enumerate(X):
+        X[idx] = table.intern(tree)
+    return X, table
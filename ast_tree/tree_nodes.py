@@ -5,30 +5,137 @@ import re
 from collections import defaultdict, Counter
 from operator import itemgetter
 import copy
+import hashlib
+import json
+import sys
 import numpy as np
 import codegen as cg
 
-class AstNodes:
+VOCABULARY_VERSION = 1
+
+DOT_NODE_TYPES = ['AndExpression', 'ExclusiveOrExpression', 'IncDec', 'ParameterType', 'Parameter',
+                  'IdentifierDecl',
+                  'ContinueStatement', 'CompoundStatement', 'PrimaryExpression', 'Expression', 'AdditiveExpression',
+                  'ExpressionStatement', 'DoStatement', 'SwitchStatement', 'CastExpression', 'InclusiveOrExpression',
+                  'Label', 'IncDecOp', 'ClassDefStatement', 'Sizeof', 'MemberAccess', 'EqualityExpression',
+                  'UnaryOperator', 'WhileStatement', 'ConditionalExpression', 'ParameterList', 'CastTarget',
+                  'InitializerList', 'IfStatement', 'ElseStatement', 'RelationalExpression', 'BlockStarter',
+                  'ReturnStatement', 'GotoStatement', 'UnaryExpression', 'ArrayIndexing', 'ArgumentList',
+                  'ReturnType',
+                  'Statement', 'AssignmentExpr', 'OrExpression', 'FunctionDef', 'CallExpression',
+                  'IdentifierDeclStatement', 'PtrMemberAccess', 'UnaryOp', 'MultiplicativeExpression', 'Argument',
+                  'BitAndExpression', 'ShiftExpression', 'Identifier', 'Condition', 'ForStatement', 'Callee',
+                  'IdentifierDeclType', 'SizeofExpr', 'BreakStatement', 'ForInit', 'SizeofOperand', "Program"]
+
+
+class Vocabulary:
+    '''Ordered list of node type names, the position of a name is the type id parsers stamp on nodes.
+
+    Vocabularies are registered once per process under their name ("python" or "cpp") and can be
+    saved to / loaded from json so type ids stay stable across runs and machines.'''
     NONE = "NONE"
 
-    def __init__(self):
-        self.nodetypes = []
-        for x in dir(ast):
+    def __init__(self, name, nodetypes, version=VOCABULARY_VERSION):
+        self.name = name
+        self.version = version
+        self.nodetypes = list(nodetypes) + [self.NONE]
+        self.nodetypes_indices = {v.upper(): i for i, v in enumerate(self.nodetypes)}
+
+    def index_name(self, name):
+        return self.nodetypes_indices[name.upper()]
+
+    def size(self):
+        return len(self.nodetypes)
+
+    def to_dict(self):
+        return {"name": self.name, "version": self.version, "nodetypes": self.nodetypes[:-1]}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["name"], data["nodetypes"], data["version"])
+
+    def save(self, filename):
+        with open(filename, "w") as file:
+            json.dump(self.to_dict(), file)
+
+    def signature(self):
+        return hashlib.sha1(json.dumps(self.to_dict()).encode("utf-8")).hexdigest()[:12]
+
+
+def python_node_types():
+    '''ast classes in dir(ast) order, deprecated aliases that do not build a node (ast.Index) are left out'''
+    types = []
+    for x in dir(ast):
+        obj = getattr(ast, x)
+        if isinstance(obj, type) and issubclass(obj, ast.AST):
             try:
-                if isinstance(ast.__getattribute__(x)(), ast.AST):
-                    self.nodetypes.append(x)
+                if isinstance(obj(), ast.AST):
+                    types.append(x)
             except TypeError:
                 pass
-        self.nodetypes.append(self.NONE)
-        self.nodetypes_indices = {v.upper(): i for i, v in enumerate(self.nodetypes)}
+    return types
+
+
+_vocabularies = {}
+# ast class -> python type id, kept in sync with the registered python vocabulary
+_python_type_ids = {}
+
+
+def register_vocabulary(vocabulary):
+    _vocabularies[vocabulary.name] = vocabulary
+    if vocabulary.name == "python":
+        _python_type_ids.clear()
+        for name in python_node_types():
+            if name.upper() in vocabulary.nodetypes_indices:
+                _python_type_ids[getattr(ast, name)] = vocabulary.index_name(name)
+    elif vocabulary.name == "cpp":
+        Node.type_ids.clear()
+    return vocabulary
+
+
+def get_vocabulary(name):
+    return _vocabularies[name]
+
+
+def load_vocabulary(filename):
+    with open(filename) as file:
+        return register_vocabulary(Vocabulary.from_dict(json.load(file)))
+
+
+def vocabulary_signature():
+    return "-".join(_vocabularies[name].signature() for name in sorted(_vocabularies))
+
+
+def stamp_tree(tree):
+    '''set type_id on every node of a parsed python ast'''
+    type_ids = _python_type_ids
+    for node in ast.walk(tree):
+        node.type_id = type_ids[type(node)]
+    return tree
+
+
+def python_type_id(cls):
+    return _python_type_ids[cls]
+
+
+class AstNodes:
+    NONE = "NONE"
+
+    def __init__(self, vocabulary=None):
+        self.vocabulary = vocabulary if vocabulary is not None else get_vocabulary("python")
+        self.nodetypes = self.vocabulary.nodetypes
+        self.nodetypes_indices = self.vocabulary.nodetypes_indices
 
     def index(self, node):
         if node is None:
             return self.nodetypes_indices[self.NONE]
+        if isinstance(node, tuple):
+            return sum([(self.size() ** i) * s for i, s in enumerate(reversed(node))])
+        type_id = getattr(node, "type_id", None)
+        if type_id is not None:
+            return type_id
         if isinstance(node, ast.AST):
             return self.nodetypes_indices[type(node).__name__.upper()]
-        elif isinstance(node, tuple):
-            return sum([(self.size() ** i) * s for i, s in enumerate(reversed(node))])
 
     def get(self, index):
         return self.nodetypes[index]
@@ -84,41 +191,43 @@ def print_ast_node(node, depth, out=None):
 
 
 class Node:
+    '''C++ tree node, type and code strings are interned and type_id is the index of type in the cpp
+    vocabulary (-1 for types outside the vocabulary)'''
+    __slots__ = ("type", "code", "children", "type_id")
+    _fields = ('children',)
+    type_ids = {}
+
     def __init__(self, type, code, child):
-        self.type = type
-        self.code = (code if len(code) > 0 else " ")
+        self.type = sys.intern(type)
+        self.code = sys.intern(code) if len(code) > 0 else " "
         self.children = child
-        self._fields = ('children',)
+        try:
+            self.type_id = Node.type_ids[type]
+        except KeyError:
+            indices = get_vocabulary("cpp").nodetypes_indices
+            self.type_id = Node.type_ids[self.type] = indices.get(type.upper(), -1)
+
+    def __reduce__(self):
+        return Node, (self.type, self.code, self.children)
+
 
 class DotNodes:
     NONE = "NONE"
 
-    def __init__(self):
-        self.nodetypes = [s.upper() for s in ['AndExpression', 'ExclusiveOrExpression', 'IncDec', 'ParameterType', 'Parameter',
-                    'IdentifierDecl',
-                    'ContinueStatement', 'CompoundStatement', 'PrimaryExpression', 'Expression', 'AdditiveExpression',
-                    'ExpressionStatement', 'DoStatement', 'SwitchStatement', 'CastExpression', 'InclusiveOrExpression',
-                    'Label', 'IncDecOp', 'ClassDefStatement', 'Sizeof', 'MemberAccess', 'EqualityExpression',
-                    'UnaryOperator', 'WhileStatement', 'ConditionalExpression', 'ParameterList', 'CastTarget',
-                    'InitializerList', 'IfStatement', 'ElseStatement', 'RelationalExpression', 'BlockStarter',
-                    'ReturnStatement', 'GotoStatement', 'UnaryExpression', 'ArrayIndexing', 'ArgumentList',
-                    'ReturnType',
-                    'Statement', 'AssignmentExpr', 'OrExpression', 'FunctionDef', 'CallExpression',
-                    'IdentifierDeclStatement', 'PtrMemberAccess', 'UnaryOp', 'MultiplicativeExpression', 'Argument',
-                    'BitAndExpression', 'ShiftExpression', 'Identifier', 'Condition', 'ForStatement', 'Callee',
-                    'IdentifierDeclType', 'SizeofExpr', 'BreakStatement', 'ForInit', 'SizeofOperand',"Program"]]
-        self.nodetypes.append(self.NONE)
-        self.nodetypes_indices = {v.upper(): i for i, v in enumerate(self.nodetypes)}
+    def __init__(self, vocabulary=None):
+        self.vocabulary = vocabulary if vocabulary is not None else get_vocabulary("cpp")
+        self.nodetypes = self.vocabulary.nodetypes
+        self.nodetypes_indices = self.vocabulary.nodetypes_indices
 
     def index(self, node):
         if node is None:
             return self.nodetypes_indices[self.NONE]
-        if isinstance(node, Node):
-            # if not node.type:
-            #     return self.nodetypes_indices[self.NONE]
-            return self.nodetypes_indices[node.type.upper()]
-        elif isinstance(node, tuple):
+        if isinstance(node, tuple):
             return sum([(self.size() ** i) * s for i, s in enumerate(reversed(node))])
+        type_id = node.type_id
+        if type_id < 0:
+            raise KeyError(node.type.upper())
+        return type_id
 
     def get(self, index):
         return self.nodetypes[index]
@@ -126,6 +235,11 @@ class DotNodes:
     def size(self):
         return len(self.nodetypes)
 
+
+register_vocabulary(Vocabulary("python", python_node_types()))
+register_vocabulary(Vocabulary("cpp", [s.upper() for s in DOT_NODE_TYPES]))
+
+
 def print_dot_node(node, depth, out=None):
     print(' ' * depth * 2 + node.type + "()")  # node.code
 
@@ -1,37 +1,44 @@
 import ast
 import os
+import re
 import jsonpickle
 import json
 from collections import defaultdict
-from ast_tree.tree_nodes import Node, print_dot_node, DotNodes
+from ast_tree.tree_nodes import Node, print_dot_node, python_node_types, python_type_id, stamp_tree
 from ast_tree.traverse import tree_print, bfs, children
 import sys
-def ast_parse_file(filename):
+
+PARSER_VERSION = 2
+
+# lower case ast class name -> ast class, built once per process
+PYTHON_NODE_CLASSES = {x.lower(): getattr(ast, x) for x in python_node_types()}
+
+def ast_parse_file(filename, source=None):
+    '''parse a python file, or its already read source text'''
     try:
-        with open(filename, 'r', encoding="utf-8") as file:
-            tree = ast.parse(file.read())
-            return tree
+        if source is None:
+            with open(filename, 'r', encoding="utf-8") as file:
+                source = file.read()
+        tree = ast.parse(source)
+        return stamp_tree(tree)
     except Exception as e:
         print("ERROR: ", e, " filename", filename)
 
-def parse_ast_tree(filename):
+def parse_ast_tree(filename, lines=None):
     nodes = {}
     links = {}
-    nodetypes = {}
-    for x in dir(ast):
-        try:
-            if isinstance(ast.__getattribute__(x)(), ast.AST):
-                nodetypes[x.lower()] = ast.__getattribute__(x)
-        except TypeError:
-            pass
-    for line in open(filename):
+    nodetypes = PYTHON_NODE_CLASSES
+    for line in open(filename) if lines is None else lines:
         if line.startswith("<"):
             parts = line[1:].strip("\n").split("=")
             links[parts[0]] = parts[1].split(",")
         elif line.startswith(">"):
             parts = line[1:].strip("\n").split("\t")
-            nodes[parts[0]] = nodetypes[parts[1].lower()]()
-            nodes[parts[0]].children = []
+            cls = nodetypes[parts[1].lower()]
+            node = cls()
+            node.children = []
+            node.type_id = python_type_id(cls)
+            nodes[parts[0]] = node
     root_nodes = []
     for id, value in sorted(links.items()):
         for link in value:
@@ -40,10 +47,10 @@ def parse_ast_tree(filename):
 
     return nodes['0']
 
-def parse_tree(filename,seperate_trees=False):
+def parse_tree(filename,seperate_trees=False,lines=None):
     nodes = {}
     links = {}
-    for line in open(filename):
+    for line in open(filename) if lines is None else lines:
         if line.startswith("<"):
             parts = line[1:].strip("\n").split("=")
             links[parts[0]] = parts[1].split(",")
@@ -56,11 +63,8 @@ def parse_tree(filename,seperate_trees=False):
             nodes[id].children.append(nodes[link])
             root_nodes.append(link)
 
-    dot = DotNodes()
     for node in nodes.values():
-        try:
-            dot.index(node)
-        except:
+        if node.type_id < 0:
             print(filename)
     root_nodes = set(nodes.keys()) - set(root_nodes)
     root_nodes = [nodes[id] for id in list(sorted(root_nodes))]
@@ -70,107 +74,115 @@ def parse_tree(filename,seperate_trees=False):
         root = Node("Program","",root_nodes)
         return [root]
 
-def parse_dot(filename):
-    split = "\t"
-    structs = []
-    for line in open(filename):
-        if line.startswith("//"):
-            continue
-        if line.startswith("strict graph"):
-            structs.append(line)
-        else:
-            structs[-1] += line
-
-    lines = []
-    for struct in structs:
-        s = struct.split("\n")
-        for line in s:
-            if line.startswith("\t"):
-                lines.append(line.strip().replace("\n", split))
+NON_DECIMAL = re.compile(R"[^\d-]+")
+# a whole graph header line, so code continuing a record over a line starting with "graph" is not one
+GRAPH_HEADER = re.compile(R'^(strict\s+)?(di)?graph\b[^"]*\{\s*$')
+
+
+class DotGraph:
+    '''nodes and edges of one graph of a DOT file, filled one record at a time'''
+
+    def __init__(self):
+        self.nodes = {}
+        self.links = defaultdict(list)
+
+    def add_record(self, record):
+        if len(record) == 0 or not record[0].isdigit():
+            return
+        try:
+            if "--" in record[:10]:
+                numbers = NON_DECIMAL.sub('', record).split("--")
+                try:
+                    self.links[int(numbers[0].strip())].append(int(numbers[1].strip()))
+                except Exception as e1:
+                    print(e1)
             else:
-                if len(lines) > 0:
-                    lines[-1] = lines[-1] + split + line.replace("\n", split).strip()
-        lines.append("")
-    nodes = {}
-    links = defaultdict(list)
-    for line in lines:
-        if len(line) > 0 and line[0].isdigit():
-            try:
-                if "--" in line[:10]:
-                    import re
-                    non_decimal = re.compile(R"[^\d-]+")
-                    line = non_decimal.sub('', line)
-                    numbers = line.split("--")
-                    try:
-                        links[int(numbers[0].strip())].append(int(numbers[1].strip()))
-                    except Exception as e1:
-                        print(e1)
-                # int(parts[0])
-                else:
-                    parts = line.split("\t")
-                    if len(parts) > 1:
-                        content = {"type": "", "code": ""}
-                        for part in parts[1:]:
-                            if part.startswith("type:"):
-                                content["type"] = part.split(":")[1]
-                            if part.startswith("code:"):
-                                content["code"] = part.split(":")[1]
-                        nodes[int(parts[0])] = Node(content["type"], content["code"], [])
-            except Exception as e:
-                print(e)
-    root_nodes = []
-    for id, value in sorted(links.items()):
-        for link in value:
-            nodes[id].children.append(nodes[link])
-            root_nodes.append(link)
+                parts = record.split("\t")
+                if len(parts) > 1:
+                    type, code = "", ""
+                    for part in parts[1:]:
+                        if part.startswith("type:"):
+                            type = part.split(":")[1]
+                        if part.startswith("code:"):
+                            code = part.split(":")[1]
+                    self.nodes[int(parts[0])] = Node(type, code, [])
+        except Exception as e:
+            print(e)
 
-    root_nodes = set(nodes.keys()) - set(root_nodes)
-    root = Node("Program","",[nodes[id] for id in list(sorted(root_nodes))])
-    return root
+    def roots(self):
+        '''link the nodes and return the (id, node) pairs of the roots, sorted by id'''
+        child_ids = set()
+        for id, value in sorted(self.links.items()):
+            for link in value:
+                self.nodes[id].children.append(self.nodes[link])
+                child_ids.add(link)
+        return [(id, self.nodes[id]) for id in sorted(set(self.nodes.keys()) - child_ids)]
 
-def fast_parse_dot(filename):
-    split = "\t"
-    lines = []
-    for line in open(filename):
-        if line.startswith("\\"):
+
+def dot_records(lines):
+    '''Stream the records of a (possibly multi graph) DOT file, None marks the start of every graph.
+
+    A record starts at every tab indented line and continues over the following lines, joined with
+    tabs; Joern splits some types over two lines after "type:\\", those are joined back into one
+    "type:<name>" field.'''
+    record = []
+    split_type = False
+    for line in lines:
+        if line.startswith("//"):
             continue
         if line.startswith("\t"):
-            lines.append([line.strip().replace("\n", split)])
-        else:
-            if len(lines) > 0:
-                lines[-1].append(line.replace("\n", split).strip())
-    nodes = {}
-    links = defaultdict(list)
-    for line in lines:
-        if len(line) > 0 and line[0][0].isdigit():
-            try:
-                if "--" in line[0][:10]:
-                    import re
-                    non_decimal = re.compile(R"[^\d-]+")
-                    numbers = non_decimal.sub('', line[0]).split("--")
-                    try:
-                        links[int(numbers[0].strip())].append(int(numbers[1].strip()))
-                    except Exception as e1:
-                        print(e1)
-                # int(parts[0])
-                else:
-                    if len(line) > 1:
-                        content = {"type": "", "code": ""}
-                        for l in line:
-                            if "code:" in l:
-                                content["code"] = l.split(":")[1]
-                            elif "type:" in l:
-                                content["type"] = l.split(":")[1]
-                        id = int(line[0].split("\t")[0])
-                        nodes[id] = Node(content["type"], content["code"], [])
-            except Exception as e:
-                print(e)
-    root_nodes = []
-    for id, value in sorted(links.items()):
-        for link in value:
-            nodes[id].children.append(nodes[link])
-            root_nodes.append(link)
+            if len(record) > 0:
+                yield "\t".join(record)
+            record = [line.strip()]
+            split_type = False
+        elif GRAPH_HEADER.match(line):
+            if len(record) > 0:
+                yield "\t".join(record)
+            record = []
+            yield None
+        elif len(record) > 0:
+            if line.startswith("type:\\"):
+                record.append("type:")
+                split_type = True
+            elif split_type:
+                record[-1] += line.strip()
+                split_type = False
+            else:
+                record.append(line.strip())
+    if len(record) > 0:
+        yield "\t".join(record)
 
-    root_nodes = set(nodes.keys()) - set(root_nodes)
-    root = Node("Program","",[nodes[id] for id in list(sorted(root_nodes))])
-    return root
\ No newline at end of file
+
+def iter_dot_roots(filename):
+    '''Stream a (possibly multi graph) DOT file and yield the sorted (id, node) roots of every graph.
+
+    Records (see dot_records) are handed to the current graph as soon as they are complete so only
+    one graph is kept in memory.'''
+    graph = None
+    with open(filename) as file:
+        for record in dot_records(file):
+            if record is None:
+                if graph is not None:
+                    yield graph.roots()
+                graph = DotGraph()
+            elif graph is not None:
+                graph.add_record(record)
+    if graph is not None:
+        yield graph.roots()
+
+
+def iter_dot_graphs(filename):
+    '''yield one Program tree per graph of a DOT file'''
+    for roots in iter_dot_roots(filename):
+        yield Node("Program", "", [node for _, node in roots])
+
+
+def parse_dot(filename):
+    roots = []
+    for graph_roots in iter_dot_roots(filename):
+        roots.extend(graph_roots)
+    return Node("Program", "", [node for _, node in sorted(roots, key=lambda root: root[0])])
+
+
+def fast_parse_dot(filename):
+    return parse_dot(filename)
@@ -0,0 +1,150 @@
+import json
+import os
+from array import array
+
+import numpy as np
+
+from ast_tree.flat_tree import FlatTree, flatten_tree, node_type_name
+from ast_tree.tree_nodes import Node, AstNodes, DotNodes, python_type_id
+from ast_tree.tree_parser import PYTHON_NODE_CLASSES
+from utils.job_utils import atomic_write
+
+STORE_VERSION = 1
+STORE_EXT = ".store"
+
+
+def write_store(path, trees, labels, problems, names, kind, codes=True):
+    '''write one program tree per entry of trees into a columnar store folder at path. trees can be a
+    generator, every tree is flattened into the columns as it comes and None entries (files that
+    failed to parse) are left out with their label, problem and name.'''
+    type_ids = {}
+    code_ids = {}
+    types = array('h')
+    parents = array('i')
+    node_codes = array('i')
+    program_offsets = array('q', [0])
+    kept_labels, kept_problems, kept_names = [], [], []
+    for tree, label, problem, name in zip(trees, labels, problems, names):
+        if tree is None:
+            continue
+        nodes, tree_parents = flatten_tree(tree)
+        for node in nodes:
+            types.append(type_ids.setdefault(node_type_name(node), len(type_ids)))
+            if codes:
+                node_codes.append(code_ids.setdefault(getattr(node, "code", ""), len(code_ids)))
+        parents.extend(tree_parents)
+        program_offsets.append(len(types))
+        kept_labels.append(str(label))
+        kept_problems.append(str(problem))
+        kept_names.append(os.path.basename(str(name)))
+
+    os.makedirs(path, exist_ok=True)
+    arrays = {"types": np.frombuffer(types, dtype=np.int16),
+              "parents": np.frombuffer(parents, dtype=np.int32),
+              "program_offsets": np.frombuffer(program_offsets, dtype=np.int64)}
+    if codes:
+        arrays["codes"] = np.frombuffer(node_codes, dtype=np.int32)
+    for column, values in arrays.items():
+        with atomic_write(os.path.join(path, column + ".npy"), "wb") as file:
+            np.save(file, values)
+    # meta.json is written last, a store is only found (see is_store) once all its arrays are
+    with atomic_write(os.path.join(path, "meta.json")) as file:
+        json.dump({"version": STORE_VERSION,
+                   "kind": kind,
+                   "types": sorted(type_ids, key=type_ids.get),
+                   "codes": sorted(code_ids, key=code_ids.get) if codes else None,
+                   "labels": kept_labels,
+                   "problems": kept_problems,
+                   "names": kept_names}, file)
+
+
+class TreeStore:
+    '''read-only view over a store folder written by write_store, programs are decoded on demand'''
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as file:
+            meta = json.load(file)
+        if meta["version"] != STORE_VERSION:
+            raise ValueError("unsupported tree store version {0} in {1}".format(meta["version"], path))
+        self.kind = meta["kind"]
+        self.type_names = meta["types"]
+        self.code_table = meta["codes"]
+        self.labels = np.array(meta["labels"])
+        self.problems = np.array(meta["problems"])
+        self.names = np.array(meta["names"])
+
+        def load(name):
+            return np.load(os.path.join(path, name + ".npy"), mmap_mode='r')
+
+        self.types = load("types")
+        self.parents = load("parents")
+        self.program_offsets = load("program_offsets")
+        self.codes = load("codes") if self.code_table is not None else None
+
+        # type names are stored upper case (see node_type_name), python classes are found as in
+        # parse_ast_tree and C++ types get the spelling of the vocabulary back
+        if self.kind == "python":
+            self.type_classes = [PYTHON_NODE_CLASSES[name.lower()] for name in self.type_names]
+            self.type_class_ids = [python_type_id(cls) for cls in self.type_classes]
+        else:
+            nodes = self.node_dict()
+            self.type_names = [nodes.get(nodes.nodetypes_indices[name.upper()])
+                               if name.upper() in nodes.nodetypes_indices else name for name in self.type_names]
+
+    def __len__(self):
+        return len(self.program_offsets) - 1
+
+    def __getitem__(self, index):
+        return self.tree(index)
+
+    def node_dict(self):
+        return AstNodes() if self.kind == "python" else DotNodes()
+
+    def root_children(self, index):
+        start, end = int(self.program_offsets[index]), int(self.program_offsets[index + 1])
+        return int(np.count_nonzero(self.parents[start + 1:end] == 0))
+
+    def node_count(self, index):
+        return int(self.program_offsets[index + 1] - self.program_offsets[index])
+
+    def _make_nodes(self, start, end):
+        types = self.types[start:end].tolist()
+        if self.kind == "python":
+            nodes = []
+            for t in types:
+                node = self.type_classes[t]()
+                node.children = []
+                node.type_id = self.type_class_ids[t]
+                nodes.append(node)
+            return nodes
+        if self.codes is not None:
+            codes = [self.code_table[c] for c in self.codes[start:end].tolist()]
+        else:
+            codes = [""] * (end - start)
+        return [Node(self.type_names[t], code, []) for t, code in zip(types, codes)]
+
+    def tree(self, index, seperate_trees=False):
+        start, end = int(self.program_offsets[index]), int(self.program_offsets[index + 1])
+        nodes = self._make_nodes(start, end)
+        for idx, parent in enumerate(self.parents[start + 1:end].tolist(), 1):
+            nodes[parent].children.append(nodes[idx])
+        if seperate_trees:
+            return list(nodes[0].children)
+        return nodes[0]
+
+    def flat_tree(self, index, nodes=None):
+        '''the program as a FlatTree, without building any node objects'''
+        if nodes is None:
+            nodes = self.node_dict()
+        lookup = np.array([nodes.nodetypes_indices[name.upper()] for name in self.type_names], dtype=np.int16)
+        start, end = int(self.program_offsets[index]), int(self.program_offsets[index + 1])
+        return FlatTree(lookup[self.types[start:end]], self.parents[start:end], nodes)
+
+    def trees(self, seperate_trees=False):
+        for index in range(len(self)):
+            yield self.tree(index, seperate_trees)
+
+
+def is_store(path):
+    return path.rstrip("/\\").endswith(STORE_EXT) and os.path.isfile(os.path.join(path, "meta.json"))
@@ -15,7 +15,7 @@ from models.lstm_models import RecursiveLSTM, RecursiveBiLSTM
 from models.clstm_models import RecursiveDyanmicLSTM
 from models.tree_models import RecursiveTreeLSTM
 from utils.exp_utlis import pick_subsets, split_trees,train,evaluate, read_train_config
-from utils.dataset_utils import parse_src_files, print_model, unified_ast_trees, make_binary_tree, generate_trees
+from utils.dataset_utils import parse_src_files, print_model, make_binary_tree, generate_trees
 
 
 def print_table(table):
@@ -94,7 +94,7 @@ def main_experiment():
             trees, tree_labels = pick_subsets(trees, tree_labels, labels=args.classes,seed=rand_seed,classes=None)
 
     if model_name in ("treelstm","slstm"):
-        trees = make_binary_tree(unified_ast_trees(trees),layers)
+        trees = make_binary_tree(trees, layers, tree_nodes)
 
     # trees, tree_labels, lable_problems = generate_trees(labels=2,children=5,examples_per_label=10)
     # tree_nodes = AstNodes()
@@ -16,7 +16,7 @@ from models.clstm_models import RecursiveDyanmicLSTM
 from models.mix_lstm_models import SeqRecursiveTreeLSTM
 from models.tree_models import RecursiveTreeLSTM
 from utils.exp_utlis import pick_subsets, split_trees,train,evaluate, read_train_config, trainBPTT
-from utils.dataset_utils import parse_src_files, print_model, unified_ast_trees, make_binary_tree, generate_trees
+from utils.dataset_utils import parse_src_files, print_model, make_binary_tree, generate_trees
 
 
 def print_table(table):
@@ -68,6 +68,11 @@ def main_experiment():
     parser.add_argument('--cell', '-cl', type=str, default="lstm", help='lstm')
     parser.add_argument('--residual', '-r', action='store_true', default=False,help='Number of examples in each mini batch')
     parser.add_argument('--save', '-s', type=int, default=1, help='Save best models')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='Number of processes used to parse the dataset (-1 for all cores)')
+    parser.add_argument('--cache', action='store_true', default=False, help='Reuse parsed trees from the dataset parse cache')
+    parser.add_argument('--manifest', action='store_true', default=False, help='List the dataset files from its manifest')
+    parser.add_argument('--dag', action='store_true', default=False, help='Share identical subtrees between the loaded trees (within each tree with --lazy)')
+    parser.add_argument('--lazy', action='store_true', default=False, help='Parse trees on demand instead of loading the whole dataset')
 
     args = parser.parse_args()
 
@@ -86,9 +91,12 @@ def main_experiment():
     cell = args.cell
     residual = args.residual
 
-    trees, tree_labels, lable_problems, tree_nodes = parse_src_files(dataset_folder,seperate_trees=seperate_trees)
     if args.train:
         rand_seed, classes = read_train_config(os.path.join("train", args.dataset.split("_")[0], args.train))
+    else:
+        classes = None
+    trees, tree_labels, lable_problems, tree_nodes = parse_src_files(dataset_folder,seperate_trees=seperate_trees,n_jobs=args.jobs,cache=args.cache,lazy=args.lazy,manifest=args.manifest,classes=classes,dag=args.dag)
+    if args.train:
         trees, tree_labels = pick_subsets(trees, tree_labels, classes=classes)
     else:
         rand_seed = random.randint(0, 4294967295)
@@ -96,7 +104,7 @@ def main_experiment():
             trees, tree_labels = pick_subsets(trees, tree_labels, labels=args.classes,seed=rand_seed,classes=None)
 
     # if model_name in ("treelstm","slstm"):
-    #     trees = make_binary_tree(unified_ast_trees(trees),layers)
+    #     trees = make_binary_tree(trees, layers, tree_nodes)
 
     # trees, tree_labels, lable_problems = generate_trees(labels=2,children=5,examples_per_label=10)
     # tree_nodes = AstNodes()
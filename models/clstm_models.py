@@ -8,7 +8,7 @@ import chainer.links as L
 from chainer import cuda
 
 from ast_tree.ASTVectorizater import TreeFeatures
-from ast_tree.traverse import children
+from ast_tree.traverse import ScheduleCache, evaluate_tree
 from memory_cell.treelstm import FastTreeLSTM
 
 
@@ -18,6 +18,7 @@ class RecursiveBaseLSTM(chainer.Chain):
         self.classes_ = classes
         self.feature_dict = feature_dict
         self.dropout = dropout
+        self.schedules = ScheduleCache()
 
         self.add_link("embed", L.EmbedID(self.feature_dict.size() + 1, n_units))
         self.add_link("w", L.Linear(n_units, n_label))
@@ -39,19 +40,14 @@ class RecursiveBaseLSTM(chainer.Chain):
         return count
 
     def traverse(self, node, train_mode):
-        children_ast = list(children(node))
-        if len(children_ast) == 0:
-            # leaf node
-            return self.embed_vec(node, train_mode=train_mode)
-        else:
-            # internal node
-            children_nodes = []
-            for child in children_ast:
-                if child is not None:
-                    child_node = self.traverse(child, train_mode=train_mode)
-                    children_nodes.append(child_node)
-            x = self.embed_vec(node, train_mode=train_mode)
-            return self.merge(x, children_nodes, train_mode=train_mode)
+        def leaf(x):
+            return self.embed_vec(x, train_mode=train_mode)
+
+        def merge(x, children_nodes):
+            # internal node, embedded once all its children are evaluated
+            return self.merge(self.embed_vec(x, train_mode=train_mode), children_nodes, train_mode=train_mode)
+
+        return evaluate_tree(node, leaf, merge, self.schedules)
 
     def label(self, v):
         return self.w(v)
@@ -8,7 +8,7 @@ import chainer.links as L
 from chainer import cuda
 
 from ast_tree.ASTVectorizater import TreeFeatures
-from ast_tree.traverse import children
+from ast_tree.traverse import ScheduleCache, evaluate_tree
 from memory_cell.treelstm import FastTreeLSTM
 
 
@@ -19,6 +19,7 @@ class RecursiveBaseTree(chainer.Chain):
         self.feature_dict = feature_dict
         self.n_children = n_children
         self.dropout = dropout
+        self.schedules = ScheduleCache()
 
         self.add_link("embed", L.EmbedID(self.feature_dict.size() + 1, n_units))
         self.add_link("w", L.Linear(n_units, n_label))
@@ -44,24 +45,19 @@ class RecursiveBaseTree(chainer.Chain):
         return F.dropout(h, ratio=self.dropout, train=train_mode)
 
     def traverse_rec(self, node, train_mode):
-        children_ast = list(children(node))
-        if len(children_ast) == 0:
-            # leaf node
-            lf = self.leaf(node, train_mode=train_mode)
-            return lf
-        else:
-            # internal node
-            children_nodes = []
-            for child in children_ast:
-                child_node = self.traverse_rec(child, train_mode=train_mode)
-                children_nodes.append(child_node)
+        def leaf(x):
+            return self.leaf(x, train_mode=train_mode)
+
+        def merge(x, children_nodes):
+            # internal node, padded or cut to n_children
             if len(children_nodes) < self.n_children:
                 c, h = self.leaf(None, train_mode)
                 children_nodes.extend([(c, h) for i in range(self.n_children - len(children_nodes))])
             elif len(children_nodes) > self.n_children:
                 children_nodes = children_nodes[:self.n_children]
-            x = self.embed_vec(node, train_mode=train_mode)
-            return self.merge(x, children_nodes, train_mode=train_mode)
+            return self.merge(self.embed_vec(x, train_mode=train_mode), children_nodes, train_mode=train_mode)
+
+        return evaluate_tree(node, leaf, merge, self.schedules)
 
     def label(self, v):
         return self.w(v)
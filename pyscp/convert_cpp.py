@@ -1,193 +1,187 @@
+import argparse
 from collections import defaultdict
 import os
+import time
+from multiprocessing import Pool
+
 import numpy as np
 import shutil
 from tqdm import tqdm
 
-from ast_tree.tree_nodes import Node
-from ast_tree.tree_parser import parse_tree
-
-nodetypes = [s.upper() for s in ['AndExpression', 'ExclusiveOrExpression', 'IncDec', 'ParameterType', 'Parameter',
-                                      'IdentifierDecl',
-                                      'ContinueStatement', 'CompoundStatement', 'PrimaryExpression', 'Expression',
-                                      'AdditiveExpression',
-                                      'ExpressionStatement', 'DoStatement', 'SwitchStatement', 'CastExpression',
-                                      'InclusiveOrExpression',
-                                      'Label', 'IncDecOp', 'ClassDefStatement', 'Sizeof', 'MemberAccess',
-                                      'EqualityExpression',
-                                      'UnaryOperator', 'WhileStatement', 'ConditionalExpression', 'ParameterList',
-                                      'CastTarget',
-                                      'InitializerList', 'IfStatement', 'ElseStatement', 'RelationalExpression',
-                                      'BlockStarter',
-                                      'ReturnStatement', 'GotoStatement', 'UnaryExpression', 'ArrayIndexing',
-                                      'ArgumentList',
-                                      'ReturnType',
-                                      'Statement', 'AssignmentExpr', 'OrExpression', 'FunctionDef', 'CallExpression',
-                                      'IdentifierDeclStatement', 'PtrMemberAccess', 'UnaryOp',
-                                      'MultiplicativeExpression', 'Argument',
-                                      'BitAndExpression', 'ShiftExpression', 'Identifier', 'Condition', 'ForStatement',
-                                      'Callee',
-                                      'IdentifierDeclType', 'SizeofExpr', 'BreakStatement', 'ForInit', 'SizeofOperand',
-                                      "Program"]]
+from ast_tree.tree_nodes import Node, get_vocabulary
+from ast_tree.tree_parser import parse_tree, dot_records, NON_DECIMAL
+from utils.job_utils import atomic_write, n_processes
 
-def parse_dot2(src_file,dst_file):
-    split = "\t"
-    structs = []
-    for line in src_file:
-        if line.startswith("//"):
-            continue
-        if line.startswith("strict graph"):
-            structs.append(line)
-        else:
-            structs[-1] += line
-
-    lines = []
-    noTab = False
-    for struct in structs:
-        s = struct.split("\n")
-        for line in s:
-            if line.startswith("\t"):
-                lines.append(line.strip().replace("\n", split))
-            else:
-                if len(lines) > 0:
-                    if line.startswith("type:\\"):
-                        line = line[:5]
-                        lines[-1] = lines[-1] + split + line.replace("\n", split).strip()
-                        noTab = True
-                    else:
-                        if noTab:
-                            lines[-1] = lines[-1] + line.replace("\n", split).strip()
-                            noTab = False
-                        else:
-                            lines[-1] = lines[-1] + split + line.replace("\n", split).strip()
-        lines.append("")
+def read_dot(src_file):
+    '''nodes ({id: Node}) and links ({id: [child ids]}) of a DOT file, its records are read with
+    tree_parser.dot_records; nodes of types outside the cpp vocabulary are kept and reported'''
     nodes = {}
     links = defaultdict(list)
-    for line in lines:
-        if len(line) > 0 and line[0].isdigit():
-            try:
-                if "--" in line[:10]:
-                    import re
-                    non_decimal = re.compile(R"[^\d-]+")
-                    line = non_decimal.sub('', line)
-                    numbers = line.split("--")
-                    try:
-                        links[int(numbers[0].strip())].append(numbers[1].strip())
-                    except Exception as e1:
-                        print(e1)
-                # int(parts[0])
-                else:
-                    parts = line.split("\t")
-                    if len(parts) > 1:
-                        content = {"type": "", "code": ""}
-                        for part in parts[1:]:
-                            if part.startswith("type:"):
-                                content["type"] = part.split(":")[1]
-                            if part.startswith("code:"):
-                                content["code"] = part.split(":")[1]
-                        if content['type'] == '':
-                            type = line.split("type:")
-                            if len(type) > 1:
-                                content["type"] = type[1].replace("\\", "").split()[0]
-                        nodes[int(parts[0])] = Node(content["type"], content["code"], [])
-                        nodetypes.index(content['type'].upper())
-            except Exception as e:
-                print(e)
-                print(src_file.name)
-    for key,node in sorted(nodes.items()):
-        dst_file.write(">{0}\t{1}\t{2}\n".format(key,node.type,node.code))
-    for key,link in sorted(links.items()):
-        dst_file.write("<{0}={1}\n".format(key,','.join(link)))
-
-def parse_dot(src_file,dst_file):
-    split = "\t"
-    structs = []
-    for line in src_file:
-        if line.startswith("//"):
+    for line in dot_records(src_file):
+        if line is None or len(line) == 0 or not line[0].isdigit():
             continue
-        if line.startswith("strict graph"):
-            structs.append(line)
-        else:
-            structs[-1] += line
-
-    lines = []
-    noTab = False
-    for struct in structs:
-        s = struct.split("\n")
-        for line in s:
-            if line.startswith("\t"):
-                lines.append(line.strip().replace("\n", split))
+        try:
+            if "--" in line[:10]:
+                numbers = NON_DECIMAL.sub('', line).split("--")
+                try:
+                    links[int(numbers[0].strip())].append(numbers[1].strip())
+                except Exception as e1:
+                    print(e1)
             else:
-                if len(lines) > 0:
-                    if line.startswith("type:\\"):
-                        line = line[:5]
-                        lines[-1] = lines[-1] + split + line.replace("\n", split).strip()
-                        noTab = True
-                    else:
-                        if noTab:
-                            lines[-1] = lines[-1] + line.replace("\n", split).strip()
-                            noTab = False
-                        else:
-                            lines[-1] = lines[-1] + split + line.replace("\n", split).strip()
-        lines.append("")
-    nodes = {}
-    links = defaultdict(list)
-    for line in lines:
-        if len(line) > 0 and line[0].isdigit():
-            try:
-                if "--" in line[:10]:
-                    import re
-                    non_decimal = re.compile(R"[^\d-]+")
-                    line = non_decimal.sub('', line)
-                    numbers = line.split("--")
-                    try:
-                        links[int(numbers[0].strip())].append(numbers[1].strip())
-                    except Exception as e1:
-                        print(e1)
-                # int(parts[0])
-                else:
-                    parts = line.split("\t")
-                    if len(parts) > 1:
-                        content = {"type": "", "code": ""}
-                        for part in parts[1:]:
-                            if part.startswith("type:"):
-                                content["type"] = part.split(":")[1]
-                            if part.startswith("code:"):
-                                content["code"] = part.split(":")[1]
-                        nodes[int(parts[0])] = Node(content["type"], content["code"], [])
-            except Exception as e:
-                print(e)
-    for key,node in sorted(nodes.items()):
-        dst_file.write(">{0}\t{1}\t{2}\n".format(key,node.type,node.code))
-    for key,link in sorted(links.items()):
-        dst_file.write("<{0}={1}\n".format(key,','.join(link)))
-
-def gen_tree_files(basefolder):
-    trees = []
-    users = []
-    problems = []
-    for folder in [f for f in os.listdir(basefolder) if os.path.isdir(os.path.join(basefolder,f))]:
-        print(folder, " ...", end=" ", flush=True)
-        for number in os.listdir(os.path.join(basefolder, folder)):
-            file = [filename for filename in os.listdir(os.path.join(basefolder, folder, number)) if
-                    filename.endswith(".dot")][0]
-            src_file = open(os.path.join(basefolder, folder,number, file))
-            dst_file = open(os.path.join(basefolder, folder,number, os.path.splitext(file)[0]+".tree"),"w+")
-            parse_dot2(src_file,dst_file)
-        print("done.")
+                parts = line.split("\t")
+                if len(parts) > 1:
+                    content = {"type": "", "code": ""}
+                    for part in parts[1:]:
+                        if part.startswith("type:"):
+                            content["type"] = part.split(":")[1]
+                        if part.startswith("code:"):
+                            content["code"] = part.split(":")[1]
+                    if content['type'] == '':
+                        type = line.split("type:")
+                        if len(type) > 1:
+                            content["type"] = type[1].replace("\\", "").split()[0]
+                    node = nodes[int(parts[0])] = Node(content["type"], content["code"], [])
+                    if node.type_id < 0:
+                        raise ValueError("{0} is not a known node type".format(node.type))
+        except Exception as e:
+            print(e)
+            print(getattr(src_file, "name", src_file))
+    return nodes, links
+
+
+def unknown_types(nodes):
+    '''sorted node types of nodes ({id: Node}) outside the cpp vocabulary'''
+    return sorted(set(node.type for node in nodes.values() if node.type_id < 0))
+
+
+def write_tree(dst_file, nodes, links):
+    out = [">{0}\t{1}\t{2}\n".format(key, node.type, node.code) for key, node in sorted(nodes.items())]
+    out.extend("<{0}={1}\n".format(key, ','.join(link)) for key, link in sorted(links.items()))
+    dst_file.write("".join(out))
 
 
-def get_dot_files(basefolder):
-    trees = []
-    users = []
-    problems = []
+def parse_dot2(src_file,dst_file):
+    write_tree(dst_file, *read_dot(src_file))
+
+
+def convert_dot_file(task):
+    '''convert one DOT file, the tree file is written to a temporary name and moved in place'''
+    src, dst = task
+    try:
+        with open(src) as src_file:
+            nodes, links = read_dot(src_file)
+        with atomic_write(dst) as dst_file:
+            write_tree(dst_file, nodes, links)
+        return src, len(nodes), unknown_types(nodes), None
+    except Exception as e:
+        return src, 0, [], e
+
+
+class ConversionJournal:
+    '''Append-only log of converted files (source path, size, mtime, node count and the node types
+    outside the vocabulary the tree was written with, comma separated), one line per file.
+
+    A rerun skips every source whose size and mtime match its journal line and whose output exists.
+    The journal is started over when the cpp vocabulary changes, so after a vocabulary change the
+    whole corpus is converted again.'''
+
+    def __init__(self, path):
+        self.path = path
+        self.header = "# vocabulary {0}\n".format(get_vocabulary("cpp").signature())
+        self.done = {}
+        if os.path.isfile(path):
+            with open(path) as file:
+                lines = file.readlines()
+            if len(lines) > 0 and lines[0] == self.header:
+                for line in lines[1:]:
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) in (4, 5):
+                        unknown = parts[4].split(",") if len(parts) == 5 and len(parts[4]) > 0 else []
+                        self.done[parts[0]] = (int(parts[1]), int(parts[2]), int(parts[3]), unknown)
+        if len(self.done) == 0:
+            # new journal, or one written for another vocabulary
+            self.file = open(path, "w")
+            self.file.write(self.header)
+            self.file.flush()
+        else:
+            self.file = open(path, "a")
+
+    def is_done(self, src, dst):
+        stat = os.stat(src)
+        entry = self.done.get(src)
+        return entry is not None and entry[:2] == (stat.st_size, stat.st_mtime_ns) and os.path.isfile(dst)
+
+    def add(self, src, nodes, unknown=()):
+        stat = os.stat(src)
+        self.done[src] = (stat.st_size, stat.st_mtime_ns, nodes, list(unknown))
+        self.file.write("{0}\t{1}\t{2}\t{3}\t{4}\n".format(src, stat.st_size, stat.st_mtime_ns, nodes, ",".join(unknown)))
+        self.file.flush()
+
+    def unknown_types(self):
+        '''source path -> node types outside the vocabulary, of the converted files that have any'''
+        return {src: entry[3] for src, entry in self.done.items() if len(entry[3]) > 0}
+
+    def close(self):
+        self.file.close()
+
+
+def convert_dot_files(tasks, journal_file, n_jobs=1, chunksize=16):
+    '''Convert (src, dst) DOT/tree pairs on a process pool, skipping the ones already in the journal.
+    Returns the number of converted files, nodes and failures.'''
+    journal = ConversionJournal(journal_file)
+    todo = [task for task in tasks if not journal.is_done(*task)]
+    print("{0} of {1} files already converted".format(len(tasks) - len(todo), len(tasks)))
+    n_jobs = n_processes(n_jobs)
+    files, nodes, failed = 0, 0, 0
+    start = time.time()
+    pool = Pool(n_jobs) if n_jobs > 1 else None
+    try:
+        results = pool.imap_unordered(convert_dot_file, todo, chunksize) if pool else map(convert_dot_file, todo)
+        progress = tqdm(results, total=len(todo))
+        for src, node_count, unknown, error in progress:
+            if error is not None:
+                failed += 1
+                print("ERROR: ", error, " filename", src)
+                continue
+            journal.add(src, node_count, unknown)
+            if len(unknown) > 0:
+                print("WARNING: node types {0} are not in the vocabulary, filename {1}".format(",".join(unknown), src))
+            files += 1
+            nodes += node_count
+            elapsed = max(time.time() - start, 1e-9)
+            progress.set_postfix(files_s="{0:.1f}".format(files / elapsed), nodes_s="{0:.0f}".format(nodes / elapsed))
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+        journal.close()
+    elapsed = max(time.time() - start, 1e-9)
+    print("converted {0} files, {1} nodes in {2:.1f}s ({3:.1f} files/s, {4:.0f} nodes/s), {5} failed".format(
+        files, nodes, elapsed, files / elapsed, nodes / elapsed, failed))
+    return files, nodes, failed
+
+
+def dot_tasks(basefolder, dstfolder=None):
+    '''(src, dst) pairs of a <author>/<number>/*.dot folder, trees are written next to their DOT file or
+    to dstfolder named <author>.<number>.<name>.tree as copy_trees does'''
+    tasks = []
     for folder in [f for f in os.listdir(basefolder) if os.path.isdir(os.path.join(basefolder,f))]:
         for number in os.listdir(os.path.join(basefolder, folder)):
             file = [filename for filename in os.listdir(os.path.join(basefolder, folder, number)) if
                     filename.endswith(".dot")][0]
-            trees.append(parse_dot(os.path.join(basefolder, folder, number, file)))
-            users.append(folder)
-    return np.array(trees),np.array(users),np.array(problems)
+            tree_file = os.path.splitext(file)[0] + ".tree"
+            if dstfolder is None:
+                dst = os.path.join(basefolder, folder, number, tree_file)
+            else:
+                dst = os.path.join(dstfolder, folder + "." + number + "." + tree_file)
+            tasks.append((os.path.join(basefolder, folder, number, file), dst))
+    return tasks
+
+
+def gen_tree_files(basefolder, dstfolder=None, n_jobs=1):
+    # the journal sits next to the output folder so dataset listings never pick it up
+    journal_file = (dstfolder if dstfolder is not None else basefolder).rstrip("/\\") + ".journal"
+    return convert_dot_files(dot_tasks(basefolder, dstfolder), journal_file, n_jobs=n_jobs)
 
 
 def traverse(basefolder):
@@ -250,4 +244,10 @@ dstfolder = R"C:\Users\bms\Files\current\research\stylemotry\stylemotery_code\da
 #     print(','.join(["'{0}'".format(s) for s in users[:max_authors]]))
 
 
-
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--src', '-s', type=str, required=True, help='Folder of <author>/<number>/*.dot files')
+    parser.add_argument('--dst', '-o', type=str, default=None, help='Flat output folder, defaults to next to each DOT file')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='Number of processes (-1 for all cores)')
+    args = parser.parse_args()
+    gen_tree_files(args.src, args.dst, n_jobs=args.jobs)
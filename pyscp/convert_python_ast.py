@@ -3,8 +3,8 @@
 import ast
 import os
 import pprint
-import uuid
 from copy import deepcopy
+from multiprocessing import Pool
 from operator import itemgetter
 
 import jsonpickle
@@ -13,69 +13,16 @@ from collections import defaultdict, Counter
 
 from tqdm import tqdm
 
-from ast_tree.tree_nodes import Node, print_dot_node, DotNodes, AstNodes, print_ast_node
-from ast_tree.traverse import tree_print, bfs, children
+from ast_tree.tree_nodes import Node, print_dot_node, DotNodes, AstNodes, print_ast_node, stamp_tree
+from ast_tree.tree_parser import parse_ast_tree
+from ast_tree.flat_tree import flatten_tree
+from ast_tree.traverse import tree_print
 import sys
 import numpy as np
 
-from utils.analysis_utils import max_depth, max_branch
-
-
-def parse_ast_tree(filename):
-    nodes = {}
-    links = {}
-    nodetypes = {}
-    for x in dir(ast):
-        try:
-            if isinstance(ast.__getattribute__(x)(), ast.AST):
-                nodetypes[x.lower()] = ast.__getattribute__(x)
-        except TypeError:
-            pass
-    for line in open(filename):
-        if line.startswith("<"):
-            parts = line[1:].strip("\n").split("=")
-            links[parts[0]] = parts[1].split(",")
-        elif line.startswith(">"):
-            parts = line[1:].strip("\n").split("\t")
-            nodes[parts[0]] = nodetypes[parts[1].lower()]()
-            nodes[parts[0]].children = []
-    root_nodes = []
-    for id, value in sorted(links.items()):
-        for link in value:
-            nodes[id].children.append(nodes[link])
-            root_nodes.append(link)
-
-    dot = AstNodes()
-    for node in nodes.values():
-        try:
-            dot.index(node)
-        except:
-            print(filename)
-    root_nodes = set(nodes.keys()) - set(root_nodes)
-    root_nodes = [nodes[id] for id in list(sorted(root_nodes))]
-
-    return nodes['0']
-
-def unify_children(node):
-    if not hasattr(node,"uuid"):
-        node.uuid = str(uuid.uuid4())
-    if not hasattr(node,"children"):
-        children = []
-        fields = []
-        for field, value in ast.iter_fields(node):
-            fields.append(field)
-            if isinstance(value, ast.AST):
-                children.append(unify_children(value))
-            elif isinstance(value, list):
-                for item in value:
-                    if isinstance(item, ast.AST):
-                        children.append(unify_children(item))
-        node.children = children
-        # for field in fields:
-        #     delattr(node,field)
-        # if hasattr(node, "_fields"):
-        #     delattr(node, "_fields")
-    return node
+from utils.analysis_utils import tree_stats
+from utils.job_utils import atomic_write, n_processes
+
 
 def ast_parse_file(filename):
     try:
@@ -86,7 +33,7 @@ def ast_parse_file(filename):
             #export trees
             # js = jsonpickle.encode(tree)
             # tree = json.loads(js)
-            return tree
+            return stamp_tree(tree)
     except Exception as e:
         print("ERROR: ", e, " filename", filename)
 
@@ -110,61 +57,57 @@ def parse_src_files(basefolder, seperate_trees=False,verbose=0):
         return X ,y,tags,AstNodes()
 
 
-def count_nodes(x,d,o):
-    o.append(1)
+def export_tree(tree):
+    '''Text of the python_trees format for an ast tree, the same text the uuid based exporter wrote.
 
+    Nodes are numbered by their pre-order position in a single iterative walk. ast.parse shares its
+    Load/Store/operator nodes between parents; a shared node is written once (where it first occurs)
+    with the position of its last occurrence, as the old exporter did by tagging node objects.'''
+    tree_nodes, parents = flatten_tree(tree)
+    numbers = {}
+    for position, node in enumerate(tree_nodes):
+        # the entry of a shared node keeps its first place and takes its last position
+        numbers[id(node)] = (node, position)
+    out = [">{0}\t{1}\n".format(number, type(node).__name__) for node, number in numbers.values()]
+    links = defaultdict(list)
+    for position in range(1, len(tree_nodes)):
+        links[numbers[id(tree_nodes[parents[position]])][1]].append(numbers[id(tree_nodes[position])][1])
+    for parent, child_ids in links.items():
+        out.append("<{0}={1}\n".format(parent, ",".join(map(str, child_ids))))
+    return "".join(out)
 
 
-def convert_src_files(basefolder):
-    X_names, y, problems = get_ast_src_files(basefolder)
-    X ,y,tags = np.array([ast_parse_file(name) for name in tqdm(X_names)]), np.array(y), problems
-    for name,tree in zip(X_names,X):
-        name = os.path.basename(name)
-        tree = unify_children(tree)
-        # print(1)
-        with open(os.path.join("..","dataset","python_trees",os.path.splitext(name)[0]+".tree"),"+w") as file:
-            cc = []
-            coun = len(bfs(tree,callback=count_nodes,out=cc))
-            node_ids = nodes_ids(tree)
-            node_links = nodes_links(node_ids, tree)
-            for k,(v,l) in node_ids.items():
-                file.write(">{0}\t{1}\n".format(l,type(v).__name__))
-            for k,v in node_links.items():
-                file.write("<{0}={1}\n".format(str(k),",".join([str(i) for i in v])))
-
-c = 0
-def nodes_ids(tree):
-    def nodes_ids_lambda(x, d, o):
-        global c
-        o[x.uuid] = (x, c)
-        c += 1
-        return o
-    global c
-    c = 0
-    ids = {}
-    bfs(tree, callback=nodes_ids_lambda, mode="all", out=ids)
-    # for x,id in node_ids:
-    #     links[id].append()
-    return ids
-
-def nodes_links(node_ids,tree):
-    def nodes_links_lambda(x, d, o):
-        for child in children(x):
-            o[node_ids[x.uuid][1]].append(node_ids[child.uuid][1])
-        return o
+def convert_src_file(task):
+    src, dst = task
+    tree = ast_parse_file(src)
+    if tree is None:
+        return src, False
+    with atomic_write(dst) as file:
+        file.write(export_tree(tree))
+    return src, True
 
-    links = defaultdict(list)
-    bfs(tree, callback=nodes_links_lambda, mode="all", out=links)
-    # for x,id in node_ids:
-    #     links[id].append()
-    return links
+
+def convert_src_files(basefolder, dstfolder=os.path.join("..","dataset","python_trees"), n_jobs=1):
+    '''export every python file of basefolder as a .tree file in dstfolder, n_jobs processes at once'''
+    X_names, y, problems = get_ast_src_files(basefolder)
+    tasks = [(name, os.path.join(dstfolder, os.path.splitext(os.path.basename(name))[0] + ".tree")) for name in X_names]
+    n_jobs = n_processes(n_jobs)
+    if n_jobs > 1:
+        with Pool(n_jobs) as pool:
+            results = list(tqdm(pool.imap_unordered(convert_src_file, tasks, 16), total=len(tasks)))
+    else:
+        results = [convert_src_file(task) for task in tqdm(tasks)]
+    failed = [src for src, ok in results if not ok]
+    if len(failed) > 0:
+        print("ERROR: {0} of {1} files failed to convert".format(len(failed), len(tasks)))
 
 
 def test_main():
     dataset_folder = os.path.join("..", "dataset", "python_trees")
     trees, tree_labels, lable_problems, tree_nodes = parse_src_files(dataset_folder, False)
-    depths = np.array([max_depth(x) for x in trees])
-    branches = np.array([max_branch(x) for x in trees])
+    stats = tree_stats(trees, tree_labels)
+    depths = stats["max_depth"]
+    branches = stats["max_branch"]
     print(list(depths))
     print(np.mean(depths))
     print(np.mean(branches))
@@ -173,8 +116,9 @@ def test_main():
     tree_6 = trees[10]
     dataset_folder = os.path.join("..", "dataset", "python")
     trees, tree_labels, lable_problems, tree_nodes = parse_src_files(dataset_folder, False)
-    depths = np.array([max_depth(x) for x in trees])
-    branches = np.array([max_branch(x) for x in trees])
+    stats = tree_stats(trees, tree_labels)
+    depths = stats["max_depth"]
+    branches = stats["max_branch"]
     print(list(depths))
     print(np.mean(depths))
     print(np.mean(branches))
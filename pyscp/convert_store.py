@@ -0,0 +1,14 @@
+import argparse
+import os
+
+from utils.dataset_utils import convert_tree_files
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dataset', '-d', type=str, default="cpp", help='Dataset folder to convert (python, python_trees or cpp)')
+    parser.add_argument('--output', '-o', type=str, default=None, help='Store folder, defaults to <dataset>.store')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='Number of processes used to parse the dataset (-1 for all cores)')
+    args = parser.parse_args()
+
+    path = convert_tree_files(os.path.join("..", "dataset", args.dataset), args.output, n_jobs=args.jobs)
+    print("saved", path)
@@ -5,8 +5,9 @@ from operator import itemgetter
 import matplotlib.pyplot as plt
 import numpy as np
 
-from utils.analysis_utils import max_depth, max_branch
-from utils.dataset_utils import parse_src_files
+from ast_tree.tree_nodes import AstNodes, DotNodes
+from utils.analysis_utils import saved_tree_stats, tree_stats
+from utils.dataset_utils import parse_src_files, src_files
 
 # def max_depth(ast_tree):
 #     def max_depth_lambda(x, d, o):
@@ -110,22 +111,22 @@ def plot_class_dists(name, depths, branches,labels, max_len=1000,base_folder=Non
     figure.clear()
     plt.close()
 
-def labels_ratio(X,y,min_depth=5,min_branch=5):
+def labels_ratio(X,y,min_depth=5,min_branch=5,stats=None):
     print("Before:")
     print("Class ratio :- %s\n" % list(
         sorted([(t, c, "%.2f" % (c / len(y))) for t, c in collections.Counter(y).items()], key=itemgetter(0),
                reverse=False)))
-    depths = np.array([max_depth(x) for x in X])
-    branches = np.array([max_branch(x) for x in X])
-    bool_vec = (depths >= min_depth) & (branches >= min_branch)
+    if stats is None:
+        stats = tree_stats(X, y)
+    bool_vec = (stats["max_depth"] >= min_depth) & (stats["max_branch"] >= min_branch)
     X = X[bool_vec]
     y = y[bool_vec]
     print("After:")
     print("Class ratio :- %s\n" % list(
         sorted([(t, c, "%.2f" % (c / len(y))) for t, c in collections.Counter(y).items()], key=itemgetter(0),
                reverse=False)))
-    depths = np.array([max_depth(x) for x in X])
-    branches = np.array([max_branch(x) for x in X])
+    depths = stats["max_depth"][bool_vec]
+    branches = stats["max_branch"][bool_vec]
     plot_dists("Single Tree", depths, branches, max_len=10)
 
 
@@ -133,7 +134,15 @@ def labels_ratio(X,y,min_depth=5,min_branch=5):
 if __name__ == "__main__":
     dataset = "cpp"
     # train = "70_authors.labels1.txt"
-    X, y, tags,features = parse_src_files(os.path.join("dataset",dataset),seperate_trees=False,verbose=0)
+    folder = os.path.join("dataset", dataset)
+    stats_file = os.path.join("dataset", dataset + ".stats.npz")
+    # the stats table is saved next to the dataset, the corpus is only parsed when its files changed
+    files, _, _ = src_files(folder)
+    features = DotNodes() if dataset.endswith("cpp") else AstNodes()
+    stats = saved_tree_stats(stats_file, files, features)
+    if stats is None:
+        X, y, tags,features = parse_src_files(folder,seperate_trees=False,verbose=0)
+        stats = tree_stats(X, y, features, filename=stats_file, files=files)
     # rand_seed, classes = read_train_config(os.path.join("train", dataset, train))
     # X, y = pick_subsets(X, y, classes=classes)
     # for file in os.listdir(os.path.join("train","cpp")):
@@ -142,9 +151,9 @@ if __name__ == "__main__":
     #     X, y = pick_subsets(X_e, y_e, classes=classes)
     #     print("Class ratio :- %s" % list(sorted([(t, c, c / len(y)) for t, c in collections.Counter(y).items()], key=itemgetter(0),reverse=False)))
     #     print()
-    # X = make_binary_tree(unified_ast_trees(X), 9)
-    depths = np.array([max_depth(x) for x in X])
-    branches = np.array([max_branch(x) for x in X])
+    # X = make_binary_tree(X, 9, features)
+    depths = stats["max_depth"]
+    branches = stats["max_branch"]
 
     print(np.mean(depths))
     print(np.mean(branches))
@@ -153,6 +162,7 @@ if __name__ == "__main__":
     # print("labels  : ",len(y))
     # print("classes : ",classes)
     # print("{0:<20}\t{1:<10}\t{2:<10}".format("label","Depth","Branch"))
-    # for c in np.unique(y):
-    #     print("{0:<20}\t{1:<10}\t{2:<10}".format(c,np.mean(depths[y == c]),np.mean(branches[y == c])))
+    # authors, author_stats = stats.by_author()
+    # for c, depth, branch in zip(authors, author_stats["max_depth_mean"], author_stats["max_branch_mean"]):
+    #     print("{0:<20}\t{1:<10}\t{2:<10}".format(c, depth, branch))
     # labels_ratio(X,y,min_depth=5,min_branch=5)
@@ -75,6 +75,10 @@ def main_eval(pipline,X,y,tags, cv=None,output=sys.stdout):
     # ratio = [(i, Counter(y)[i] / float(len(y)) * 100.0) for i in Counter(y).most_common()]
     # print("\t\t all users ratio ",ratio)
 
+    # count the trees once, every fold then only slices the counted rows
+    vectorizer = pipline.steps[0][1]
+    if hasattr(vectorizer, "count"):
+        vectorizer.count(X)
     accuracy = []
     for idx, (train, test) in enumerate(cv.split(X,y)):
         pipline.fit(X[train], y[train])
@@ -102,6 +106,10 @@ def exp_relax(pipline,X,y,tags, relax=[],cv=None,output=sys.stdout):
     # ratio = [(i, Counter(y)[i] / float(len(y)) * 100.0) for i in Counter(y).most_common()]
     # print("\t\t all users ratio ",ratio)
 
+    # count the trees once, every fold then only slices the counted rows
+    vectorizer = pipline.steps[0][1]
+    if hasattr(vectorizer, "count"):
+        vectorizer.count(X)
     accuracy = [[] for i in relax]
     for idx, (train, test) in enumerate(cv.split(X,y)):
         pipline.fit(X[train], y[train])
@@ -253,6 +261,10 @@ if __name__ == "__main__":
     parser.add_argument('--classes', '-c', type=int, default=-1, help='How many classes to include in this experiment')
     parser.add_argument('--folds', '-fo', type=int, default=5, help='Number of folds')
     parser.add_argument('--folder', '-f', type=str, default="RF", help='Base folder for logs and results')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='Number of processes used to parse and vectorize the dataset (-1 for all cores)')
+    parser.add_argument('--cache', action='store_true', default=False, help='Reuse parsed trees from the dataset parse cache')
+    parser.add_argument('--manifest', action='store_true', default=False, help='List the dataset files from its manifest')
+    parser.add_argument('--dag', action='store_true', default=False, help='Share identical subtrees between the loaded trees')
 
     # train_labels = [
     #                 ("RF_250_sep_05_labels1","5_authors.labels1.txt"),
@@ -287,10 +299,14 @@ if __name__ == "__main__":
     exper_name = args.name
     output_folder = os.path.join("results",args.folder)  # args.folder  #R"C:\Users\bms\PycharmProjects\stylemotery_code" #
     dataset_folder = os.path.join("dataset", args.dataset)
-    trees, tree_labels, lable_problems, features = parse_src_files(dataset_folder,seperate_trees=False)
+    if args.train:
+        rand_seed, classes = read_train_config(os.path.join("train", args.dataset.split("_")[0], args.train))
+    else:
+        classes = None
+    trees, tree_labels, lable_problems, features = parse_src_files(dataset_folder,seperate_trees=False,n_jobs=args.jobs,cache=args.cache,manifest=args.manifest,classes=classes,dag=args.dag)
     #print(len(trees))
     pipline = Pipeline([
-        ('astvector', ASTVectorizer(features, ngram=2, v_skip=0, normalize=True, idf=True, dtype=np.float32)),
+        ('astvector', ASTVectorizer(features, ngram=2, v_skip=0, normalize=True, idf=True, dtype=np.float32, n_jobs=args.jobs)),
         ('selection', TopRandomTreesEmbedding(k=1000, n_estimators=1500, max_depth=20)),
         # PredefinedFeatureSelection()),
         # ('randforest',LinearSVC(penalty='l2', loss='squared_hinge', dual=True, tol=0.0001, C=1.0, multi_class='ovr'))])
@@ -303,7 +319,6 @@ if __name__ == "__main__":
     print()
     print(exper_name, flush=True)
     if args.train:
-        rand_seed, classes = read_train_config(os.path.join("train", args.dataset.split("_")[0], args.train))
         trees_subset, tree_labels_subset = pick_subsets(trees, tree_labels, classes=classes)
         #print(tree_labels_subset)
         #print(classes)
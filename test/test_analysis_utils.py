@@ -0,0 +1,91 @@
+import ast
+import inspect
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from ast_tree.flat_tree import FlatTree
+from ast_tree.tree_nodes import AstNodes, DotNodes, Node, stamp_tree
+from utils.analysis_utils import (TreeStats, avg_branch, avg_depth, max_branch, max_depth, saved_tree_stats,
+                                  tree_stats)
+
+SOURCES = ["import os\nx = 1\n", "def f(a):\n    if a:\n        return [i for i in a]\nprint(f(2))\n",
+           inspect.getsource(inspect)]
+
+
+class TestTreeStats(unittest.TestCase):
+    def setUp(self):
+        self.nodes = AstNodes()
+        self.trees = [stamp_tree(ast.parse(source)) for source in SOURCES]
+
+    def check(self, stats):
+        self.assertEqual(list(stats["max_depth"]), [max_depth(tree) for tree in self.trees])
+        self.assertEqual(list(stats["max_branch"]), [max_branch(tree) for tree in self.trees])
+        self.assertEqual(list(stats["avg_depth"].astype(int)), [avg_depth(tree) for tree in self.trees])
+        self.assertEqual(list(stats["avg_branch"].astype(int)), [avg_branch(tree) for tree in self.trees])
+
+    def test_same_as_functions(self):
+        self.check(TreeStats.from_trees(self.trees))
+        flat = TreeStats.from_trees([FlatTree.from_tree(tree, self.nodes) for tree in self.trees], nodes=self.nodes)
+        self.check(flat)
+        self.assertEqual(flat.type_depths.sum(), flat["nodes"].sum())
+
+    def test_unparsed_files(self):
+        stats = TreeStats.from_trees([None, Node("Program", "", [Node("FunctionDef", "f", [])])], nodes=DotNodes())
+        self.assertEqual(list(stats["nodes"]), [0, 2])
+        self.assertEqual(list(stats["max_depth"]), [0, 1])
+
+    def test_by_author(self):
+        stats = TreeStats.from_trees(self.trees, ["a", "b", "a"])
+        authors, table = stats.by_author()
+        self.assertEqual(list(authors), ["a", "b"])
+        self.assertEqual(list(table["trees"]), [2, 1])
+        self.assertEqual(table["max_depth_max"][0], max(max_depth(self.trees[0]), max_depth(self.trees[2])))
+
+
+class TestSavedStats(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.files = []
+        for idx, source in enumerate(SOURCES):
+            self.files.append(os.path.join(self.folder, "p{0}.a.py".format(idx)))
+            with open(self.files[-1], "w") as file:
+                file.write(source)
+        self.filename = os.path.join(self.folder, "python.stats.npz")
+        self.nodes = AstNodes()
+        self.trees = [stamp_tree(ast.parse(source)) for source in SOURCES]
+        self.stats = tree_stats(self.trees, ["a", "b", "a"], self.nodes, filename=self.filename, files=self.files)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_checked_before_parsing(self):
+        saved = saved_tree_stats(self.filename, self.files, self.nodes)
+        self.assertIsNotNone(saved)
+        for name in self.stats.columns:
+            self.assertTrue(np.array_equal(saved[name], self.stats[name]))
+        self.assertEqual(list(saved.labels), ["a", "b", "a"])
+        self.assertTrue(np.array_equal(saved.type_depths, self.stats.type_depths))
+
+    def test_changed_files(self):
+        with open(self.files[0], "a") as file:
+            file.write("y = 2\n")
+        self.assertIsNone(saved_tree_stats(self.filename, self.files, self.nodes))
+        self.assertIsNone(saved_tree_stats(self.filename, self.files[::-1], self.nodes))
+        renamed = os.path.join(self.folder, "p9.a.py")
+        os.rename(self.files[1], renamed)
+        self.assertIsNone(saved_tree_stats(self.filename, [self.files[0], renamed, self.files[2]], self.nodes))
+
+    def test_reused(self):
+        self.assertIsNone(saved_tree_stats(os.path.join(self.folder, "missing.npz"), self.files))
+        reused = tree_stats(self.trees, ["a", "b", "a"], self.nodes, filename=self.filename, files=self.files)
+        self.assertEqual(reused.key, self.stats.key)
+        relabeled = tree_stats(self.trees, ["a", "a", "a"], self.nodes, filename=self.filename, files=self.files)
+        self.assertEqual(list(relabeled.labels), ["a", "a", "a"])
+
+
+if __name__ == "__main__":
+    unittest.main()
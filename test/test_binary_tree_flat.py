@@ -0,0 +1,97 @@
+import ast
+import copy
+import inspect
+import random
+import unittest
+
+from ast_tree.flat_tree import FlatTree
+from ast_tree.traverse import bfs, children
+from ast_tree.tree_nodes import AstNodes, DotNodes, Node, stamp_tree
+from utils.dataset_utils import binary_tree, make_binary_tree
+
+TYPES = ["CompoundStatement", "ExpressionStatement", "CallExpression", "Argument", "Identifier", "IfStatement"]
+
+
+def old_make_binary_tree(trees, max_branches=10):
+    '''the recursive, copying make_binary_tree binary_tree replaced, kept as the reference; its extra
+    nodes are split with its default of 2 children'''
+    def make_binary_tree(src_tree, dst_tree, max_branches=2):
+        childs = list(children(src_tree))
+        if len(childs) > 0:
+            dst_tree.children.extend(childs[:max_branches])
+            if len(childs) - max_branches > 0:
+                if len(childs) - max_branches == 1:
+                    dst_tree.children.append(childs[-1])
+                else:
+                    dst_node = copy.copy(dst_tree)
+                    dst_node.children = []
+                    src_node = copy.copy(dst_tree)
+                    src_node.children = childs[max_branches:]
+                    dst_tree.children.append(make_binary_tree(src_node, dst_node))
+            for idx, child in enumerate(children(dst_tree)):
+                dst_child = copy.copy(child)
+                dst_child.children = []
+                dst_tree.children[idx] = make_binary_tree(child, dst_child, max_branches)
+        return dst_tree
+
+    dst_trees = []
+    for tree in trees:
+        root = copy.copy(tree)
+        root.children = []
+        dst_trees.append(make_binary_tree(tree, root, max_branches))
+    return dst_trees
+
+
+def random_tree(rng, depth):
+    kids = [random_tree(rng, depth - 1) for _ in range(rng.choice([0, 1, 2, 3, 5, 8]))] if depth > 0 else []
+    return Node(rng.choice(TYPES), "x", kids)
+
+
+def walk(tree, nodes):
+    return bfs(tree, lambda node, depth, out: out.append((nodes.index(node), len(children(node)), depth)), out=[])
+
+
+def max_children(tree):
+    return max(len(children(node)) for node, _ in bfs(tree, lambda node, depth, out: out.append((node, depth)), out=[]))
+
+
+class TestBinaryTree(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(0)
+        self.nodes = DotNodes()
+        self.trees = [random_tree(rng, 4) for _ in range(20)]
+
+    def test_same_as_old_at_two(self):
+        for tree, old in zip(self.trees, old_make_binary_tree(self.trees, 2)):
+            self.assertEqual(walk(binary_tree(tree, self.nodes, 2), self.nodes), walk(old, self.nodes))
+
+    def test_max_branches(self):
+        for max_branches in (2, 3, 5):
+            for tree in self.trees:
+                binary = binary_tree(tree, self.nodes, max_branches)
+                self.assertIsInstance(binary, FlatTree)
+                # a single extra child is kept as is
+                self.assertLessEqual(max_children(binary), max_branches + 1)
+                leaves = [t for t, kids, _ in walk(binary, self.nodes) if kids == 0]
+                self.assertEqual(leaves, [t for t, kids, _ in walk(tree, self.nodes) if kids == 0])
+
+    def test_tree_not_modified(self):
+        before = [walk(tree, self.nodes) for tree in self.trees]
+        make_binary_tree(self.trees, 2)
+        self.assertEqual([walk(tree, self.nodes) for tree in self.trees], before)
+
+    def test_python_and_deep_trees(self):
+        tree = stamp_tree(ast.parse(inspect.getsource(inspect)))
+        binary = make_binary_tree([tree, None], 2)
+        self.assertIs(binary[0].nodes.__class__, AstNodes)
+        self.assertIsNone(binary[1])
+        # a chain far deeper than the recursion limit, every level has 3 leaves and the next level so
+        # each one gains an extra node at max_branches=2
+        deep = Node("Identifier", "x", [])
+        for _ in range(5000):
+            deep = Node("CompoundStatement", "", [Node("Identifier", "x", []) for _ in range(3)] + [deep])
+        self.assertEqual(binary_tree(deep, self.nodes, 2).size(), 5000 * 5 + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,170 @@
+import io
+import os
+import random
+import re
+import shutil
+import tempfile
+import unittest
+from collections import defaultdict
+
+from ast_tree.tree_nodes import Node
+from ast_tree.tree_parser import parse_tree
+from pyscp.convert_cpp import ConversionJournal, gen_tree_files, parse_dot2
+
+TYPES = ["FunctionDef", "CompoundStatement", "IfStatement", "CallExpression", "Identifier", "ReturnStatement"]
+
+
+def old_parse_dot2(src_file, dst_file):
+    '''the whole-file parse_dot2 the streaming records replaced, kept as the reference'''
+    split = "\t"
+    structs = []
+    for line in src_file:
+        if line.startswith("//"):
+            continue
+        if line.startswith("strict graph"):
+            structs.append(line)
+        else:
+            structs[-1] += line
+    lines = []
+    noTab = False
+    for struct in structs:
+        for line in struct.split("\n"):
+            if line.startswith("\t"):
+                lines.append(line.strip().replace("\n", split))
+            elif len(lines) > 0:
+                if line.startswith("type:\\"):
+                    lines[-1] = lines[-1] + split + line[:5].replace("\n", split).strip()
+                    noTab = True
+                elif noTab:
+                    lines[-1] = lines[-1] + line.replace("\n", split).strip()
+                    noTab = False
+                else:
+                    lines[-1] = lines[-1] + split + line.replace("\n", split).strip()
+        lines.append("")
+    nodes = {}
+    links = defaultdict(list)
+    for line in lines:
+        if len(line) > 0 and line[0].isdigit():
+            if "--" in line[:10]:
+                numbers = re.compile(R"[^\d-]+").sub('', line).split("--")
+                links[int(numbers[0].strip())].append(numbers[1].strip())
+            else:
+                parts = line.split("\t")
+                if len(parts) > 1:
+                    content = {"type": "", "code": ""}
+                    for part in parts[1:]:
+                        if part.startswith("type:"):
+                            content["type"] = part.split(":")[1]
+                        if part.startswith("code:"):
+                            content["code"] = part.split(":")[1]
+                    nodes[int(parts[0])] = Node(content["type"], content["code"], [])
+    for key, node in sorted(nodes.items()):
+        dst_file.write(">{0}\t{1}\t{2}\n".format(key, node.type, node.code))
+    for key, link in sorted(links.items()):
+        dst_file.write("<{0}={1}\n".format(key, ','.join(link)))
+
+
+def joern_dot(rng, graphs):
+    '''DOT text as Joern writes it, including types split over two lines after "type:\\"'''
+    out = ["// generated\n"]
+    next_id = 1
+    for _ in range(graphs):
+        nodes, edges = [], []
+        for _ in range(rng.randint(1, 3)):
+            stack = [(None, 3)]
+            while stack:
+                parent, depth = stack.pop()
+                id = next_id
+                next_id += 1
+                type = rng.choice(TYPES)
+                if rng.random() < 0.2:
+                    nodes.append("\t{0}\ntype:\\\n{1}\ncode:{2}\n".format(id, type, rng.choice(["", "x"])))
+                else:
+                    nodes.append("\t{0}\ntype:{1}\ncode:{2}\n".format(id, type, rng.choice(["", "x", "a b"])))
+                if parent is not None:
+                    edges.append("\t{0} -- {1} ;\n".format(parent, id))
+                if depth > 0:
+                    stack.extend((id, depth - 1) for _ in range(rng.randint(0, 3)))
+        rng.shuffle(nodes)
+        out.append("strict graph {\n" + "".join(nodes) + "".join(edges) + "}\n")
+    return "".join(out)
+
+
+def convert(convert_fn, text):
+    out = io.StringIO()
+    convert_fn(io.StringIO(text), out)
+    return out.getvalue()
+
+
+class TestConvertCpp(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(0)
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_same_as_old_converter(self):
+        for graphs in (1, 1, 2, 3):
+            text = joern_dot(self.rng, graphs)
+            self.assertEqual(convert(parse_dot2, text), convert(old_parse_dot2, text))
+
+    def make_corpus(self):
+        src = os.path.join(self.folder, "dots")
+        for author in range(3):
+            for number in range(2):
+                os.makedirs(os.path.join(src, "author{0}".format(author), str(number)))
+                with open(os.path.join(src, "author{0}".format(author), str(number), "components.dot"), "w") as file:
+                    file.write(joern_dot(self.rng, 1))
+        return src
+
+    def test_resumed_conversion(self):
+        src = self.make_corpus()
+        dst = os.path.join(self.folder, "cpp")
+        os.makedirs(dst)
+        files, nodes, failed = gen_tree_files(src, dst, n_jobs=2)
+        self.assertEqual((files, failed), (6, 0))
+        names = sorted(os.listdir(dst))
+        self.assertEqual(names[0], "author0.0.components.tree")
+        for name in names:
+            author, number = name.split(".")[:2]
+            with open(os.path.join(src, author, number, "components.dot")) as file:
+                expected = convert(old_parse_dot2, file.read())
+            with open(os.path.join(dst, name)) as file:
+                self.assertEqual(file.read(), expected)
+            self.assertEqual(parse_tree(os.path.join(dst, name))[0].type, "Program")
+        self.assertEqual(gen_tree_files(src, dst), (0, 0, 0))
+        with open(os.path.join(src, "author1", "0", "components.dot"), "a") as file:
+            file.write("\n")
+        os.remove(os.path.join(dst, "author2.1.components.tree"))
+        self.assertEqual(gen_tree_files(src, dst)[0], 2)
+
+    def test_journal_appended(self):
+        src = self.make_corpus()
+        dst = os.path.join(self.folder, "cpp")
+        os.makedirs(dst)
+        gen_tree_files(src, dst)
+        with open(dst + ".journal") as file:
+            journal = file.read()
+        os.remove(os.path.join(dst, "author0.1.components.tree"))
+        gen_tree_files(src, dst)
+        with open(dst + ".journal") as file:
+            lines = file.read()[len(journal):].splitlines()
+        self.assertEqual([line.split("\t")[0] for line in lines], [os.path.join(src, "author0", "1", "components.dot")])
+
+    def test_unknown_type(self):
+        src = self.make_corpus()
+        unknown = os.path.join(src, "author1", "1", "components.dot")
+        with open(unknown, "w") as file:
+            file.write("strict graph {\n\t1\ntype:NotAType\ncode:x\n\t2\ntype:Identifier\ncode:y\n\t1 -- 2 ;\n}\n")
+        dst = os.path.join(self.folder, "cpp")
+        os.makedirs(dst)
+        # the file is converted with its unknown node and the type is recorded in the journal
+        self.assertEqual(gen_tree_files(src, dst)[::2], (6, 0))
+        self.assertEqual(convert(parse_dot2, open(unknown).read()), ">1\tNotAType\tx\n>2\tIdentifier\ty\n<1=2\n")
+        journal = ConversionJournal(dst + ".journal")
+        self.assertEqual(journal.unknown_types(), {unknown: ["NotAType"]})
+        journal.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import ast
+import inspect
+import unittest
+import uuid
+from collections import defaultdict
+
+import numpy as np
+
+from ast_tree.traverse import children
+from ast_tree.tree_parser import parse_ast_tree
+from pyscp.convert_python_ast import export_tree
+
+
+def old_export_tree(tree):
+    '''the uuid based exporter export_tree replaced, kept as the reference of the format'''
+    def unify_children(node):
+        if not hasattr(node, "uuid"):
+            node.uuid = str(uuid.uuid4())
+        if not hasattr(node, "children"):
+            node.children = [unify_children(child) for child in children(node)]
+        return node
+
+    def walk(node, callback):
+        callback(node)
+        for child in node.children:
+            walk(child, callback)
+
+    tree = unify_children(tree)
+    ids = {}
+    count = [0]
+
+    def set_id(node):
+        ids[node.uuid] = (node, count[0])
+        count[0] += 1
+
+    walk(tree, set_id)
+    links = defaultdict(list)
+    walk(tree, lambda node: links[ids[node.uuid][1]].extend(ids[child.uuid][1] for child in node.children)
+         if node.children else None)
+    out = [">{0}\t{1}\n".format(number, type(node).__name__) for node, number in ids.values()]
+    out.extend("<{0}={1}\n".format(parent, ",".join(str(i) for i in child_ids)) for parent, child_ids in links.items())
+    return "".join(out)
+
+
+class TestExportTree(unittest.TestCase):
+    def check_source(self, source):
+        self.assertEqual(export_tree(ast.parse(source)), old_export_tree(ast.parse(source)))
+
+    def test_shared_context_nodes(self):
+        # every Name shares the same Load/Store node, every + the same Add node
+        self.check_source("x = a + b + c\ny = x\nx += y - 1\n")
+
+    def test_type_names(self):
+        text = export_tree(ast.parse("try:\n    pass\nexcept E:\n    a and b\n"))
+        self.assertIn("\tExceptHandler\n", text)
+        self.assertIn("\tBoolOp\n", text)
+
+    def test_library_sources(self):
+        for module in (ast, inspect, unittest.case, np.lib.npyio):
+            self.check_source(inspect.getsource(module))
+
+    def test_parse_back(self):
+        tree = ast.parse("def f(a):\n    return [i for i in a if i]\n")
+        parsed = parse_ast_tree(None, lines=export_tree(tree).splitlines(True))
+        self.assertEqual(export_tree(parsed), export_tree(tree))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import os
+import pickle
+import shutil
+import tarfile
+import tempfile
+import unittest
+import zipfile
+
+from ast_tree.traverse import bfs
+from utils.corpus_archive import CorpusArchive, archive_folder, is_archive, open_archive
+from utils.dataset_utils import parse_src_files
+
+CPP_TREE = ">1\tFunctionDef\tmain\n>2\tCompoundStatement\t\n>3\tReturnStatement\t\n<1=2\n<2=3\n"
+
+
+def labels(tree):
+    return bfs(tree, lambda node, depth, out: out.append((type(node).__name__, getattr(node, "code", None), depth)),
+               out=[])
+
+
+def make_folder(folder, kind, newline=None):
+    os.makedirs(folder)
+    for idx in range(7):
+        if kind == "python":
+            name, text = "p{0}.user{1}.py".format(idx, idx % 3), "x = {0}\n".format(idx) * (idx + 1)
+        else:
+            name, text = "user{0}.p{1}.tree".format(idx % 3, idx), CPP_TREE * (idx % 2 + 1)
+        with open(os.path.join(folder, name), "w", newline=newline) as file:
+            file.write(text)
+
+
+def make_archive(folder, path):
+    if path.endswith(".zip"):
+        with zipfile.ZipFile(path, "w") as archive:
+            for name in sorted(os.listdir(folder)):
+                archive.write(os.path.join(folder, name), "corpus/" + name)
+    else:
+        with tarfile.open(path, "w:gz" if path.endswith(".gz") else "w") as archive:
+            archive.add(folder, "corpus")
+    return path
+
+
+def by_name(X, y, tags):
+    return sorted((tag, label, labels(tree)) for tree, label, tag in zip(X, y, tags))
+
+
+class TestCorpusArchive(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.python = os.path.join(self.folder, "python")
+        make_folder(self.python, "python")
+        self.cpp = os.path.join(self.folder, "cpp")
+        make_folder(self.cpp, "cpp")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def archive(self, name, folder):
+        return make_archive(folder, os.path.join(self.folder, "archives", name))
+
+    def test_names(self):
+        self.assertEqual(archive_folder("dataset/cpp.tar.gz"), "dataset/cpp")
+        self.assertEqual(archive_folder("dataset/python.zip"), "dataset/python")
+        self.assertFalse(is_archive(self.python))
+
+    def test_same_as_folder(self):
+        os.makedirs(os.path.join(self.folder, "archives"))
+        for folder in (self.python, self.cpp):
+            X, y, tags, _ = parse_src_files(folder)
+            expected = by_name(X, y, tags)
+            for ext in (".zip", ".tar", ".tar.gz"):
+                path = self.archive(os.path.basename(folder) + ext, folder)
+                self.assertEqual(by_name(*parse_src_files(path)[:3]), expected, path)
+                self.assertEqual(by_name(*parse_src_files(path, n_jobs=2)[:3]), expected, path)
+                self.assertEqual(by_name(*parse_src_files(path, lazy=True)[:3]), expected, path)
+
+    def test_crlf_members(self):
+        os.makedirs(os.path.join(self.folder, "archives"))
+        expected = by_name(*parse_src_files(self.cpp)[:3])
+        crlf = os.path.join(self.folder, "crlf", "cpp")
+        make_folder(crlf, "cpp", newline="\r\n")
+        self.assertEqual(by_name(*parse_src_files(crlf)[:3]), expected)
+        for ext in (".zip", ".tar", ".tar.gz"):
+            path = self.archive("cpp" + ext, crlf)
+            self.assertEqual(by_name(*parse_src_files(path)[:3]), expected, path)
+
+    def test_members(self):
+        os.makedirs(os.path.join(self.folder, "archives"))
+        for ext in (".zip", ".tar", ".tar.gz"):
+            archive = CorpusArchive(self.archive("python" + ext, self.python))
+            self.assertEqual(sorted(archive.members), sorted("corpus/" + name for name in os.listdir(self.python)))
+            with open(os.path.join(self.python, "p3.user0.py")) as file:
+                self.assertEqual(archive.read_text("corpus/p3.user0.py"), file.read())
+            archive.close()
+
+    def test_tar_index(self):
+        os.makedirs(os.path.join(self.folder, "archives"))
+        path = self.archive("python.tar", self.python)
+        archive = CorpusArchive(path)
+        self.assertTrue(os.path.isfile(path + ".index"))
+        self.assertFalse(archive.compressed)
+        with open(os.path.join(self.python, "p1.user1.py"), "a") as file:
+            file.write("y = 2\n")
+        # a changed archive is indexed again
+        path = self.archive("python.tar", self.python)
+        archive = CorpusArchive(path)
+        self.assertTrue(archive.read_text("corpus/p1.user1.py").endswith("y = 2\n"))
+
+    def test_pickle(self):
+        os.makedirs(os.path.join(self.folder, "archives"))
+        archive = open_archive(self.archive("python.zip", self.python))
+        self.assertIs(pickle.loads(pickle.dumps(archive)), archive)
+
+
+if __name__ == "__main__":
+    unittest.main()
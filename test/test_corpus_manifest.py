@@ -0,0 +1,110 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from ast_tree.tree_parser import ast_parse_file
+from utils.analysis_utils import tree_size_depth
+from utils.corpus_manifest import CorpusManifest, split_ast_name, split_dot_name
+from utils.dataset_utils import build_manifest, get_ast_src_files, parse_src_files, src_files
+
+
+class TestNames(unittest.TestCase):
+    def test_split(self):
+        self.assertEqual(split_ast_name("p12.some.user.py"), ("some user", "p12"))
+        self.assertEqual(split_dot_name("user.p12.dot"), ("user", "p12"))
+        # stray files without a dot, as get_ast_src_files split them
+        self.assertEqual(split_ast_name("README"), ("", ""))
+        self.assertEqual(split_dot_name("README"), ("", ""))
+
+
+class RecordingEntry(dict):
+    '''manifest entry that records the paths of the entries read for more than their author'''
+    read = set()
+
+    def __getitem__(self, key):
+        if key != "author":
+            RecordingEntry.read.add(dict.__getitem__(self, "path"))
+        return dict.__getitem__(self, key)
+
+
+class TestCorpusManifest(unittest.TestCase):
+    def setUp(self):
+        self.folder = os.path.join(tempfile.mkdtemp(), "python")
+        os.makedirs(self.folder)
+        for idx in range(9):
+            self.write("p{0}.user{1}.py".format(idx % 3, idx % 4), "x = {0}\n".format(idx) * (idx + 1))
+        self.write("bad.user0.py", "def (\n")
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.folder))
+
+    def write(self, name, source):
+        with open(os.path.join(self.folder, name), "w") as file:
+            file.write(source)
+
+    def test_build(self):
+        manifest = build_manifest(self.folder)
+        self.assertEqual(len(manifest), 10)
+        self.assertTrue(os.path.isfile(self.folder + ".manifest"))
+        nodes, depth = manifest.stats()
+        for entry, size, tree_depth in zip(manifest.entries, nodes, depth):
+            if entry["path"] == "bad.user0.py":
+                self.assertEqual((size, tree_depth), (-1, -1))
+            else:
+                self.assertEqual((size, tree_depth), tree_size_depth(ast_parse_file(os.path.join(self.folder, entry["path"]))))
+
+    def test_stray_file(self):
+        self.write("README", "not a program\n")
+        manifest = build_manifest(self.folder)
+        self.assertEqual(len(manifest), 11)
+        names, users, problems = manifest.files(authors=[""])
+        self.assertEqual([os.path.basename(name) for name in names], ["README"])
+
+    def test_select(self):
+        manifest = build_manifest(self.folder)
+        names, users, problems = manifest.files(authors=["user1", "user2"], problems=["p1"])
+        self.assertEqual(sorted(os.path.basename(name) for name in names), ["p1.user1.py"])
+        names, users, problems = manifest.files(authors=["user0"])
+        self.assertEqual(set(users), {"user0"})
+        self.assertEqual(len(names), 4)
+        # same files as listing the folder
+        all_names, all_users, all_problems = get_ast_src_files(self.folder)
+        names, users, problems = manifest.files()
+        self.assertEqual(sorted(zip(names, users, problems)), sorted(zip(all_names, all_users, all_problems)))
+
+    def test_load_selected_authors(self):
+        manifest = build_manifest(self.folder)
+        manifest.entries = [RecordingEntry(entry) for entry in manifest.entries]
+        RecordingEntry.read = set()
+        names, users, problems = src_files(self.folder, manifest, classes=["user1"])
+        self.assertEqual(set(users), {"user1"})
+        self.assertEqual(RecordingEntry.read, {os.path.basename(name) for name in names})
+        RecordingEntry.read = set()
+        self.assertEqual(list(src_files(self.folder, manifest, classes=lambda author: author == "user1")[0]), list(names))
+        self.assertEqual(RecordingEntry.read, {os.path.basename(name) for name in names})
+        X, y, _, _ = parse_src_files(self.folder, manifest=True, classes=["user1"])
+        self.assertEqual(list(y), list(users))
+
+    def test_refresh(self):
+        build_manifest(self.folder)
+        manifest = CorpusManifest(self.folder, split_ast_name)
+        self.assertEqual(manifest.refresh(), [])
+        self.assertFalse(manifest.dirty)
+        self.write("p0.user0.py", "y = 1\nz = 2\n")
+        self.write("p9.user9.py", "w = 3\n")
+        os.remove(os.path.join(self.folder, "p1.user1.py"))
+        missing = manifest.refresh()
+        self.assertEqual(sorted(manifest.entries[idx]["path"] for idx in missing), ["p0.user0.py", "p9.user9.py"])
+        self.assertNotIn("p1.user1.py", [entry["path"] for entry in manifest.entries])
+        self.assertTrue(manifest.dirty)
+
+    def test_loading(self):
+        X, y, tags, _ = parse_src_files(self.folder, manifest=True)
+        self.assertEqual(len(X), 10)
+        manifest = CorpusManifest(self.folder, split_ast_name)
+        self.assertEqual(sum(size > 0 for size in manifest.stats()[0]), 9)
+
+
+if __name__ == "__main__":
+    unittest.main()
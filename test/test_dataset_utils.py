@@ -0,0 +1,142 @@
+import ast
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from ast_tree.traverse import bfs
+from ast_tree.tree_nodes import Node, stamp_tree
+from ast_tree.tree_parser import ast_parse_file
+from ast_tree.tree_store import write_store
+from utils.dataset_utils import parse_files, parse_src_files
+from utils.parse_cache import ParseCache
+
+
+def cpp_programs(count):
+    '''programs of 1 to 3 functions with a few statements each'''
+    return [Node("Program", "", [Node("FunctionDef", "f{0}".format(k), [Node("ExpressionStatement", "", [])] * (k + 1))
+                                 for k in range(i % 3 + 1)]) for i in range(count)]
+
+
+PYTHON_SOURCES = ["import os\nx = 1\n", "def f(a):\n    return a\nprint(f(2))\n", "y = [i for i in range(3)]\n"]
+
+# 400 nested BinOps, parsed fine but too deep to be pickled back from a worker
+DEEP_SOURCE = "x = " + "+".join(["a"] * 400) + "\n"
+
+
+def labels(tree):
+    return bfs(tree, lambda node, depth, out: out.append((type(node).__name__, depth)), out=[])
+
+
+def write_python_folder(folder, count):
+    '''<problem>.<author>.py files, one of them too deep to pickle and one that does not parse'''
+    os.makedirs(folder)
+    for idx in range(count):
+        source = DEEP_SOURCE if idx == count // 2 else PYTHON_SOURCES[idx % len(PYTHON_SOURCES)] * (idx % 4 + 1)
+        with open(os.path.join(folder, "p{0}.user{1}.py".format(idx, idx % 5)), "w") as file:
+            file.write(source)
+    with open(os.path.join(folder, "bad.user0.py"), "w") as file:
+        file.write("def (\n")
+
+
+class TestParseFiles(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.python = os.path.join(self.folder, "python")
+        write_python_folder(self.python, 40)
+        self.names = sorted(os.path.join(self.python, name) for name in os.listdir(self.python))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_same_as_serial(self):
+        serial = parse_files(self.names, ast_parse_file)
+        parallel = parse_files(self.names, ast_parse_file, n_jobs=2, chunksize=4)
+        self.assertEqual(len(parallel), len(self.names))
+        for name, a, b in zip(self.names, serial, parallel):
+            if name.endswith("bad.user0.py"):
+                self.assertIsNone(b)
+            else:
+                self.assertEqual(labels(a), labels(b), name)
+
+    def test_all_cores(self):
+        X, y, tags, _ = parse_src_files(self.python, n_jobs=-1)
+        serial, serial_y, serial_tags, _ = parse_src_files(self.python)
+        self.assertEqual(list(y), list(serial_y))
+        self.assertEqual(list(tags), list(serial_tags))
+        self.assertEqual(sum(tree is None for tree in X), 1)
+
+
+class TestClasses(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.python = os.path.join(self.folder, "python")
+        write_python_folder(self.python, 20)
+        self.X, self.y, self.tags, _ = parse_src_files(self.python)
+        self.keep = np.isin(self.y, ["user1", "user3"])
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def check(self, X, y, tags):
+        self.assertEqual(list(y), list(self.y[self.keep]))
+        self.assertEqual(list(tags), list(self.tags[self.keep]))
+        self.assertEqual([labels(tree) for tree in X], [labels(tree) for tree in self.X[self.keep]])
+
+    def test_whitelist_and_predicate(self):
+        self.check(*parse_src_files(self.python, classes=["user1", "user3"])[:3])
+        self.check(*parse_src_files(self.python, classes=lambda label: label in ("user1", "user3"))[:3])
+        self.check(*parse_src_files(self.python, classes={"user3", "user1"}, lazy=True)[:3])
+
+    def test_subset_keeps_cache(self):
+        parse_src_files(self.python, cache=True, classes=["user1", "user3"])
+        parse_src_files(self.python, cache=True, classes=["user0"])
+        cache = ParseCache(self.python, ast_parse_file)
+        self.assertEqual(len(cache.files), int(self.keep.sum() + (self.y == "user0").sum()))
+
+
+class TestStoreLoaders(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.programs = cpp_programs(6)
+        self.cpp = self.folder + "/cpp.store"
+        write_store(self.cpp, self.programs, ["a", "b", "c"] * 2, ["p{0}".format(i) for i in range(6)],
+                    ["{0}.dot".format(i) for i in range(6)], "cpp")
+        self.python = self.folder + "/python.store"
+        write_store(self.python, [stamp_tree(ast.parse(source)) for source in PYTHON_SOURCES], ["a", "b", "a"],
+                    ["p0", "p1", "p2"], ["p0.a.py", "p1.b.py", "p2.a.py"], "python")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_python_not_split(self):
+        for lazy in (False, True):
+            for flat in (False, True):
+                X, y, tags, _ = parse_src_files(self.python, seperate_trees=True, lazy=lazy, flat=flat)
+                self.assertEqual(len(X), len(PYTHON_SOURCES))
+                self.assertEqual(list(y), ["a", "b", "a"])
+                self.assertEqual(list(tags), ["p0", "p1", "p2"])
+                self.assertEqual(type(X[0]).__name__, "FlatTree" if flat else "Module")
+
+    def test_lazy_seperate_rows(self):
+        X, y, tags, _ = parse_src_files(self.cpp, seperate_trees=True, lazy=True)
+        rows = [(label, "p{0}".format(idx)) for idx, (program, label) in enumerate(zip(self.programs, ["a", "b", "c"] * 2))
+                for _ in program.children]
+        self.assertEqual(len(X), len(rows))
+        self.assertEqual(list(zip(y, tags)), rows)
+        view = X[1::2]
+        self.assertEqual(list(view.problems), [problem for _, problem in rows[1::2]])
+        eager, eager_y, _, _ = parse_src_files(self.cpp, seperate_trees=True)
+        self.assertTrue(np.array_equal(y, eager_y))
+
+    def test_classes(self):
+        for lazy in (False, True):
+            X, y, tags, _ = parse_src_files(self.cpp, lazy=lazy, classes=["b"])
+            self.assertEqual(list(y), ["b", "b"])
+            self.assertEqual(list(tags), ["p1", "p4"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import ast
+import inspect
+import unittest
+
+import numpy as np
+
+from ast_tree.ASTVectorizater import ASTVectorizer
+from ast_tree.flat_tree import FlatNode, FlatTree, flatten_tree
+from ast_tree.traverse import bfs, children
+from ast_tree.tree_nodes import AstNodes, DotNodes, Node, stamp_tree
+
+SOURCES = ["import os\nx = 1\n", "def f(a):\n    if a:\n        return [i for i in a]\ng(f(2))\n",
+           inspect.getsource(inspect)]
+
+
+def walk(tree, nodes):
+    return bfs(tree, lambda node, depth, out: out.append((nodes.index(node), len(children(node)), depth)), out=[])
+
+
+class TestFlatTree(unittest.TestCase):
+    def setUp(self):
+        self.nodes = AstNodes()
+        self.trees = [stamp_tree(ast.parse(source)) for source in SOURCES]
+        self.flat = [FlatTree.from_tree(tree, self.nodes) for tree in self.trees]
+
+    def test_same_walk(self):
+        for tree, flat in zip(self.trees, self.flat):
+            self.assertEqual(walk(flat, self.nodes), walk(tree, self.nodes))
+            self.assertEqual(flat.size(), len(flatten_tree(tree)[0]))
+
+    def test_nodes(self):
+        flat = self.flat[1]
+        function = children(flat)[0]
+        self.assertIsInstance(function, FlatNode)
+        self.assertEqual(function.type, "FunctionDef")
+        self.assertEqual(function.depth, 1)
+        self.assertEqual(function.parent.index, 0)
+        self.assertIsNone(flat.parent)
+        self.assertEqual(flat.node(function.index).type_id, self.nodes.index(self.trees[1].body[0]))
+
+    def test_arrays(self):
+        types, parents, depths = self.flat[2].arrays()
+        self.assertEqual((types.dtype, parents.dtype, depths.dtype), (np.int16, np.int32, np.int32))
+        self.assertEqual(parents[0], -1)
+        self.assertTrue(np.all(parents[1:] < np.arange(1, len(parents))))
+        self.assertTrue(np.array_equal(depths[1:], depths[parents[1:]] + 1))
+        # views of the tree's arrays, not copies
+        self.assertFalse(types.flags.owndata)
+
+    def test_subtree(self):
+        flat = self.flat[1]
+        function = children(flat)[0]
+        subtree = flat.subtree(function.index)
+        self.assertEqual(subtree.size(), flat.subtree_end(function.index) - function.index)
+        self.assertEqual(walk(subtree, self.nodes), walk(FlatTree.from_tree(self.trees[1].body[0], self.nodes), self.nodes))
+
+    def test_cpp_tree(self):
+        nodes = DotNodes()
+        tree = Node("Program", "", [Node("FunctionDef", "f", [Node("Identifier", "a", [])]), Node("Statement", "", [])])
+        flat = FlatTree.from_tree(tree, nodes)
+        self.assertEqual(walk(flat, nodes), walk(tree, nodes))
+
+    def test_same_features(self):
+        # flat trees have no identifiers or constant values, so no print/None keywords: only the first
+        # two programs, which have none
+        X = np.empty(2, dtype=object)
+        X[:] = self.trees[:2]
+        flat = np.empty(2, dtype=object)
+        flat[:] = self.flat[:2]
+        expected = ASTVectorizer(self.nodes, ngram=2).fit_transform(X)
+        features = ASTVectorizer(self.nodes, ngram=2).fit_transform(flat)
+        self.assertEqual((features != expected).nnz, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
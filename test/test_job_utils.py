@@ -0,0 +1,51 @@
+import os
+import shutil
+import tempfile
+import unittest
+from multiprocessing import cpu_count
+
+from utils.job_utils import atomic_write, n_processes
+
+
+class TestNProcesses(unittest.TestCase):
+    def test_counts(self):
+        self.assertEqual(n_processes(None), 1)
+        self.assertEqual(n_processes(0), 1)
+        self.assertEqual(n_processes(3), 3)
+        self.assertEqual(n_processes(-1), cpu_count())
+        self.assertEqual(n_processes(-cpu_count() - 5), 1)
+
+
+class TestAtomicWrite(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "out.txt")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_replaces(self):
+        with atomic_write(self.path) as file:
+            file.write("a")
+        with atomic_write(self.path) as file:
+            file.write("b")
+            # the old content is kept until the block is done
+            with open(self.path) as old:
+                self.assertEqual(old.read(), "a")
+        with open(self.path) as file:
+            self.assertEqual(file.read(), "b")
+        self.assertEqual(os.listdir(self.folder), ["out.txt"])
+
+    def test_failed_write(self):
+        with atomic_write(self.path) as file:
+            file.write("a")
+        with self.assertRaises(RecursionError):
+            with atomic_write(self.path, "wb") as file:
+                raise RecursionError()
+        with open(self.path) as file:
+            self.assertEqual(file.read(), "a")
+        self.assertEqual(os.listdir(self.folder), ["out.txt"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import ast
+import unittest
+
+import numpy as np
+
+from ast_tree.flat_tree import FlatTree
+from ast_tree.multi_trees import program_units, split_units
+from ast_tree.tree_nodes import AstNodes, DotNodes, Node, stamp_tree
+
+SOURCE = '''import os
+x = 1
+def f(a):
+    return a + x
+class C:
+    def g(self):
+        pass
+from sys import argv
+print(f(2))
+'''
+
+
+def flat_arrays(tree):
+    types, parents, _ = tree.arrays()
+    return types.tolist(), parents.tolist()
+
+
+class TestFlatTreeUnits(unittest.TestCase):
+    def setUp(self):
+        self.nodes = AstNodes()
+        self.tree = stamp_tree(ast.parse(SOURCE))
+        self.flat = FlatTree.from_tree(self.tree, self.nodes)
+
+    def test_kinds(self):
+        kinds = [kind for _, kind, _, _, _ in program_units(self.flat)]
+        self.assertEqual(kinds, ["function", "class", "import", "global"])
+
+    def test_same_units_as_ast(self):
+        units = program_units(self.tree)
+        flat_units = program_units(self.flat)
+        self.assertEqual(len(units), len(flat_units))
+        for (unit, kind, program, start, end), (flat_unit, *rest) in zip(units, flat_units):
+            self.assertIsInstance(flat_unit, FlatTree)
+            self.assertEqual((kind, program, start, end), tuple(rest))
+            self.assertEqual(flat_arrays(FlatTree.from_tree(unit, self.nodes)), flat_arrays(flat_unit))
+
+    def test_program_not_modified(self):
+        before = flat_arrays(self.flat)
+        program_units(self.flat)
+        self.assertEqual(before, flat_arrays(self.flat))
+
+    def test_cpp_functions(self):
+        leaf = Node("Identifier", "a", [])
+        tree = Node("Program", "", [Node("FunctionDef", "f", [leaf]), Node("Statement", "", []),
+                                    Node("FunctionDef", "g", [Node("FunctionDef", "h", [])])])
+        flat = FlatTree.from_tree(tree, DotNodes())
+        units = program_units(flat)
+        self.assertEqual([(kind, start, end) for _, kind, _, start, end in units],
+                         [("function", 1, 3), ("function", 4, 6)])
+        self.assertEqual([unit.size() for unit, _, _, _, _ in units], [2, 2])
+
+    def test_split_units(self):
+        X = np.empty(2, dtype=object)
+        X[:] = [self.flat, FlatTree.from_tree(stamp_tree(ast.parse("y = 2\n")), self.nodes)]
+        subX, subY, problems, provenance = split_units(X, ["a", "b"], ["p1", "p2"])
+        self.assertEqual(len(subX), 6)
+        self.assertEqual(subY.tolist(), ["a"] * 4 + ["b"] * 2)
+        self.assertEqual(provenance["kind"].tolist(), ["function", "class", "import", "global", "import", "global"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import ast
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from utils.dataset_utils import parse_files
+from utils.parse_cache import ParseCache, file_hash
+
+DEEP_SOURCE = "x = " + "+".join(["a"] * 400) + "\n"
+
+parsed = []
+
+
+def counting_parse(filename):
+    parsed.append(os.path.basename(filename))
+    with open(filename) as file:
+        return ast.parse(file.read())
+
+
+class TestParseCache(unittest.TestCase):
+    def setUp(self):
+        self.folder = os.path.join(tempfile.mkdtemp(), "python")
+        os.makedirs(self.folder)
+        self.names = []
+        for idx in range(6):
+            self.names.append(os.path.join(self.folder, "p{0}.user{1}.py".format(idx, idx % 2)))
+            self.write(self.names[-1], "x = {0}\n".format(idx))
+        del parsed[:]
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.folder))
+
+    def write(self, filename, source):
+        with open(filename, "w") as file:
+            file.write(source)
+
+    def load(self, names=None):
+        names = self.names if names is None else names
+        return parse_files(names, counting_parse, cache=self.folder)
+
+    def test_round_trip(self):
+        first = self.load()
+        self.assertEqual(len(parsed), 6)
+        second = self.load()
+        self.assertEqual(len(parsed), 6)
+        self.assertEqual([ast.dump(tree) for tree in first], [ast.dump(tree) for tree in second])
+
+    def test_changed_and_deleted_files(self):
+        self.load()
+        self.write(self.names[0], "y = 1\n")
+        os.remove(self.names[1])
+        del parsed[:]
+        trees = self.load([self.names[0]] + self.names[2:])
+        self.assertEqual(parsed, ["p0.user0.py"])
+        self.assertEqual(ast.dump(trees[0]), ast.dump(ast.parse("y = 1\n")))
+        cache = ParseCache(self.folder, counting_parse)
+        self.assertNotIn("p1.user1.py", cache.files)
+        self.assertEqual(len(os.listdir(cache.path)), 6)
+
+    def test_same_content_stored_once(self):
+        self.write(self.names[1], "x = 0\n")
+        self.load()
+        cache = ParseCache(self.folder, counting_parse)
+        self.assertEqual(cache.files["p0.user0.py"], cache.files["p1.user1.py"])
+        self.assertEqual(len([name for name in os.listdir(cache.path) if name.endswith(".pkl")]), 5)
+
+    def test_deep_tree_not_cached(self):
+        self.write(self.names[2], DEEP_SOURCE)
+        trees = self.load()
+        self.assertIsNotNone(trees[2])
+        cache = ParseCache(self.folder, counting_parse)
+        self.assertFalse(cache.contains(file_hash(self.names[2])))
+        self.assertFalse(any(name.endswith(".tmp") for name in os.listdir(cache.path)))
+        del parsed[:]
+        self.assertIsNotNone(self.load()[2])
+        self.assertEqual(parsed, ["p2.user0.py"])
+
+    def test_version_change(self):
+        self.load()
+        cache = ParseCache(self.folder, counting_parse)
+        with open(cache.index_file) as file:
+            index = json.load(file)
+        index["parser_version"] = -1
+        with open(cache.index_file, "w") as file:
+            json.dump(index, file)
+        del parsed[:]
+        self.load()
+        self.assertEqual(len(parsed), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
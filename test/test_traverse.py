@@ -0,0 +1,154 @@
+import ast
+import copy
+import inspect
+import unittest
+
+from ast_tree.flat_tree import FlatNode, FlatTree
+from ast_tree.traverse import FlatPostOrder, ScheduleCache, TreeWalk, bfs, children, dfs, evaluate_tree, post_order, \
+    traverse
+from ast_tree.tree_nodes import AstNodes, Node, stamp_tree
+
+
+def recursive_pre(node, depth=0, out=None):
+    out = [] if out is None else out
+    out.append((node, depth))
+    for child in children(node):
+        recursive_pre(child, depth + 1, out)
+    return out
+
+
+def recursive_post(node, depth=0, out=None):
+    out = [] if out is None else out
+    for child in children(node):
+        recursive_post(child, depth + 1, out)
+    out.append((node, depth))
+    return out
+
+
+def recursive_evaluate(node, leaf, merge):
+    kids = children(node)
+    if len(kids) == 0:
+        return leaf(node)
+    return merge(node, [recursive_evaluate(kid, leaf, merge) for kid in kids])
+
+
+def identity(node):
+    '''FlatNode handles are new objects on every children() call, they are the same node by index'''
+    return node.index if isinstance(node, FlatNode) else id(node)
+
+
+def collect(node, depth, out):
+    out.append((node, depth))
+
+
+def deep_tree(depth):
+    tree = Node("Leaf", "x", [])
+    for _ in range(depth):
+        tree = Node("Block", "", [tree, Node("Leaf", "y", [])])
+    return tree
+
+
+class TestTreeWalk(unittest.TestCase):
+    def setUp(self):
+        self.tree = stamp_tree(ast.parse(inspect.getsource(inspect)))
+
+    def same_nodes(self, a, b):
+        self.assertEqual(len(a), len(b))
+        self.assertTrue(all(x is y and dx == dy for (x, dx), (y, dy) in zip(a, b)))
+
+    def test_orders(self):
+        self.same_nodes(bfs(self.tree, collect, out=[]), recursive_pre(self.tree))
+        self.same_nodes(dfs(self.tree, collect, out=[]), recursive_post(self.tree))
+        levels = traverse(self.tree, collect, out=[], order="level")
+        self.assertEqual([depth for _, depth in levels], sorted(depth for _, depth in levels))
+
+    def test_modes(self):
+        walk = TreeWalk(self.tree)
+        leaves = traverse(walk, collect, mode="leaves", out=[])
+        parents = traverse(walk, collect, mode="parents", out=[])
+        self.assertTrue(all(len(children(node)) == 0 for node, _ in leaves))
+        self.assertTrue(all(len(children(node)) > 0 for node, _ in parents))
+        self.assertEqual(len(leaves) + len(parents), len(walk))
+
+    def test_deep_tree(self):
+        tree = deep_tree(5000)
+        self.assertEqual(len(bfs(tree, collect, out=[])), 10001)
+        self.assertEqual(dfs(tree, collect, out=[])[-1], (tree, 0))
+
+
+class TestPostOrderSchedule(unittest.TestCase):
+    def setUp(self):
+        self.tree = stamp_tree(ast.parse(inspect.getsource(inspect)))
+
+    def check(self, tree):
+        def leaf(node):
+            calls.append(node)
+            return 1
+
+        def merge(node, values):
+            calls.append(node)
+            return 1 + sum(values)
+
+        calls = []
+        value = evaluate_tree(tree, leaf, merge)
+        schedule_calls = calls
+        calls = []
+        self.assertEqual(value, recursive_evaluate(tree, leaf, merge))
+        self.assertEqual(len(schedule_calls), len(calls))
+        self.assertEqual([identity(node) for node in schedule_calls], [identity(node) for node in calls])
+
+    def test_same_as_recursion(self):
+        self.check(self.tree)
+        self.check(FlatTree.from_tree(self.tree, AstNodes()))
+        self.check(deep_tree(50))
+
+    def test_deep_tree(self):
+        self.assertEqual(evaluate_tree(deep_tree(5000), lambda node: 1, lambda node, values: 1 + sum(values)), 10001)
+
+    def test_built_once_per_tree(self):
+        cache = ScheduleCache()
+        for tree in (self.tree, deep_tree(10)):
+            self.assertIs(post_order(tree, cache), post_order(tree, cache))
+            self.assertIs(post_order(tree, cache).nodes[-1], tree)
+            self.assertIsNot(post_order(tree), post_order(tree, cache))
+        self.assertEqual(len(cache), 2)
+        # nothing is kept on the trees themselves
+        self.assertFalse(hasattr(deep_tree(1), "schedule"))
+        self.assertFalse(hasattr(self.tree, "schedule"))
+
+    def test_bounded_cache(self):
+        cache = ScheduleCache(maxsize=3)
+        trees = [deep_tree(3) for _ in range(5)]
+        for _ in range(2):
+            for tree in trees:
+                post_order(tree, cache)
+                self.assertLessEqual(len(cache), 3)
+        # the most recently used trees are kept, the others are dropped with their schedules
+        self.assertIs(post_order(trees[-1], cache), post_order(trees[-1], cache))
+        self.assertEqual(set(cache.schedules), {id(tree) for tree in trees[2:]})
+        self.assertEqual(len(ScheduleCache(maxsize=0).get(trees[0])), len(post_order(trees[0])))
+
+    def test_copies_get_their_own(self):
+        cache = ScheduleCache()
+        schedule = post_order(self.tree, cache)
+        view = copy.copy(self.tree)
+        view.body = view.body[:3]
+        self.assertIsNot(post_order(view, cache), schedule)
+        self.assertIs(post_order(view, cache).nodes[-1], view)
+        self.assertIs(post_order(self.tree, cache), schedule)
+
+    def test_flat_tree_index_order(self):
+        flat = FlatTree.from_tree(self.tree, AstNodes())
+        schedule = post_order(flat, ScheduleCache())
+        self.assertIsInstance(schedule, FlatPostOrder)
+        self.assertEqual(list(schedule.order), [node.index for node, _ in dfs(flat, collect, out=[])])
+        self.assertEqual(evaluate_tree(flat, lambda node: 1, lambda node, values: 1 + sum(values)), flat.size())
+
+    def test_flat_node_handles(self):
+        flat = FlatTree.from_tree(self.tree, AstNodes())
+        node = children(flat)[0]
+        self.assertEqual(len(post_order(node)), flat.subtree_end(node.index) - node.index)
+        self.check(node)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import ast
+import gc
+import inspect
+import shutil
+import tempfile
+import unittest
+
+from ast_tree.traverse import TreeWalk, bfs, children
+from ast_tree.tree_dag import InternTable, intern_trees
+from ast_tree.tree_nodes import Node
+from ast_tree.tree_store import write_store
+from utils.dataset_utils import parse_src_files
+
+
+def labels(tree):
+    return bfs(tree, lambda node, depth, out: out.append((type(node).__name__, getattr(node, "code", None), depth)),
+               out=[])
+
+
+def program(name):
+    call = Node("CallExpression", "print", [Node("Argument", "x", [])])
+    return Node("Program", "", [Node("FunctionDef", name, [Node("ExpressionStatement", "", [call])]),
+                                Node("FunctionDef", "main", [Node("ExpressionStatement", "", [call])])])
+
+
+class TestInternTable(unittest.TestCase):
+    def test_same_walks(self):
+        source = inspect.getsource(inspect)
+        tree = InternTable().intern(ast.parse(source))
+        self.assertEqual(labels(tree), labels(ast.parse(source)))
+
+    def test_shared_subtrees(self):
+        trees, table = intern_trees([program("f"), program("g")])
+        self.assertIsNot(children(trees[0])[0], children(trees[1])[0])
+        self.assertIs(children(trees[0])[1], children(trees[1])[1])
+        # Program, FunctionDef f, ExpressionStatement, CallExpression, Argument, FunctionDef main, then
+        # Program and FunctionDef g
+        self.assertEqual(len(table), 8)
+        self.assertEqual(len(TreeWalk(trees[1])), 9)
+        self.assertNotEqual(table.hash(trees[0]), table.hash(trees[1]))
+        self.assertEqual(table.hash(children(trees[0])[1]), table.hash(children(trees[1])[1]))
+
+    def test_stable_hashes(self):
+        first, table = intern_trees([program("f")])
+        second, other = intern_trees([program("f")])
+        self.assertEqual(table.hash(first[0]), other.hash(second[0]))
+
+
+class TestLazyDag(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.store = self.folder + "/cpp.store"
+        write_store(self.store, [program("f{0}".format(i)) for i in range(20)], ["a", "b"] * 10,
+                    ["p{0}".format(i) for i in range(20)], ["{0}.dot".format(i) for i in range(20)], "cpp")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_loads_are_not_kept(self):
+        X, _, _, _ = parse_src_files(self.store, lazy=True, dag=True)
+        eager, _, _, _ = parse_src_files(self.store, dag=True)
+        X.cache.maxsize = 2
+        for idx in range(len(X)):
+            tree = X[idx]
+            self.assertEqual(labels(tree), labels(eager[idx]))
+            # shared within the tree
+            self.assertIs(children(children(tree)[0])[0].children[0], children(children(tree)[1])[0].children[0])
+        gc.collect()
+        # the tables of the loads are gone with their loads, nothing holds the trees out of the cache
+        self.assertEqual([obj for obj in gc.get_objects() if isinstance(obj, InternTable)], [])
+
+    def test_not_with_flat(self):
+        for lazy in (False, True):
+            with self.assertRaises(ValueError):
+                parse_src_files(self.store, lazy=lazy, flat=True, dag=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
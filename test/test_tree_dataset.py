@@ -0,0 +1,98 @@
+import ast
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from utils.dataset_utils import parse_src_files
+from utils.tree_dataset import LRUCache, TreeDataset
+
+
+class TestLRUCache(unittest.TestCase):
+    def setUp(self):
+        self.loads = []
+
+    def load(self, key):
+        self.loads.append(key)
+        return str(key)
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        for key in [1, 2, 1, 3, 1, 2]:
+            self.assertEqual(cache.get(key, self.load), str(key))
+        self.assertEqual(self.loads, [1, 2, 3, 2])
+        self.assertEqual(list(cache.items), [1, 2])
+
+    def test_no_cache(self):
+        cache = LRUCache(0)
+        cache.get(1, self.load)
+        cache.get(1, self.load)
+        self.assertEqual(self.loads, [1, 1])
+        self.assertEqual(len(cache.items), 0)
+
+
+class TestTreeDataset(unittest.TestCase):
+    def setUp(self):
+        self.loads = []
+        self.keys = np.array(["k{0}".format(i) for i in range(10)])
+        self.labels = np.array(["a", "b"] * 5)
+        self.problems = np.array(["p{0}".format(i % 3) for i in range(10)])
+        self.X = TreeDataset(self.load, self.keys, self.labels, self.problems, cache_size=4)
+
+    def load(self, key):
+        self.loads.append(key)
+        return "tree " + key
+
+    def test_integer_index(self):
+        self.assertEqual(len(self.X), 10)
+        self.assertEqual(self.X[3], "tree k3")
+        self.assertEqual(self.X[-1], "tree k9")
+        self.assertEqual(self.X[np.int64(3)], "tree k3")
+        self.assertEqual(self.loads, ["k3", "k9"])
+
+    def test_views(self):
+        train = self.X[np.array([1, 3, 5])]
+        self.assertIsInstance(train, TreeDataset)
+        self.assertEqual(list(train), ["tree k1", "tree k3", "tree k5"])
+        self.assertEqual(list(train.labels), ["b", "b", "b"])
+        self.assertEqual(list(train.problems), ["p1", "p0", "p2"])
+        self.assertEqual(list(train[1:].problems), ["p0", "p2"])
+        self.assertEqual(train.shape, (3,))
+        # views share the cache of the dataset
+        self.assertEqual(self.X[3], "tree k3")
+        self.assertEqual(self.loads, ["k1", "k3", "k5"])
+        self.assertEqual(list(train[1:]), ["tree k3", "tree k5"])
+        self.assertEqual(list(self.X[self.labels == "a"].labels), ["a"] * 5)
+        self.assertEqual(list(self.X[np.where(self.labels == "a")]), ["tree k{0}".format(i) for i in range(0, 10, 2)])
+
+    def test_bounded_cache(self):
+        for _ in range(2):
+            list(self.X)
+        self.assertEqual(len(self.loads), 20)
+        self.assertEqual(len(self.X.cache.items), 4)
+
+
+class TestLazyLoading(unittest.TestCase):
+    def setUp(self):
+        self.folder = os.path.join(tempfile.mkdtemp(), "python")
+        os.makedirs(self.folder)
+        for idx in range(8):
+            with open(os.path.join(self.folder, "p{0}.user{1}.py".format(idx, idx % 3)), "w") as file:
+                file.write("x = {0}\n".format(idx) * (idx + 1))
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.folder))
+
+    def test_same_as_eager(self):
+        X, y, tags, _ = parse_src_files(self.folder, lazy=True)
+        eager, eager_y, eager_tags, _ = parse_src_files(self.folder)
+        self.assertIsInstance(X, TreeDataset)
+        self.assertEqual(list(y), list(eager_y))
+        self.assertEqual(list(tags), list(eager_tags))
+        self.assertEqual([ast.dump(tree) for tree in X], [ast.dump(tree) for tree in eager])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import ast
+import inspect
+import unittest
+from collections import Counter
+
+from ast_tree.ASTVectorizater import TreeFeatures
+from ast_tree.flat_tree import FlatTree
+from ast_tree.tree_nodes import AstNodes, DotNodes, stamp_tree
+from ast_tree.tree_parser import parse_tree
+
+CPP_TREE = '''>1\tFunctionDef\tmain
+>2\tCompoundStatement\t
+>3\tIfStatement\t
+>4\tCondition\t
+>5\tIdentifier\tx
+>6\tReturnStatement\t
+>7\tCallExpression\tf
+>8\tArgumentList\t
+>9\tArgument\t
+>10\tIdentifier\ty
+>11\tFunctionDef\tf
+>12\tReturnStatement\t
+<1=2
+<2=3,6
+<3=4,7
+<4=5
+<6=10
+<7=8
+<8=9
+<11=12
+'''
+
+
+def old_features(features, tree, ngram, v_skip):
+    '''the per family methods the fused pass replaced'''
+    ngrams = Counter()
+    for skip in range(v_skip + 1):
+        ngrams.update(features.tf_skip_grams_node_fast(tree, ngram=ngram, v_skip=skip))
+    return {"ngrams": dict(ngrams),
+            "node_types": dict(features.tf_node_types(tree)),
+            "node_leaves": dict(features.tf_node_leaves(tree)),
+            "avg_node_types": features.avg_node_types(tree),
+            "avg_node_leaves": features.avg_node_leaves(tree),
+            "max_depth": features.max_depth(tree)}
+
+
+def plain(values):
+    return {name: dict(value) if isinstance(value, dict) else value for name, value in values.items()}
+
+
+class TestFusedFeatures(unittest.TestCase):
+    def check(self, nodes, trees):
+        features = TreeFeatures(nodes)
+        for tree in trees:
+            for ngram in (2, 3):
+                for v_skip in (0, 1, 2):
+                    expected = old_features(features, tree, ngram, v_skip)
+                    self.assertEqual(plain(features.features(tree, ngram, v_skip)), expected)
+                    flat = FlatTree.from_tree(tree, nodes)
+                    self.assertEqual(plain(features.features(flat, ngram, v_skip)), expected)
+
+    def test_python(self):
+        sources = ["x = 1\n", "def f(a):\n    if a:\n        return [i for i in a]\n", inspect.getsource(inspect)]
+        self.check(AstNodes(), [stamp_tree(ast.parse(source)) for source in sources])
+
+    def test_cpp(self):
+        self.check(DotNodes(), parse_tree(None, lines=CPP_TREE.splitlines(True)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import ast
+import inspect
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import unittest
+
+from ast_tree.tree_nodes import (DOT_NODE_TYPES, AstNodes, DotNodes, Node, Vocabulary, get_vocabulary, load_vocabulary,
+                                 python_type_id, register_vocabulary, stamp_tree, vocabulary_signature)
+
+
+class TestNode(unittest.TestCase):
+    def test_slots(self):
+        node = Node("Identifier", "x", [])
+        self.assertFalse(hasattr(node, "__dict__"))
+        with self.assertRaises(AttributeError):
+            node.lineno = 1
+
+    def test_interned_strings(self):
+        a = Node("".join(["Ident", "ifier"]), "".join(["my", "_name"]), [])
+        b = Node("Identifier", "my_name", [])
+        self.assertIs(a.type, b.type)
+        self.assertIs(a.code, b.code)
+        self.assertIs(a.code, sys.intern("my_name"))
+        self.assertEqual(Node("Identifier", "", []).code, " ")
+
+    def test_type_ids(self):
+        nodes = DotNodes()
+        self.assertEqual(Node("Identifier", "x", []).type_id, DOT_NODE_TYPES.index("Identifier"))
+        self.assertEqual(nodes.index(Node("identifier", "x", [])), DOT_NODE_TYPES.index("Identifier"))
+        unknown = Node("NotACppType", "x", [])
+        self.assertEqual(unknown.type_id, -1)
+        with self.assertRaises(KeyError):
+            nodes.index(unknown)
+
+    def test_pickle(self):
+        tree = Node("Program", "", [Node("FunctionDef", "f", [Node("Identifier", "a", [])])])
+        copy = pickle.loads(pickle.dumps(tree))
+        self.assertEqual((copy.type, copy.code, copy.type_id), (tree.type, tree.code, tree.type_id))
+        leaf = copy.children[0].children[0]
+        self.assertIs(leaf.code, tree.children[0].children[0].code)
+        self.assertEqual(leaf.type_id, DOT_NODE_TYPES.index("Identifier"))
+
+
+class TestVocabulary(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.python = get_vocabulary("python")
+        self.cpp = get_vocabulary("cpp")
+
+    def tearDown(self):
+        register_vocabulary(self.python)
+        register_vocabulary(self.cpp)
+        shutil.rmtree(self.folder)
+
+    def test_stamp_tree(self):
+        tree = stamp_tree(ast.parse(inspect.getsource(inspect)))
+        for node in ast.walk(tree):
+            self.assertEqual(node.type_id, self.python.index_name(type(node).__name__))
+            self.assertEqual(node.type_id, python_type_id(type(node)))
+        nodes = AstNodes()
+        self.assertEqual(nodes.get(nodes.index(tree)), "Module")
+
+    def test_case_insensitive_names(self):
+        self.assertEqual(self.python.index_name("functiondef"), self.python.index_name("FunctionDef"))
+        self.assertEqual(self.python.index_name("NONE"), self.python.size() - 1)
+
+    def test_save_and_load(self):
+        filename = os.path.join(self.folder, "python.json")
+        self.python.save(filename)
+        loaded = load_vocabulary(filename)
+        self.assertEqual(loaded.nodetypes, self.python.nodetypes)
+        self.assertEqual(loaded.signature(), self.python.signature())
+        self.assertIs(get_vocabulary("python"), loaded)
+
+    def test_register(self):
+        signature = vocabulary_signature()
+        register_vocabulary(Vocabulary("cpp", ["Program", "FunctionDef"]))
+        self.assertNotEqual(vocabulary_signature(), signature)
+        # type ids of nodes built afterwards come from the new vocabulary
+        self.assertEqual(Node("FunctionDef", "f", []).type_id, 1)
+        self.assertEqual(Node("Identifier", "a", []).type_id, -1)
+        register_vocabulary(self.cpp)
+        self.assertEqual(vocabulary_signature(), signature)
+        self.assertEqual(Node("FunctionDef", "f", []).type_id, DOT_NODE_TYPES.index("FunctionDef"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import os
+import random
+import re
+import shutil
+import tempfile
+import unittest
+from collections import defaultdict
+
+from ast_tree.traverse import bfs
+from ast_tree.tree_nodes import Node
+from ast_tree.tree_parser import iter_dot_graphs, parse_dot
+
+TYPES = ["FunctionDef", "CompoundStatement", "IfStatement", "CallExpression", "Identifier", "ReturnStatement"]
+
+
+def old_parse_dot(filename):
+    '''the parse_dot the streaming reader replaced, kept as the reference'''
+    split = "\t"
+    structs = []
+    for line in open(filename):
+        if line.startswith("//"):
+            continue
+        if line.startswith("strict graph"):
+            structs.append(line)
+        else:
+            structs[-1] += line
+    lines = []
+    for struct in structs:
+        for line in struct.split("\n"):
+            if line.startswith("\t"):
+                lines.append(line.strip().replace("\n", split))
+            elif len(lines) > 0:
+                lines[-1] = lines[-1] + split + line.replace("\n", split).strip()
+        lines.append("")
+    nodes = {}
+    links = defaultdict(list)
+    for line in lines:
+        if len(line) > 0 and line[0].isdigit():
+            if "--" in line[:10]:
+                numbers = re.compile(R"[^\d-]+").sub('', line).split("--")
+                links[int(numbers[0].strip())].append(int(numbers[1].strip()))
+            else:
+                parts = line.split("\t")
+                if len(parts) > 1:
+                    content = {"type": "", "code": ""}
+                    for part in parts[1:]:
+                        if part.startswith("type:"):
+                            content["type"] = part.split(":")[1]
+                        if part.startswith("code:"):
+                            content["code"] = part.split(":")[1]
+                    nodes[int(parts[0])] = Node(content["type"], content["code"], [])
+    child_ids = []
+    for id, value in sorted(links.items()):
+        for link in value:
+            nodes[id].children.append(nodes[link])
+            child_ids.append(link)
+    return Node("Program", "", [nodes[id] for id in sorted(set(nodes.keys()) - set(child_ids))])
+
+
+def dot_graph(rng, first_id, roots):
+    '''text of a strict graph of random trees, nodes listed in shuffled order with ids from first_id'''
+    nodes = []
+    edges = []
+
+    def add(depth, parent):
+        id = first_id + len(nodes)
+        nodes.append("\t{0}\ntype:{1}\ncode:{2}\n".format(id, rng.choice(TYPES), rng.choice(["", "x", "a b"])))
+        if parent is not None:
+            edges.append("\t{0} -- {1} ;\n".format(parent, id))
+        if depth > 0:
+            for _ in range(rng.randint(0, 3)):
+                add(depth - 1, id)
+
+    for _ in range(roots):
+        add(3, None)
+    rng.shuffle(nodes)
+    return "strict graph {\n" + "".join(nodes) + "".join(edges) + "}\n"
+
+
+def labels(tree):
+    return bfs(tree, lambda node, depth, out: out.append((node.type, node.code, depth)), out=[])
+
+
+class TestDotReader(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.rng = random.Random(0)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write(self, text):
+        filename = os.path.join(self.folder, "{0}.dot".format(len(os.listdir(self.folder))))
+        with open(filename, "w") as file:
+            file.write("// generated\n" + text)
+        return filename
+
+    def test_same_as_old_reader(self):
+        for _ in range(20):
+            filename = self.write(dot_graph(self.rng, 1, self.rng.randint(1, 4)))
+            self.assertEqual(labels(parse_dot(filename)), labels(old_parse_dot(filename)))
+
+    def test_graphs(self):
+        graphs = [dot_graph(self.rng, 1 + 1000 * idx, idx + 1) for idx in range(3)]
+        filename = self.write("".join(graphs))
+        programs = list(iter_dot_graphs(filename))
+        self.assertEqual([len(program.children) for program in programs], [1, 2, 3])
+        for graph, program in zip(graphs, programs):
+            self.assertEqual(labels(program), labels(old_parse_dot(self.write(graph))))
+        # the roots of all graphs under one Program, as the old reader did with distinct ids
+        self.assertEqual(labels(parse_dot(filename)), labels(old_parse_dot(filename)))
+
+    def test_code_continuing_over_graph_line(self):
+        text = ("strict graph {\n\t1\ntype:CompoundStatement\ncode:\n\t2\ntype:ExpressionStatement\ncode:x =\n"
+                "graph[u] ;\n\t3\ntype:Identifier\ncode:graph\n\t1 -- 2 ;\n\t1 -- 3 ;\n}\n")
+        filename = self.write(text + dot_graph(self.rng, 100, 2))
+        self.assertEqual(len(list(iter_dot_graphs(filename))), 2)
+        self.assertEqual(labels(parse_dot(filename)), labels(old_parse_dot(filename)))
+
+
+if __name__ == "__main__":
+    unittest.main()
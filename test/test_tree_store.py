@@ -0,0 +1,96 @@
+import ast
+import inspect
+import os
+import shutil
+import tempfile
+import unittest
+
+from ast_tree.flat_tree import FlatTree, node_type_name
+from ast_tree.traverse import bfs
+from ast_tree.tree_nodes import AstNodes, DotNodes, Node, stamp_tree
+from ast_tree.tree_store import TreeStore, is_store, write_store
+from utils.dataset_utils import convert_tree_files, parse_src_files
+
+
+def labels(tree, nodes):
+    return bfs(tree, lambda node, depth, out: out.append((nodes.index(node), getattr(node, "code", None), depth)),
+               out=[])
+
+
+def flat_labels(tree, nodes):
+    return [(type_id, depth) for type_id, _, depth in labels(tree, nodes)]
+
+
+class TestTreeStore(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_cpp_round_trip(self):
+        nodes = DotNodes()
+        programs = [Node("Program", "", [Node("FunctionDef", "f{0}".format(i), [Node("Identifier", "a b", [])] * i)])
+                    for i in range(4)]
+        path = os.path.join(self.folder, "cpp.store")
+        write_store(path, programs, ["a", "b", "a", "b"], ["p0", "p1", "p2", "p3"], ["a.p0.tree"] * 4, "cpp")
+        store = TreeStore(path)
+        self.assertTrue(is_store(path))
+        self.assertEqual((store.kind, len(store)), ("cpp", 4))
+        for idx, program in enumerate(programs):
+            self.assertEqual(labels(store.tree(idx), nodes), labels(program, nodes))
+            self.assertEqual(flat_labels(store.flat_tree(idx), nodes), flat_labels(program, nodes))
+            self.assertEqual(store.root_children(idx), 1)
+            self.assertEqual(store.node_count(idx), idx + 2)
+        self.assertEqual(list(store.names), ["a.p0.tree"] * 4)
+        # names are stored upper case, the decoded nodes get the vocabulary's spelling back
+        self.assertEqual(store.tree(1).children[0].type, "FunctionDef")
+        self.assertEqual(node_type_name(store.flat_tree(1).children[0]), "FUNCTIONDEF")
+
+    def test_streamed_trees(self):
+        nodes = DotNodes()
+        programs = [Node("Program", "", [Node("Identifier", "x", []), Node("Identifier", "y", [])]), None,
+                    Node("Program", "", [])]
+        path = os.path.join(self.folder, "cpp.store")
+        # a generator is consumed once, the file that failed to parse (None) is left out
+        write_store(path, (program for program in programs), ["a", "b", "c"], ["p0", "p1", "p2"],
+                    ["a.p0.tree", "b.p1.tree", "c.p2.tree"], "cpp")
+        store = TreeStore(path)
+        self.assertEqual(len(store), 2)
+        self.assertEqual((list(store.labels), list(store.names)), (["a", "c"], ["a.p0.tree", "c.p2.tree"]))
+        self.assertEqual(labels(store.tree(1), nodes), labels(programs[2], nodes))
+        self.assertEqual([store.root_children(idx) for idx in range(2)], [2, 0])
+        self.assertEqual(sorted(os.listdir(path)), ["codes.npy", "meta.json", "parents.npy", "program_offsets.npy",
+                                                    "types.npy"])
+
+    def test_python_round_trip(self):
+        nodes = AstNodes()
+        trees = [stamp_tree(ast.parse(inspect.getsource(module))) for module in (ast, inspect)]
+        path = os.path.join(self.folder, "python.store")
+        write_store(path, trees, ["a", "b"], ["p0", "p1"], ["p0.a.py", "p1.b.py"], "python", codes=False)
+        store = TreeStore(path)
+        for idx, tree in enumerate(trees):
+            stored = store.tree(idx)
+            self.assertIsInstance(stored, ast.Module)
+            self.assertEqual(flat_labels(stored, nodes), flat_labels(tree, nodes))
+            self.assertIsInstance(store.flat_tree(idx), FlatTree)
+            self.assertEqual(flat_labels(store.flat_tree(idx), nodes), flat_labels(tree, nodes))
+
+    def test_convert_folder(self):
+        folder = os.path.join(self.folder, "python")
+        os.makedirs(folder)
+        for idx in range(5):
+            with open(os.path.join(folder, "p{0}.user{1}.py".format(idx, idx % 2)), "w") as file:
+                file.write("def f{0}(a):\n    return a + {0}\n".format(idx))
+        path = convert_tree_files(folder)
+        self.assertEqual(path, folder + ".store")
+        X, y, tags, nodes = parse_src_files(folder)
+        stored, stored_y, stored_tags, _ = parse_src_files(path)
+        self.assertEqual(sorted(zip(y, tags)), sorted(zip(stored_y, stored_tags)))
+        expected = {tag: flat_labels(tree, nodes) for tree, tag in zip(X, tags)}
+        for tree, tag in zip(stored, stored_tags):
+            self.assertEqual(flat_labels(tree, nodes), expected[tag])
+
+
+if __name__ == "__main__":
+    unittest.main()
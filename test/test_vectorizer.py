@@ -0,0 +1,247 @@
+import ast
+import os
+import pickle
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+import scipy.sparse as sp
+
+import ast_tree.ASTVectorizater as vectorizer_module
+from ast_tree.ASTVectorizater import ASTVectorizer, TreeFeatures, hash_grams, hstack_csr, index_dtype
+from ast_tree.flat_tree import FlatTree
+from ast_tree.tree_nodes import AstNodes, DotNodes, Node, stamp_tree
+from ast_tree.tree_parser import parse_ast_tree
+from ast_tree.tree_store import TreeStore, write_store
+from pyscp.convert_python_ast import export_tree
+from utils.dataset_utils import parse_src_files
+
+CPP_TYPES = ["FunctionDef", "CompoundStatement", "ExpressionStatement", "AssignmentExpr", "Identifier",
+             "IfStatement", "Condition", "CallExpression", "Argument", "ReturnStatement"]
+
+
+def random_node(rng, depth):
+    children = [random_node(rng, depth - 1) for _ in range(rng.randint(0, 3))] if depth > 0 else []
+    return Node(rng.choice(CPP_TYPES), "x", children)
+
+
+def random_programs(count, seed=0):
+    rng = random.Random(seed)
+    return [Node("Program", "", [random_node(rng, 4) for _ in range(rng.randint(1, 4))]) for _ in range(count)]
+
+
+def same(a, b):
+    a, b = a.tocsr(), b.tocsr()
+    a.sort_indices()
+    b.sort_indices()
+    return (a.shape == b.shape and a.dtype == b.dtype and np.array_equal(a.indptr, b.indptr) and
+            np.array_equal(a.indices, b.indices) and np.array_equal(a.data, b.data))
+
+
+class TestCountCache(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.store = self.folder + "/cpp.store"
+        programs = random_programs(30)
+        labels = ["author{0}".format(i % 3) for i in range(len(programs))]
+        write_store(self.store, programs, labels, ["p{0}".format(i) for i in range(len(programs))],
+                    ["{0}.dot".format(i) for i in range(len(programs))], "cpp")
+        self.batch_size = vectorizer_module.COUNT_BATCH_SIZE
+
+    def tearDown(self):
+        vectorizer_module.COUNT_BATCH_SIZE = self.batch_size
+        shutil.rmtree(self.folder)
+
+    def test_lazy_seperate_trees(self):
+        X, y, _, nodes = parse_src_files(self.store, seperate_trees=True, lazy=True)
+        eager, _, _, _ = parse_src_files(self.store, seperate_trees=True)
+        self.assertEqual(X.keys.ndim, 2)
+        for kwargs in [{}, {"ngram": 3, "ngram_space": "vocabulary"}]:
+            self.assertTrue(same(ASTVectorizer(nodes, **kwargs).fit_transform(X),
+                                 ASTVectorizer(nodes, **kwargs).fit_transform(eager)))
+
+    def test_batches_and_reloads(self):
+        vectorizer_module.COUNT_BATCH_SIZE = 7
+        X, y, _, nodes = parse_src_files(self.store, seperate_trees=True, lazy=True)
+        X.cache.maxsize = 3
+        expected = ASTVectorizer(nodes, ngram=3, ngram_space="vocabulary").fit_transform(X)
+        vectorizer = ASTVectorizer(nodes, ngram=3, ngram_space="vocabulary")
+        vectorizer.count(X[1::2])
+        self.assertEqual(len(vectorizer._count_rows), len(X[1::2]))
+        self.assertTrue(same(vectorizer.fit_transform(X), expected))
+        # reloaded trees are new objects but keep their rows
+        vectorizer.fit_transform(X)
+        self.assertEqual(len(vectorizer._count_rows), len(X))
+
+    def test_identity_rows(self):
+        trees = np.empty(10, dtype=object)
+        trees[:] = random_programs(10, seed=1)
+        vectorizer = ASTVectorizer(DotNodes())
+        a = vectorizer.fit_transform(trees)
+        b = vectorizer.fit_transform(trees[::-1])
+        self.assertEqual(len(vectorizer._count_rows), 10)
+        self.assertTrue(same(a[::-1], b))
+
+
+def program_array(count, seed=0):
+    trees = np.empty(count, dtype=object)
+    trees[:] = random_programs(count, seed)
+    return trees
+
+
+class TestFusedSteps(unittest.TestCase):
+    def test_fit_then_transform(self):
+        trees = program_array(20)
+        for kwargs in [{}, {"idf": True}, {"ngram": 3, "ngram_space": "vocabulary", "min_df": 2}]:
+            self.assertTrue(same(ASTVectorizer(DotNodes(), **kwargs).fit_transform(trees),
+                                 ASTVectorizer(DotNodes(), **kwargs).fit(trees).transform(trees)), kwargs)
+
+    def test_pickle(self):
+        trees = program_array(10)
+        vectorizer = ASTVectorizer(DotNodes(), idf=True).fit(trees)
+        state = vectorizer.__getstate__()
+        self.assertIn("_sklearn_version", state)
+        self.assertNotIn("_counts", state)
+        # the vectorizer itself keeps its counts
+        self.assertIsNotNone(vectorizer._counts)
+        restored = pickle.loads(pickle.dumps(vectorizer))
+        self.assertTrue(same(restored.transform(trees), vectorizer.transform(trees)))
+
+
+class TestParallelCount(unittest.TestCase):
+    def test_same_as_serial(self):
+        trees = program_array(40)
+        other = program_array(15, seed=2)
+        for kwargs in [{}, {"ngram": 3, "ngram_space": "vocabulary"},
+                       {"ngram": 3, "ngram_space": "hashing", "n_features": 2 ** 12}, {"ngram": 3, "v_skip": 1}]:
+            serial = ASTVectorizer(DotNodes(), n_jobs=1, **kwargs)
+            parallel = ASTVectorizer(DotNodes(), n_jobs=2, **kwargs)
+            self.assertTrue(same(parallel.fit_transform(trees), serial.fit_transform(trees)), kwargs)
+            self.assertTrue(same(parallel.transform(other), serial.transform(other)), kwargs)
+            self.assertEqual(getattr(parallel, "vocabulary_", None), getattr(serial, "vocabulary_", None))
+
+
+class TestHashingSpace(unittest.TestCase):
+    def setUp(self):
+        self.trees = program_array(20)
+
+    def test_stable_width(self):
+        vectorizer = ASTVectorizer(DotNodes(), ngram=3, ngram_space="hashing", n_features=2 ** 10)
+        width = vectorizer.fit_transform(self.trees).shape[1]
+        self.assertEqual(vectorizer.transform(program_array(5, seed=3)).shape[1], width)
+        other = ASTVectorizer(DotNodes(), ngram=3, ngram_space="hashing", n_features=2 ** 10)
+        self.assertEqual(other.fit_transform(self.trees[:3]).shape[1], width)
+        wider = ASTVectorizer(DotNodes(), ngram=3, ngram_space="hashing", n_features=2 ** 11)
+        self.assertEqual(wider.fit_transform(self.trees).shape[1], width + 2 ** 10)
+
+    def test_deterministic(self):
+        kwargs = {"ngram": 3, "ngram_space": "hashing", "n_features": 2 ** 12}
+        self.assertTrue(same(ASTVectorizer(DotNodes(), **kwargs).fit_transform(self.trees),
+                             ASTVectorizer(DotNodes(), **kwargs).fit_transform(self.trees)))
+        # the columns do not depend on the hash seed of the process
+        keys = [7, 2 ** 40 + 3, 3 ** 50, 12345678901234567890123]
+        script = "from ast_tree.ASTVectorizater import hash_grams; print(list(hash_grams({0}, 4096)))".format(keys)
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        for seed in ("1", "2"):
+            env = dict(os.environ, PYTHONHASHSEED=seed, PYTHONPATH=root)
+            out = subprocess.check_output([sys.executable, "-c", script], env=env, cwd=root, universal_newlines=True)
+            self.assertEqual(out.strip().splitlines()[-1], str(list(hash_grams(keys, 4096))))
+
+    def test_unigrams_as_vocabulary(self):
+        n_features = 2 ** 20
+        vocabulary = ASTVectorizer(DotNodes(), ngram=1, ngram_space="vocabulary")
+        expected = vocabulary.fit_transform(self.trees).tocsc()[:, :len(vocabulary.vocabulary_)]
+        hashing = ASTVectorizer(DotNodes(), ngram=1, ngram_space="hashing", n_features=n_features)
+        block = hashing.fit_transform(self.trees).tocsc()[:, :n_features]
+        keys = sorted(vocabulary.vocabulary_, key=vocabulary.vocabulary_.get)
+        columns = hash_grams(keys, n_features)
+        self.assertEqual(len(set(columns)), len(keys))
+        self.assertEqual(block.nnz, expected.nnz)
+        self.assertTrue(np.array_equal(block[:, columns].toarray(), expected.toarray()))
+
+
+class TestSparseAssembly(unittest.TestCase):
+    def blocks(self, dtype):
+        rng = np.random.RandomState(0)
+        return [sp.random(6, width, density=0.4, format="csr", dtype=dtype, random_state=rng) for width in (5, 1, 9)] + \
+               [sp.csr_matrix((6, 3), dtype=dtype)]
+
+    def test_same_as_hstack(self):
+        for dtype in (np.float32, np.float64):
+            blocks = self.blocks(dtype)
+            stacked = hstack_csr(blocks, dtype)
+            self.assertEqual(stacked.dtype, dtype)
+            self.assertEqual(stacked.indices.dtype, np.int32)
+            self.assertTrue(same(stacked, sp.hstack(blocks).tocsr()))
+
+    def test_index_dtype(self):
+        self.assertEqual(index_dtype(2 ** 31 - 1), np.int32)
+        self.assertEqual(index_dtype(2 ** 31), np.int64)
+        wide = sp.csr_matrix((np.ones(2, dtype=np.float32), ([0, 1], [0, 2 ** 31 - 1])), shape=(2, 2 ** 31))
+        stacked = hstack_csr([sp.csr_matrix(np.eye(2, dtype=np.float32)), wide], np.float32)
+        self.assertEqual(stacked.shape, (2, 2 ** 31 + 2))
+        self.assertEqual(stacked.indices.dtype, np.int64)
+        self.assertEqual(list(stacked.indices), [0, 2, 1, 2 ** 31 + 1])
+
+    def test_dtype_and_counts_kept(self):
+        trees = program_array(20)
+        for kwargs in [{}, {"binary": True}, {"ngram": 3, "ngram_space": "vocabulary"}, {"idf": True},
+                       {"dtype": np.float64}]:
+            vectorizer = ASTVectorizer(DotNodes(), **kwargs)
+            counts = [block.copy() for block in vectorizer.count(trees)]
+            cached = [block.copy() for block in vectorizer._counts]
+            X = vectorizer.fit_transform(trees)
+            self.assertEqual(X.dtype, kwargs.get("dtype", np.float32), kwargs)
+            self.assertTrue(all(block.dtype == X.dtype for block in counts), kwargs)
+            # the blocks are normalized in place, the kept counts are not
+            self.assertTrue(all(same(a, b) for a, b in zip(vectorizer._counts, cached)), kwargs)
+            self.assertTrue(all(same(a, b) for a, b in zip(vectorizer.count(trees), counts)), kwargs)
+            self.assertTrue(same(vectorizer.transform(trees), X), kwargs)
+
+
+# keywords that are derived from the node types alone, so every kind of python tree has them
+KEYWORD_SOURCE = '''try:
+    x = a and b and c
+except ValueError:
+    pass
+for i in y:
+    z = not i in q or w is not v
+def f():
+    return lambda: 1
+'''
+
+
+class TestKeywords(unittest.TestCase):
+    def setUp(self):
+        self.nodes = AstNodes()
+        self.features = TreeFeatures(self.nodes)
+        self.tree = stamp_tree(ast.parse(KEYWORD_SOURCE))
+
+    def keywords(self, tree):
+        return {self.features.keywords.get(idx): count for idx, count in self.features.tf_keywords(tree).items()}
+
+    def test_ast(self):
+        self.assertEqual(self.keywords(self.tree), {"try": 1, "and": 2, "except": 1, "pass": 1, "for": 1, "in": 2,
+                                                    "not": 2, "or": 1, "is": 1, "def": 1, "return": 1, "lambda": 1})
+
+    def test_same_for_every_tree_kind(self):
+        expected = self.keywords(self.tree)
+        folder = tempfile.mkdtemp()
+        try:
+            write_store(folder + "/python.store", [self.tree], ["a"], ["p"], ["p.a.py"], "python")
+            stored = TreeStore(folder + "/python.store").tree(0)
+        finally:
+            shutil.rmtree(folder)
+        trees = {"flat": FlatTree.from_tree(self.tree, self.nodes),
+                 "python_trees": parse_ast_tree(None, lines=export_tree(self.tree).splitlines(True)),
+                 "store": stored}
+        for kind, tree in trees.items():
+            self.assertEqual(self.keywords(tree), expected, kind)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,10 @@
 
-from ast_tree.traverse import bfs, children
+import hashlib
+import os
+
+from ast_tree.flat_tree import FlatTree
+from ast_tree.traverse import TreeWalk, bfs, children
+from utils.parse_cache import file_hash
 import numpy as np
 
 
@@ -40,3 +45,172 @@ def avg_branch(ast_tree):
     out = bfs(ast_tree, callback=avg_branch_lambda, mode="all", out=[])
     return int(np.mean(out))
 
+
+
+def tree_size_depth(ast_tree):
+    '''(node count, max depth) in one iterative pass'''
+    count = 0
+    depth = 0
+    stack = [(ast_tree, 0)]
+    while stack:
+        node, d = stack.pop()
+        count += 1
+        if d > depth:
+            depth = d
+        stack.extend((child, d + 1) for child in children(node))
+    return count, depth
+
+
+STAT_COLUMNS = ("nodes", "leaves", "max_depth", "avg_depth", "max_branch", "avg_branch")
+
+
+def _tree_arrays(tree, nodes=None):
+    '''(depths, branches, types) arrays of one tree in pre-order, types is None without nodes'''
+    if tree is None:
+        return [], [], []
+    if isinstance(tree, FlatTree):
+        types, parents, depths = tree.arrays()
+        branches = np.bincount(parents[1:], minlength=len(parents))
+        return depths, branches, types if nodes is not None else None
+    walk = TreeWalk(tree)
+    branches = [len(kids) for kids in walk.kids]
+    types = [nodes.index(node) for node in walk.nodes] if nodes is not None else None
+    return walk.depths, branches, types
+
+
+class TreeStats:
+    '''Per tree statistics of a corpus as a table of numpy columns (see STAT_COLUMNS).
+
+    Every tree is walked once, then all columns are computed with array reductions over the
+    concatenated node arrays of the whole corpus. max_depth and max_branch are the values of the
+    functions above, avg_depth and avg_branch are the exact means (the functions above truncate them
+    to int). With the nodes dictionary, type_depths[t, d] counts the nodes of type t at depth d over
+    the corpus. A table is saved to / loaded from a .npz file so plots can be redrawn without parsing
+    the corpus again, key is the content_key of the corpus it was computed from.'''
+
+    def __init__(self, columns, labels=None, type_depths=None, key=None):
+        self.columns = columns
+        self.labels = np.asarray(labels) if labels is not None else None
+        self.type_depths = type_depths
+        self.key = key
+
+    @classmethod
+    def from_trees(cls, trees, labels=None, nodes=None):
+        depths, branches, types = [], [], []
+        sizes = np.zeros(len(trees), dtype=np.int64)
+        for idx, tree in enumerate(trees):
+            tree_depths, tree_branches, tree_types = _tree_arrays(tree, nodes)
+            sizes[idx] = len(tree_depths)
+            depths.append(np.asarray(tree_depths, dtype=np.int64))
+            branches.append(np.asarray(tree_branches, dtype=np.int64))
+            if nodes is not None:
+                types.append(np.asarray(tree_types, dtype=np.int64))
+        if len(trees) == 0:
+            return cls({name: np.zeros(0) for name in STAT_COLUMNS}, labels)
+        depths = np.concatenate(depths)
+        branches = np.concatenate(branches)
+        offsets = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+        tree_ids = np.repeat(np.arange(len(trees)), sizes)
+        parents = np.bincount(tree_ids, weights=branches > 0, minlength=len(trees))
+        # files that failed to parse have no tree, all their stats are 0
+        parsed = sizes > 0
+        max_depths = np.zeros(len(trees), dtype=np.int64)
+        max_branches = np.zeros(len(trees), dtype=np.int64)
+        if len(depths) > 0:
+            max_depths[parsed] = np.maximum.reduceat(depths, offsets[parsed])
+            max_branches[parsed] = np.maximum.reduceat(branches, offsets[parsed])
+        columns = {
+            "nodes": sizes,
+            "leaves": sizes - parents.astype(np.int64),
+            "max_depth": max_depths,
+            "avg_depth": np.bincount(tree_ids, weights=depths, minlength=len(trees)) / np.maximum(sizes, 1),
+            "max_branch": max_branches,
+            # every node but the root is the child of one parent
+            "avg_branch": np.maximum(sizes - 1, 0) / np.maximum(parents, 1),
+        }
+        type_depths = None
+        if nodes is not None:
+            types = np.concatenate(types)
+            width = max_depths.max() + 1
+            type_depths = np.bincount(types * width + depths, minlength=nodes.size() * width)
+            type_depths = type_depths.reshape(-1, width)
+        return cls(columns, labels, type_depths)
+
+    def __len__(self):
+        return len(self.columns["nodes"])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def by_author(self, columns=STAT_COLUMNS):
+        '''(authors, table) with the tree count and the mean and max of every column per author'''
+        authors, author_ids = np.unique(self.labels, return_inverse=True)
+        counts = np.bincount(author_ids, minlength=len(authors))
+        table = {"trees": counts}
+        for name in columns:
+            column = self.columns[name]
+            table[name + "_mean"] = np.bincount(author_ids, weights=column, minlength=len(authors)) / counts
+            column_max = np.full(len(authors), -np.inf)
+            np.maximum.at(column_max, author_ids, column)
+            table[name + "_max"] = column_max
+        return authors, table
+
+    def save(self, filename):
+        arrays = dict(self.columns)
+        if self.labels is not None:
+            arrays["labels"] = self.labels.astype(str)
+        if self.type_depths is not None:
+            arrays["type_depths"] = self.type_depths
+        if self.key is not None:
+            arrays["key"] = np.array(self.key)
+        with open(filename, "wb") as file:
+            np.savez_compressed(file, **arrays)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as data:
+            columns = {name: data[name] for name in STAT_COLUMNS}
+            labels = data["labels"] if "labels" in data else None
+            type_depths = data["type_depths"] if "type_depths" in data else None
+            key = str(data["key"]) if "key" in data else None
+        return cls(columns, labels, type_depths, key)
+
+
+def content_key(files, nodes=None):
+    '''sha1 of the names and contents of the source files (in order) and of the vocabulary of nodes'''
+    digest = hashlib.sha1()
+    for filename in files:
+        digest.update(os.path.basename(filename).encode("utf-8"))
+        digest.update(file_hash(filename).encode("utf-8"))
+    if nodes is not None:
+        digest.update(nodes.vocabulary.signature().encode("utf-8"))
+    return digest.hexdigest()
+
+
+def saved_tree_stats(filename, files, nodes=None):
+    '''the TreeStats saved in filename when it was computed from the same source files (same
+    content_key), else None. Only the files are read, so it is checked before parsing the corpus.'''
+    if not os.path.isfile(filename):
+        return None
+    stats = TreeStats.load(filename)
+    if stats.key is None or stats.key != content_key(files, nodes):
+        return None
+    return stats
+
+
+def tree_stats(trees, labels=None, nodes=None, filename=None, files=None):
+    '''TreeStats of the trees, read from filename when it was saved there for the same labels and the
+    same content_key of files (the source files the trees were parsed from). Without files the saved
+    table can't be checked and is always recomputed.'''
+    key = content_key(files, nodes) if files is not None else None
+    if filename is not None and key is not None:
+        stats = saved_tree_stats(filename, files, nodes)
+        same_labels = stats is not None and (labels is None or (stats.labels is not None and
+                                             np.array_equal(stats.labels, np.asarray(labels).astype(str))))
+        if same_labels and len(stats) == len(trees):
+            return stats
+    stats = TreeStats.from_trees(trees, labels, nodes)
+    stats.key = key
+    if filename is not None:
+        stats.save(filename)
+    return stats
@@ -0,0 +1,118 @@
+import io
+import json
+import os
+import tarfile
+import zipfile
+
+from utils.job_utils import atomic_write
+
+ARCHIVE_EXTS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+INDEX_EXT = ".index"
+
+
+def is_archive(path):
+    return path.endswith(ARCHIVE_EXTS) and os.path.isfile(path)
+
+
+def archive_folder(path):
+    '''dataset folder name of an archive, dataset/cpp.tar.gz -> dataset/cpp'''
+    for ext in sorted(ARCHIVE_EXTS, key=len, reverse=True):
+        if path.endswith(ext):
+            return path[:-len(ext)]
+    return path
+
+
+# archives already opened by this process, so pickled archives are re-opened once per worker
+_archives = {}
+
+
+def open_archive(path):
+    archive = _archives.get(path)
+    if archive is None:
+        archive = _archives[path] = CorpusArchive(path)
+    return archive
+
+
+class CorpusArchive:
+    '''Random access to the files of a zip or tar corpus without extracting it.
+
+    The member index (file members in archive order) is built once: zip archives read their central
+    directory, tar archives are scanned once and the index with the data offsets is saved next to the
+    archive as <archive>.index. Members of a plain tar are read with a seek, compressed tars go
+    through tarfile. Pickling an archive only sends its path, a worker process opens it (and loads
+    the saved index) the first time it is used; forked workers re-open their own file handle.'''
+
+    def __init__(self, path):
+        self.path = path
+        self.handle = None
+        self.pid = None
+        if zipfile.is_zipfile(path):
+            self.kind = "zip"
+            with zipfile.ZipFile(path) as archive:
+                self.members = [info.filename for info in archive.infolist() if not info.is_dir()]
+            self.offsets = None
+        else:
+            self.kind = "tar"
+            self._load_tar_index()
+
+    def _load_tar_index(self):
+        stat = os.stat(self.path)
+        index_file = self.path + INDEX_EXT
+        index = None
+        if os.path.isfile(index_file):
+            with open(index_file) as file:
+                index = json.load(file)
+            if index.get("size") != stat.st_size or index.get("mtime") != stat.st_mtime_ns:
+                index = None
+        if index is None:
+            compressed = False
+            try:
+                archive = tarfile.open(self.path, "r:")
+            except tarfile.ReadError:
+                compressed = True
+                archive = tarfile.open(self.path, "r:*")
+            with archive:
+                members = [(info.name, info.offset_data, info.size) for info in archive if info.isfile()]
+            index = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "compressed": compressed, "members": members}
+            with atomic_write(index_file) as file:
+                json.dump(index, file)
+        self.compressed = index["compressed"]
+        self.members = [name for name, _, _ in index["members"]]
+        self.offsets = {name: (offset, size) for name, offset, size in index["members"]}
+
+    def __reduce__(self):
+        return open_archive, (self.path,)
+
+    def __len__(self):
+        return len(self.members)
+
+    def _open(self):
+        # forked workers must not share the parent's file position
+        if self.handle is None or self.pid != os.getpid():
+            self.pid = os.getpid()
+            if self.kind == "zip":
+                self.handle = zipfile.ZipFile(self.path)
+            elif self.compressed:
+                self.handle = tarfile.open(self.path, "r:*")
+            else:
+                self.handle = open(self.path, "rb")
+        return self.handle
+
+    def read(self, member):
+        handle = self._open()
+        if self.kind == "zip":
+            return handle.read(member)
+        if self.compressed:
+            return handle.extractfile(member).read()
+        offset, size = self.offsets[member]
+        handle.seek(offset)
+        return handle.read(size)
+
+    def read_text(self, member):
+        '''text of a member with universal newlines, as open() reads an extracted file'''
+        return io.StringIO(self.read(member).decode("utf-8"), newline=None).read()
+
+    def close(self):
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
@@ -0,0 +1,122 @@
+import json
+import os
+
+import numpy as np
+
+from utils.job_utils import atomic_write
+from utils.parse_cache import file_hash
+
+MANIFEST_VERSION = 1
+MANIFEST_EXT = ".manifest"
+
+
+def split_ast_name(filename):
+    '''(author, problem) of a python dataset file named <problem>.<author>.py, both empty for a name
+    without a dot as get_ast_src_files had them'''
+    name = filename.split('.')[:-1] or ['']
+    return ' '.join(name[1:]), name[0]
+
+
+def split_dot_name(filename):
+    '''(author, problem) of a cpp dataset file named <author>.<problem>.<ext>, empty for the
+    parts a name does not have'''
+    name = filename.split('.')[:-1] + ['', '']
+    return name[0], name[1]
+
+
+class CorpusManifest:
+    '''Index of a dataset folder stored next to it as <basefolder>.manifest.
+
+    One entry per file with its path (relative to the folder), author, problem, size, content hash
+    and the node count and depth of its tree. refresh() re-scans the folder with os.scandir and only
+    re-hashes files whose size or modification time changed; tree statistics are kept as long as the
+    content hash is the same and are None until set_stats() is called for the entry.'''
+
+    def __init__(self, basefolder, split_name):
+        self.basefolder = basefolder.rstrip("/\\")
+        self.path = self.basefolder + MANIFEST_EXT
+        self.split_name = split_name
+        self.entries = []
+        self.dirty = False
+        self._authors = None
+        if os.path.isfile(self.path):
+            with open(self.path) as file:
+                manifest = json.load(file)
+            if manifest.get("version") == MANIFEST_VERSION:
+                self.entries = manifest["entries"]
+
+    def refresh(self):
+        '''re-scan the folder, returns the indices of the entries without tree statistics'''
+        old = {entry["path"]: entry for entry in self.entries}
+        entries = []
+        with os.scandir(self.basefolder) as scan:
+            for file in scan:
+                if not file.is_file():
+                    continue
+                stat = file.stat()
+                entry = old.get(file.name)
+                if entry is None or entry["size"] != stat.st_size or entry["mtime"] != stat.st_mtime_ns:
+                    hash = file_hash(file.path)
+                    if entry is None or entry["hash"] != hash:
+                        author, problem = self.split_name(file.name)
+                        entry = {"path": file.name, "author": author, "problem": problem, "hash": hash,
+                                 "nodes": None, "depth": None}
+                    entry["size"] = stat.st_size
+                    entry["mtime"] = stat.st_mtime_ns
+                    self.dirty = True
+                entries.append(entry)
+        if len(entries) != len(old):
+            self.dirty = True
+        self.entries = entries
+        self._authors = None
+        return [idx for idx, entry in enumerate(entries) if entry["nodes"] is None]
+
+    def set_stats(self, index, nodes, depth):
+        entry = self.entries[index]
+        if entry["nodes"] != nodes or entry["depth"] != depth:
+            entry["nodes"] = nodes
+            entry["depth"] = depth
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        with atomic_write(self.path) as file:
+            json.dump({"version": MANIFEST_VERSION, "entries": self.entries}, file)
+        self.dirty = False
+
+    def __len__(self):
+        return len(self.entries)
+
+    def author_index(self):
+        '''author -> indices of the author's entries'''
+        if self._authors is None:
+            self._authors = {}
+            for idx, entry in enumerate(self.entries):
+                self._authors.setdefault(entry["author"], []).append(idx)
+        return self._authors
+
+    def select(self, authors=None, problems=None):
+        '''indices of the entries of the given authors and problems, in folder order'''
+        if authors is None:
+            indices = range(len(self.entries))
+        else:
+            index = self.author_index()
+            indices = sorted(idx for author in set(authors) for idx in index.get(author, []))
+        if problems is not None:
+            problems = set(problems)
+            indices = [idx for idx in indices if self.entries[idx]["problem"] in problems]
+        return list(indices)
+
+    def files(self, authors=None, problems=None):
+        '''same (names, users, problems) arrays as get_ast_src_files / get_dot_src_files'''
+        entries = [self.entries[idx] for idx in self.select(authors, problems)]
+        return np.array([os.path.join(self.basefolder, entry["path"]) for entry in entries]), \
+               np.array([entry["author"] for entry in entries]), \
+               np.array([entry["problem"] for entry in entries])
+
+    def stats(self):
+        '''node count and depth of every entry, -1 where unknown or unparsable'''
+        nodes = np.array([entry["nodes"] if entry["nodes"] is not None else -1 for entry in self.entries])
+        depth = np.array([entry["depth"] if entry["depth"] is not None else -1 for entry in self.entries])
+        return nodes, depth
@@ -3,31 +3,41 @@ import os
 import platform
 import random
 import sys
-import numpy as np
+from functools import partial
+from multiprocessing import Pool
+from multiprocessing.pool import MaybeEncodingError
 
-import copy
+import numpy as np
 
 from tqdm import tqdm
 
 from ast_tree.traverse import children, bfs
-from ast_tree.tree_nodes import DotNodes, AstNodes
+from ast_tree.tree_nodes import DotNodes, AstNodes, Node
 from ast_tree.tree_parser import parse_dot, ast_parse_file, fast_parse_dot, parse_tree, parse_ast_tree
-from utils.analysis_utils import max_depth, max_branch,avg_branch,avg_depth
+from ast_tree.tree_store import TreeStore, write_store, is_store, STORE_EXT
+from ast_tree.flat_tree import FlatTree
+from ast_tree.tree_dag import InternTable, intern_trees
+from utils.analysis_utils import max_depth, max_branch,avg_branch,avg_depth,tree_size_depth
+from utils.corpus_manifest import CorpusManifest, split_ast_name, split_dot_name
+from utils.corpus_archive import is_archive, open_archive, archive_folder
+from utils.job_utils import n_processes
+from utils.parse_cache import ParseCache, file_hash
+from utils.tree_dataset import TreeDataset
 
 
 def get_ast_src_files(basefolder):
     files = os.listdir(basefolder)
-    files_noext = ['.'.join(s.split('.')[:-1]) for s in files]
-    problems = [p.split('.')[0] for p in files_noext]
-    users = [' '.join(p.split('.')[1:]) for p in files_noext]
+    names = [split_ast_name(s) for s in files]
+    problems = [problem for _, problem in names]
+    users = [user for user, _ in names]
 
     return np.array([os.path.join(basefolder, file) for file in files]), np.array(users), np.array(problems)
 
 def get_dot_src_files(basefolder):
     files = os.listdir(basefolder) # sorted([s.lower() for s in ])
-    files_noext = ['.'.join(s.split('.')[:-1]) for s in files]
-    problems = [p.split('.')[1] for p in files_noext]
-    users = [p.split('.')[0] for p in files_noext]
+    names = [split_dot_name(s) for s in files]
+    problems = [problem for _, problem in names]
+    users = [user for user, _ in names]
 
     return np.array([os.path.join(basefolder, file) for file in files]), np.array(users), np.array(problems)
 
@@ -54,27 +64,379 @@ def get_dot_files2(basefolder,seperate_trees=False):
         users.extend([file.split('.')[0]]*len(program_trees))
     return np.array(trees),np.array(users),np.array(problems)
 
-def parse_src_files(basefolder, seperate_trees=False,verbose=0):
+def _parse_chunk(args):
+    parse_fn, names = args
+    results = []
+    for name in names:
+        try:
+            results.append((parse_fn(name), None))
+        except Exception as e:
+            results.append((None, e))
+    return results
+
+
+def parse_files(names, parse_fn, n_jobs=1, chunksize=64, cache=None):
+    """Parse every file in names with parse_fn, in order.
+
+    With n_jobs > 1 (or -1 for all cores) the files are handed to a process pool in chunks of
+    chunksize; results come back in the same order as names. A chunk whose trees are too deep to be
+    sent back from a worker is parsed again in this process. Failed files yield None and are
+    reported together once parsing is done. When cache is a dataset folder, trees are read from
+    and written to its parse cache and only new or modified files are parsed."""
+    if cache is not None:
+        return parse_cached_files(cache, names, parse_fn, n_jobs=n_jobs, chunksize=chunksize)
+    return list(iter_parse_files(names, parse_fn, n_jobs=n_jobs, chunksize=chunksize))
+
+
+def iter_parse_files(names, parse_fn, n_jobs=1, chunksize=64):
+    '''parse_files as a generator: trees are yielded in the order of names as soon as their chunk is
+    parsed, so a caller can consume a corpus without holding all of its trees'''
+    n_jobs = n_processes(n_jobs)
+    chunks = [(parse_fn, names[i:i + chunksize]) for i in range(0, len(names), chunksize)]
+    failed = []
+
+    def parsed(chunk, results):
+        for name, (tree, error) in zip(chunk[1], results):
+            if tree is None:
+                failed.append((name, error))
+            yield tree
+
+    with tqdm(total=len(names)) as bar:
+        if n_jobs == 1 or len(chunks) <= 1:
+            for name in names:
+                yield from parsed((parse_fn, [name]), _parse_chunk((parse_fn, [name])))
+                bar.update(1)
+        else:
+            with Pool(min(n_jobs, len(chunks))) as pool:
+                chunk_results = pool.imap(_parse_chunk, chunks)
+                for chunk in chunks:
+                    try:
+                        results = next(chunk_results)
+                    except MaybeEncodingError:
+                        # a tree too deep to be pickled back from the worker, parse this chunk here
+                        results = _parse_chunk(chunk)
+                    yield from parsed(chunk, results)
+                    bar.update(len(chunk[1]))
+
+    if len(failed) > 0:
+        print("ERROR: {0} of {1} files failed to parse".format(len(failed), len(names)))
+        for name, error in failed:
+            print("ERROR: ", error if error is not None else "no tree", " filename", name)
+
+
+def parse_store(path, seperate_trees=False, flat=False, classes=None):
+    store = TreeStore(path)
+    nodes = store.node_dict()
+    programs = store_programs(store, classes)
+    # as the folder loaders, python programs are never split into statements
+    if not seperate_trees or store.kind == "python":
+        if flat:
+            return np.array([store.flat_tree(idx, nodes) for idx in programs]), store.labels[programs], store.problems[programs], nodes
+        return np.array([store.tree(idx) for idx in programs]), store.labels[programs], store.problems[programs], nodes
+    X = []
+    y = []
+    for idx in programs:
+        if flat:
+            tree = store.flat_tree(idx, nodes)
+            program_trees = [tree.subtree(child.index) for child in tree.children]
+        else:
+            program_trees = store.tree(idx, seperate_trees=True)
+        X.extend(program_trees)
+        y.extend([store.labels[idx]] * len(program_trees))
+    return np.array(X), np.array(y), store.problems[programs], nodes
+
+
+def class_filter(classes):
+    '''predicate on labels for a class whitelist (any iterable of labels) or a predicate, None keeps all'''
+    if classes is None or callable(classes):
+        return classes
+    return set(classes).__contains__
+
+
+def select_files(X_names, y, problems, classes=None):
+    keep = class_filter(classes)
+    if keep is None:
+        return X_names, y, problems
+    selected = np.array([idx for idx, label in enumerate(y) if keep(label)], dtype=np.int64)
+    return X_names[selected], y[selected], problems[selected]
+
+
+def archive_src_files(archive):
+    '''(members, users, problems) of a corpus archive, authors and problems come from the member file
+    names with the same rules as get_ast_src_files / get_dot_src_files'''
+    split_name = split_dot_name if archive_folder(archive.path).endswith("cpp") else split_ast_name
+    names = [split_name(os.path.basename(member)) for member in archive.members]
+    return np.array(archive.members), np.array([user for user, _ in names]), np.array([problem for _, problem in names])
+
+
+def store_programs(store, classes=None):
+    keep = class_filter(classes)
+    if keep is None:
+        return np.arange(len(store))
+    return np.array([idx for idx, label in enumerate(store.labels) if keep(label)], dtype=np.int64)
+
+
+def flat_tree(tree, nodes):
+    return FlatTree.from_tree(tree, nodes) if tree is not None else None
+
+
+def flat_trees(trees, nodes):
+    X = np.empty(len(trees), dtype=object)
+    for idx, tree in enumerate(trees):
+        X[idx] = flat_tree(tree, nodes)
+    return X
+
+
+def convert_tree_files(basefolder, path=None, n_jobs=1):
+    """Convert a dataset folder (python, python_trees or cpp) into a columnar tree store, written
+    next to the folder as <basefolder>.store unless path is given."""
+    basefolder = basefolder.rstrip("/\\")
+    if path is None:
+        path = basefolder + STORE_EXT
+    if basefolder.endswith("cpp"):
+        X_names, y, problems = get_dot_src_files(basefolder)
+        programs = iter_parse_files(X_names, parse_tree, n_jobs=n_jobs)
+        X = (roots[0] if roots is not None else None for roots in programs)
+        kind = "cpp"
+    else:
+        X_names, y, problems = get_ast_src_files(basefolder)
+        X = iter_parse_files(X_names, ast_parse_file if basefolder.endswith("python") else parse_ast_tree,
+                             n_jobs=n_jobs)
+        kind = "python"
+    # every program is flattened into the store as it is parsed, files that failed are left out
+    write_store(path, X, y, problems, X_names, kind, codes=(kind == "cpp"))
+    return path
+
+
+def parse_cached_files(basefolder, names, parse_fn, n_jobs=1, chunksize=64):
+    cache = ParseCache(basefolder, parse_fn)
+    hashes = [file_hash(name) for name in names]
+    missing = [idx for idx, hash in enumerate(hashes) if not cache.contains(hash)]
+    print("parse cache: {0} files cached, {1} to parse".format(len(names) - len(missing), len(missing)))
+    trees = [None] * len(names)
+    if len(missing) > 0:
+        parsed = parse_files([names[idx] for idx in missing], parse_fn, n_jobs=n_jobs, chunksize=chunksize)
+        uncached = []
+        for idx, tree in zip(missing, parsed):
+            if tree is not None and not cache.put(hashes[idx], tree):
+                uncached.append(names[idx])
+            trees[idx] = tree
+        if len(uncached) > 0:
+            # parsed again on every load
+            print("parse cache: {0} trees too deep to cache".format(len(uncached)))
+    missing = set(missing)
+    for idx, hash in enumerate(hashes):
+        if idx not in missing:
+            trees[idx] = cache.get(hash)
+    cache.update({os.path.basename(name): hash for name, hash in zip(names, hashes)})
+    return trees
+
+
+def get_manifest(basefolder):
+    basefolder = basefolder.rstrip("/\\")
+    return CorpusManifest(basefolder, split_dot_name if basefolder.endswith("cpp") else split_ast_name)
+
+
+def set_manifest_stats(manifest, names, trees):
+    '''record node count and depth of parsed trees (one tree or a list of program roots per file)'''
+    positions = {entry["path"]: idx for idx, entry in enumerate(manifest.entries)}
+    for name, tree in zip(names, trees):
+        if tree is None:
+            size, depth = -1, -1
+        elif isinstance(tree, list):
+            # seperate cpp trees, count the Program root they hang from
+            stats = [tree_size_depth(t) for t in tree]
+            size = 1 + sum(s for s, _ in stats)
+            depth = 1 + max([d for _, d in stats] + [-1])
+        else:
+            size, depth = tree_size_depth(tree)
+        manifest.set_stats(positions[os.path.basename(name)], size, depth)
+
+
+def scan_manifest(basefolder):
+    '''refresh file entries of the manifest without parsing anything'''
+    manifest = get_manifest(basefolder)
+    manifest.refresh()
+    manifest.save()
+    return manifest
+
+
+def build_manifest(basefolder, n_jobs=1):
+    """Create or refresh the manifest of a dataset folder, only new or modified files are hashed
+    and parsed for their tree statistics."""
+    manifest = get_manifest(basefolder)
+    missing = manifest.refresh()
+    if len(missing) > 0:
+        names = [os.path.join(manifest.basefolder, manifest.entries[idx]["path"]) for idx in missing]
+        set_manifest_stats(manifest, names, parse_files(names, tree_parser(manifest.basefolder), n_jobs=n_jobs))
+    manifest.save()
+    return manifest
+
+
+def tree_parser(basefolder):
     if basefolder.endswith("python"):
+        return ast_parse_file
+    elif basefolder.endswith("python_trees"):
+        return parse_ast_tree
+    return parse_program
+
+
+def parse_program(filename, lines=None):
+    return parse_tree(filename, lines=lines)[0]
+
+
+def parse_member(archive, parse_fn, member, **kwargs):
+    '''parse one member of a corpus archive with a file parser, without extracting it'''
+    filename = "{0}:{1}".format(archive.path, member)
+    text = archive.read_text(member)
+    if parse_fn is ast_parse_file:
+        return ast_parse_file(filename, source=text)
+    return parse_fn(filename, lines=text.splitlines(True), **kwargs)
+
+
+def file_parser(basefolder, parse_fn, **kwargs):
+    '''parse_fn for the names listed by src_files, which are archive members when basefolder is an archive'''
+    if is_archive(basefolder):
+        return partial(parse_member, open_archive(basefolder), parse_fn, **kwargs)
+    return partial(parse_fn, **kwargs) if len(kwargs) > 0 else parse_fn
+
+
+def _store_subtree(store, key):
+    return store.tree(key[0], seperate_trees=True)[key[1]]
+
+
+def _store_flat_subtree(store, nodes, key):
+    tree = store.flat_tree(key[0], nodes)
+    return tree.subtree(tree.children[key[1]].index)
+
+
+def _dag_loader(loader, key):
+    '''the tree shares the identical subtrees within itself, a table kept across loads would hold
+    every tree the dataset ever loaded (and ids of freed nodes), so each load gets its own'''
+    return InternTable().intern(loader(key))
+
+
+def _flat_loader(loader, nodes, key):
+    return flat_tree(loader(key), nodes)
+
+
+def load_src_files(basefolder, seperate_trees=False, cache_size=1024, flat=False, manifest=False, classes=None, dag=False):
+    """Lazy counterpart of parse_src_files, the trees are returned as a TreeDataset that parses
+    (or decodes) a tree only when it is accessed. With dag=True the subtrees are shared within each
+    loaded tree only, see _dag_loader."""
+    if dag and flat:
+        raise ValueError("dag and flat can't be combined, FlatTrees are arrays and share no subtrees")
+    if dag:
+        X, y, tags, nodes = load_src_files(basefolder, seperate_trees, cache_size, flat, manifest, classes)
+        X.loader = partial(_dag_loader, X.loader)
+        return X, y, tags, nodes
+    if is_store(basefolder):
+        store = TreeStore(basefolder)
+        nodes = store.node_dict()
+        programs = store_programs(store, classes)
+        if not seperate_trees or store.kind == "python":
+            loader = partial(store.flat_tree, nodes=nodes) if flat else store.tree
+            X = TreeDataset(loader, programs, store.labels[programs], store.problems[programs], cache_size)
+        else:
+            # one row per child of a program root, labels and problems follow the rows
+            keys = np.array([(p, k) for p in programs for k in range(store.root_children(p))],
+                            dtype=np.int64).reshape(-1, 2)
+            loader = partial(_store_flat_subtree, store, nodes) if flat else partial(_store_subtree, store)
+            X = TreeDataset(loader, keys, store.labels[keys[:, 0]], store.problems[keys[:, 0]], cache_size)
+        return X, X.labels, X.problems, nodes
+    folder = archive_folder(basefolder)
+    manifest = scan_manifest(basefolder) if manifest and not is_archive(basefolder) else None
+    if folder.endswith("python") or folder.endswith("python_trees"):
+        X_names, y, problems = src_files(basefolder, manifest, classes)
+        loader = file_parser(basefolder, ast_parse_file if folder.endswith("python") else parse_ast_tree)
+        nodes = AstNodes()
+    elif folder.endswith("cpp"):
+        if seperate_trees:
+            raise ValueError("lazy loading of seperate trees needs a tree store, see convert_tree_files")
+        X_names, y, problems = src_files(basefolder, manifest, classes)
+        loader = file_parser(basefolder, parse_program)
+        nodes = DotNodes()
+    if flat:
+        loader = partial(_flat_loader, loader, nodes)
+    return TreeDataset(loader, X_names, y, problems, cache_size), np.array(y), problems, nodes
+
+
+def src_files(basefolder, manifest=None, classes=None):
+    '''(names, users, problems) of a dataset folder or archive, restricted to the files of the given classes'''
+    if is_archive(basefolder):
+        X_names, y, problems = archive_src_files(open_archive(basefolder))
+    elif manifest is not None:
+        # the manifest's author index gives the entries of the selected authors without a scan
+        keep = class_filter(classes)
+        return manifest.files(authors=None if keep is None else [a for a in manifest.author_index() if keep(a)])
+    elif basefolder.endswith("cpp"):
+        X_names, y, problems = get_dot_src_files(basefolder)
+    else:
         X_names, y, problems = get_ast_src_files(basefolder)
-        X ,y,tags = np.array([ast_parse_file(name) for name in tqdm(X_names)]), np.array(y), problems
+    return select_files(X_names, y, problems, classes)
+
+
+def parse_src_files(basefolder, seperate_trees=False,verbose=0,n_jobs=1,cache=False,lazy=False,flat=False,manifest=False,classes=None,dag=False):
+    """classes is a whitelist of labels or a predicate on a label, only the files of the matching
+    authors are parsed. With dag=True structurally identical subtrees of the corpus are shared, see
+    InternTable (of every tree only when lazy)."""
+    if dag and flat:
+        raise ValueError("dag and flat can't be combined, FlatTrees are arrays and share no subtrees")
+    if lazy:
+        return load_src_files(basefolder, seperate_trees, flat=flat, manifest=manifest, classes=classes, dag=dag)
+    if dag:
+        X, y, tags, nodes = parse_src_files(basefolder, seperate_trees, verbose, n_jobs, cache, manifest=manifest,
+                                            classes=classes)
+        X, table = intern_trees(X)
+        print("shared subtrees: {0} unique nodes of {1}".format(len(table), table.seen))
+        trees = np.empty(len(X), dtype=object)
+        trees[:] = X
+        return trees, y, tags, nodes
+    if is_store(basefolder):
+        return parse_store(basefolder, seperate_trees, flat=flat, classes=classes)
+    if flat:
+        X, y, tags, nodes = parse_src_files(basefolder, seperate_trees, verbose, n_jobs, cache, manifest=manifest,
+                                            classes=classes)
+        return flat_trees(X, nodes), y, tags, nodes
+    folder = archive_folder(basefolder)
+    # archives are read in place, without parse cache or manifest
+    cache_folder = basefolder if cache and not is_archive(basefolder) else None
+    manifest = get_manifest(basefolder) if manifest and not is_archive(basefolder) else None
+    if manifest is not None:
+        manifest.refresh()
+    if folder.endswith("python"):
+        X_names, y, problems = src_files(basefolder, manifest, classes)
+        X ,y,tags = np.array(parse_files(X_names, file_parser(basefolder, ast_parse_file), n_jobs=n_jobs, cache=cache_folder)), np.array(y), problems
+        if manifest is not None:
+            set_manifest_stats(manifest, X_names, X)
+            manifest.save()
         if verbose == 1:
             dump(X,y,X_names)
         return X ,y,tags,AstNodes()
-    elif basefolder.endswith("python_trees"):
-        X_names, y, problems = get_ast_src_files(basefolder)
-        X ,y,tags = np.array([parse_ast_tree(name) for name in tqdm(X_names)]), np.array(y), problems
+    elif folder.endswith("python_trees"):
+        X_names, y, problems = src_files(basefolder, manifest, classes)
+        X ,y,tags = np.array(parse_files(X_names, file_parser(basefolder, parse_ast_tree), n_jobs=n_jobs, cache=cache_folder)), np.array(y), problems
+        if manifest is not None:
+            set_manifest_stats(manifest, X_names, X)
+            manifest.save()
         return X ,y,tags,AstNodes()
-    elif basefolder.endswith("cpp"):
-        X_names, y, problems = get_dot_src_files(basefolder)
+    elif folder.endswith("cpp"):
+        X_names, y, problems = src_files(basefolder, manifest, classes)
         extend_X = []
         extend_X_names = []
         extend_y = []
-        for id,name in enumerate(tqdm(X_names)):
-            program_trees = parse_tree(name,seperate_trees)
+        parse_fn = file_parser(basefolder, parse_tree, seperate_trees=seperate_trees)
+        parsed = parse_files(X_names, parse_fn, n_jobs=n_jobs, cache=cache_folder)
+        if manifest is not None:
+            set_manifest_stats(manifest, X_names, [trees if trees is None or seperate_trees else trees[0]
+                                                   for trees in parsed])
+            manifest.save()
+        for id,program_trees in enumerate(parsed):
+            if program_trees is None:
+                continue
             extend_X.extend(program_trees)
             extend_y.extend([y[id]] * len(program_trees))
-            extend_X_names.extend([name] * len(program_trees))
+            extend_X_names.extend([X_names[id]] * len(program_trees))
         X, y, tags,X_names = np.array(extend_X), np.array(extend_y), problems,extend_X_names
         return X ,y,tags,DotNodes()
 
@@ -141,34 +503,41 @@ def unified_ast_trees(trees):
         utrees.append(convert_tree(tree))
     return utrees
 
-def make_binary_tree(trees,max_branches=10):
-    def make_binary_tree(src_tree,dst_tree,max_branches = 2):
-        childs = list(children(src_tree))
-        if len(childs) > 0:
-            dst_tree.children.extend(childs[:max_branches])
-            if len(childs)-max_branches > 0:
-                if len(childs) - max_branches == 1:
-                    dst_tree.children.append(childs[-1])
-                else:
-                    dst_node = copy.copy(dst_tree)
-                    dst_node.children = []
-                    src_node = copy.copy(dst_tree)
-                    src_node.children = childs[max_branches:]
-                    dst_tree.children.append(make_binary_tree(src_node,dst_node))
-            for idx,child in enumerate(children(dst_tree)):
-                dst_child = copy.copy(child)
-                dst_child.children = []
-                dst_tree.children[idx] = make_binary_tree(child,dst_child,max_branches)
-        return dst_tree
-    import sys
-    sys.setrecursionlimit(100000)
-    dst_trees = []
-    for idx,tree in enumerate(trees):
-        # print(idx, ", max branches=",max_branch(tree)," max depth =", max_depth(tree))
-        binary_tree = copy.copy(tree)
-        binary_tree.children = []
-        dst_trees.append(make_binary_tree(tree,binary_tree,max_branches))
-    return np.array(dst_trees)
+def binary_tree(tree, nodes, max_branches=10):
+    '''FlatTree of tree where every node keeps at most max_branches children and the rest go under
+    an extra node of the same type (split again the same way); a single extra child is kept as is.
+    The tree is walked with an explicit stack and is left untouched.'''
+    types = []
+    parents = []
+    # (source node or None for an extra node, type id, children, first child, output parent)
+    stack = [(tree, None, None, 0, -1)]
+    while stack:
+        node, type_id, kids, start, parent = stack.pop()
+        if node is not None:
+            type_id = nodes.index(node)
+            kids = children(node)
+        idx = len(types)
+        types.append(type_id)
+        parents.append(parent)
+        count = len(kids) - start
+        if count > max_branches + 1:
+            stack.append((None, type_id, kids, start + max_branches, idx))
+            count = max_branches
+        for i in range(start + count - 1, start - 1, -1):
+            stack.append((kids[i], None, None, 0, idx))
+    return FlatTree(types, parents, nodes)
+
+
+def make_binary_tree(trees, max_branches=10, nodes=None):
+    '''binary_tree of every tree, the nodes dictionary defaults to DotNodes for cpp trees'''
+    dst_trees = np.empty(len(trees), dtype=object)
+    for idx, tree in enumerate(trees):
+        if tree is None:
+            continue
+        if nodes is None:
+            nodes = DotNodes() if isinstance(tree, Node) else AstNodes()
+        dst_trees[idx] = binary_tree(tree, nodes, max_branches)
+    return dst_trees
 
 
 
@@ -5,7 +5,7 @@ import numpy as np
 from sklearn.model_selection import StratifiedKFold
 from sklearn.metrics import accuracy_score
 # from deep_ast.tree_lstm.treelstm import TreeLSTM
-from ast_tree.traverse import children
+from ast_tree.traverse import evaluate_tree
 from gscripts.graphic_presenter import plot_confusion_matrix
 from utils.dataset_utils import make_backward_graph
 from utils.prog_bar import Progbar
@@ -14,21 +14,14 @@ from sklearn.metrics import confusion_matrix
 def trainBPTT(model, train_trees, train_labels, optimizer, batch_size=5,bptt_limit=35, shuffle=True):
     curr_timesteps = 0
     def traverse(model, node,label, train_mode):
-        nonlocal curr_timesteps
-        children_ast = list(children(node))
-        if len(children_ast) == 0:
-            # leaf node
+        def leaf(x):
+            nonlocal curr_timesteps
             curr_timesteps = curr_timesteps + 1
-            return model.embed_vec(node, train_mode=train_mode)
-        else:
-            # internal node
-            children_nodes = []
-            for child in children_ast:
-                if child is not None:
-                    child_node = traverse(model,child,label, train_mode=train_mode)
-                    children_nodes.append(child_node)
-            x = model.embed_vec(node, train_mode=train_mode)
-            new_node = model.merge(x, children_nodes, train_mode=train_mode)
+            return model.embed_vec(x, train_mode=train_mode)
+
+        def merge(x, children_nodes):
+            nonlocal curr_timesteps
+            new_node = model.merge(model.embed_vec(x, train_mode=train_mode), children_nodes, train_mode=train_mode)
             curr_timesteps += 1
             if curr_timesteps >= bptt_limit:
                 loss = model.loss(new_node,label,train_mode)
@@ -37,6 +30,8 @@ def trainBPTT(model, train_trees, train_labels, optimizer, batch_size=5,bptt_lim
                 optimizer.update()
                 curr_timesteps = 0
             return new_node
+
+        return evaluate_tree(node, leaf, merge, model.schedules)
     progbar = Progbar(len(train_labels))
     batch_loss = 0
     total_loss = []
@@ -194,7 +189,7 @@ def evaluate_relax(model, test_trees, test_labels, progbar=True,batch_size=1,rel
 def validation_split_trees(trees, tree_labels, validation=0.1, test=0.1, shuffle=True):
     classes_, y = np.unique(tree_labels, return_inverse=False)
     tree_labels = y
-    indices = np.arange(trees.shape[0])
+    indices = np.arange(len(trees))
     if shuffle:
         random.shuffle(indices)
     train_samples = int((1 - validation - test) * indices.shape[0])
@@ -228,7 +223,7 @@ def split_trees(trees, tree_labels, n_folds=10, shuffle=True,seed=None,iteration
     # classes_ = np.arange(len(classes_))
     # seed = random.randint(0, 4294967295)
     cv = StratifiedKFold(n_splits=n_folds, shuffle=shuffle, random_state=seed)
-    for idx,(train_indices, test_indices) in enumerate(cv.split(trees,tree_labels)):
+    for idx,(train_indices, test_indices) in enumerate(cv.split(np.zeros(len(tree_labels)),tree_labels)):
         if idx >= iterations:
             break
     train_trees, train_lables = trees[train_indices], tree_labels[train_indices]
@@ -250,7 +245,7 @@ def pick_subsets(trees, tree_labels, labels=2,classes=[],seed=None):
         random.shuffle(labels_subset)
         labels_subset = labels_subset[:labels]
 
-    selected_indices = np.where(np.in1d(tree_labels, labels_subset))
+    selected_indices = np.where(np.in1d(tree_labels, labels_subset))[0]
     trees = trees[selected_indices]
     tree_labels = tree_labels[selected_indices]
 
@@ -0,0 +1,29 @@
+import os
+from contextlib import contextmanager
+from multiprocessing import cpu_count
+
+
+def n_processes(n_jobs):
+    '''number of processes for an n_jobs argument: None or 0 is one process, negative values count
+    back from the number of cores (-1 for all of them, -2 for all but one ...)'''
+    if n_jobs is None or n_jobs == 0:
+        return 1
+    if n_jobs < 0:
+        return max(cpu_count() + 1 + n_jobs, 1)
+    return n_jobs
+
+
+@contextmanager
+def atomic_write(path, mode="w"):
+    '''Open path + ".tmp" for writing and move it over path once the block is done, so a reader (or
+    a resumed run) never sees a partly written file. The temporary file is removed when the block
+    raises.'''
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, mode) as file:
+            yield file
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
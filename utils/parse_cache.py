@@ -0,0 +1,83 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+from functools import partial
+
+from ast_tree.tree_nodes import vocabulary_signature
+from ast_tree.tree_parser import PARSER_VERSION
+from utils.job_utils import atomic_write
+
+CACHE_EXT = ".cache"
+
+
+def file_hash(filename):
+    with open(filename, "rb") as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+
+def parser_key(parse_fn):
+    if isinstance(parse_fn, partial):
+        args = ",".join("{0}={1}".format(k, v) for k, v in sorted(parse_fn.keywords.items()))
+        return "{0}({1})".format(parse_fn.func.__name__, args)
+    return parse_fn.__name__
+
+
+class ParseCache:
+    '''Persistent cache of parsed trees stored next to a dataset folder as <basefolder>.cache.
+
+    Every parser gets its own sub folder holding one pickle per distinct file content (keyed by the
+    sha1 of the file) and an index.json mapping file names to hashes. The whole sub folder is
+    dropped when the parser or vocabulary version changes.'''
+
+    def __init__(self, basefolder, parse_fn):
+        self.basefolder = basefolder.rstrip("/\\")
+        self.path = os.path.join(self.basefolder + CACHE_EXT, parser_key(parse_fn))
+        self.index_file = os.path.join(self.path, "index.json")
+        self.versions = {"parser_version": PARSER_VERSION, "vocabulary": vocabulary_signature()}
+        self.files = {}
+        if os.path.isfile(self.index_file):
+            with open(self.index_file) as file:
+                index = json.load(file)
+            if all(index.get(k) == v for k, v in self.versions.items()):
+                self.files = index["files"]
+            else:
+                shutil.rmtree(self.path)
+        os.makedirs(self.path, exist_ok=True)
+
+    def _object_file(self, hash):
+        return os.path.join(self.path, hash + ".pkl")
+
+    def contains(self, hash):
+        return os.path.isfile(self._object_file(hash))
+
+    def get(self, hash):
+        with open(self._object_file(hash), "rb") as file:
+            return pickle.load(file)
+
+    def put(self, hash, tree):
+        '''store tree, returns False (and stores nothing) when the tree is too deep to be pickled'''
+        try:
+            with atomic_write(self._object_file(hash), "wb") as file:
+                pickle.dump(tree, file, protocol=pickle.HIGHEST_PROTOCOL)
+        except RecursionError:
+            return False
+        return True
+
+    def update(self, files):
+        '''merge files ({name: hash}) into the index and delete objects no file refers to anymore.
+        Entries of files not listed (e.g. other authors when loading a subset of the classes) are kept
+        as long as the file still exists in the dataset folder.'''
+        self.files = {name: hash for name, hash in self.files.items()
+                      if os.path.isfile(os.path.join(self.basefolder, name))}
+        self.files.update(files)
+        live = set(self.files.values())
+        for filename in os.listdir(self.path):
+            hash, ext = os.path.splitext(filename)
+            if ext == ".pkl" and hash not in live:
+                os.remove(os.path.join(self.path, filename))
+        index = dict(self.versions)
+        index["files"] = self.files
+        with atomic_write(self.index_file) as file:
+            json.dump(index, file)
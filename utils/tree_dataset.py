@@ -0,0 +1,76 @@
+from collections import OrderedDict
+from numbers import Integral
+
+import numpy as np
+
+
+class LRUCache:
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+
+    def get(self, key, load):
+        try:
+            value = self.items.pop(key)
+        except KeyError:
+            value = load(key)
+        if self.maxsize > 0:
+            self.items[key] = value
+            if len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+        return value
+
+    def clear(self):
+        self.items.clear()
+
+
+class TreeDataset:
+    '''Lazily materialized sequence of trees.
+
+    Only the keys (file names, store indices ...), labels and problems are kept in memory, a tree is built by
+    loader(key) the first time it is accessed and kept in a bounded LRU cache. Indexing with an
+    integer returns a tree, indexing with a slice, an index array or a boolean mask returns a new
+    TreeDataset view sharing the same loader and cache, so numpy style code like
+    trees[train_indices] keeps working.'''
+
+    def __init__(self, loader, keys, labels, problems=None, cache_size=1024, indices=None, cache=None):
+        self.loader = loader
+        self.keys = keys
+        self.all_labels = np.asarray(labels)
+        self.all_problems = None if problems is None else np.asarray(problems)
+        self.indices = np.arange(len(keys)) if indices is None else np.asarray(indices)
+        self.cache = cache if cache is not None else LRUCache(cache_size)
+
+    @property
+    def labels(self):
+        return self.all_labels[self.indices]
+
+    @property
+    def problems(self):
+        return None if self.all_problems is None else self.all_problems[self.indices]
+
+    @property
+    def shape(self):
+        return (len(self),)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def _load(self, index):
+        return self.loader(self.keys[index])
+
+    def tree(self, index):
+        return self.cache.get(int(index), self._load)
+
+    def __getitem__(self, item):
+        if isinstance(item, Integral):
+            return self.tree(self.indices[item])
+        if isinstance(item, tuple) and len(item) == 1:
+            # the output of np.where
+            item = item[0]
+        return TreeDataset(self.loader, self.keys, self.all_labels, self.all_problems, indices=self.indices[item],
+                           cache=self.cache)
+
+    def __iter__(self):
+        for index in self.indices:
+            yield self.tree(index)